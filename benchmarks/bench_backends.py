@@ -0,0 +1,91 @@
+"""
+Compare eager PyTorch with the exported CPU backends (export_backend.py) on
+fixture JPEGs: images/sec through the model, peak RSS of the process that
+ran it (each backend runs in its own fresh process) and how closely its
+outputs match eager PyTorch (identical classifier top-1 / detector car
+verdicts, largest confidence difference). Exports are cached in
+--export-dir, so the first run includes a one-off export.
+
+    python -m benchmarks.bench_backends --weights yolov8m.pt [--backends torch onnx openvino] [--threads 4]
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from image_inference import BACKENDS
+from benchmarks.mock_server import make_fixture_jpeg
+
+CAR_CLASS = 2
+
+def run_backend(weights, backend, paths, imgsz, batch_size, threads, export_dir, repeat):
+    # Runs in a spawned process so ru_maxrss only covers this backend
+    import torch
+    from export_backend import load_backend_model
+    from image_inference import BatchBuffer, letterbox, load_image
+
+    torch.set_num_threads(threads)
+    model = load_backend_model(weights, imgsz, backend, threads, export_dir)
+    fit = 'short' if imgsz == 224 else 'long'
+    images = [letterbox(load_image(path, imgsz, fit), imgsz, fit) for path in paths]
+    buffer = BatchBuffer(batch_size, imgsz)
+    batches = [images[i:i + batch_size] for i in range(0, len(images), batch_size)]
+
+    model(buffer.fill(batches[0]), imgsz=imgsz, device='cpu', verbose=False)  # warm-up
+    outputs = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        outputs = []
+        for batch in batches:
+            for result in model(buffer.fill(batch), imgsz=imgsz, device='cpu', verbose=False):
+                if result.probs is not None:
+                    outputs.append((result.probs.top1, float(result.probs.top1conf)))
+                else:
+                    car_boxes = result.boxes.cls == CAR_CLASS
+                    outputs.append((bool(car_boxes.any()),
+                                    result.boxes.conf[car_boxes].max().item() if car_boxes.any() else 0.0))
+    seconds = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+    return len(images) * repeat / seconds, peak_rss, outputs
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--weights', required=True, help="classifier (*-cls.pt, run at 224) or detector (run at 640)")
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=['torch', 'onnx'])
+    parser.add_argument('--images', type=int, default=64)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--export-dir', default='data/exported_models')
+    args = parser.parse_args()
+
+    imgsz = 224 if '-cls' in os.path.basename(args.weights) else 640
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for seed in range(args.images):
+            path = os.path.join(tmp, f"{seed}.jpg")
+            with open(path, 'wb') as f:
+                f.write(make_fixture_jpeg(1280, 960, seed))
+            paths.append(path)
+
+        print(f"{args.weights} at {imgsz}, {args.images} images, batch {args.batch_size}, {args.threads} threads")
+        baseline = None
+        for backend in args.backends:
+            with context.Pool(1) as pool:
+                images_per_second, peak_rss, outputs = pool.apply(
+                    run_backend, (args.weights, backend, paths, imgsz, args.batch_size, args.threads,
+                                  args.export_dir, args.repeat))
+            line = f"{backend}: {images_per_second:,.1f} images/sec, peak RSS {peak_rss:,.0f} MB"
+            if baseline is None:
+                baseline = outputs
+            else:
+                agreement = sum(a[0] == b[0] for a, b in zip(baseline, outputs)) / len(outputs)
+                max_diff = max(abs(a[1] - b[1]) for a, b in zip(baseline, outputs))
+                line += f", {agreement * 100:.1f}% identical verdicts, max confidence difference {max_diff:.2e}"
+            print(line)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Download fixture JPEGs from a local mock image server with the pooled,
+adaptive downloader in download_images.py and with the old one-request-per-
+image setup (no session), and report images/sec and MB/sec.
+
+    python -m benchmarks.bench_download_images [--images 2000] [--throttle-every 0]
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import download_images
+from throttling import AdaptiveTokenBucket
+from benchmarks.mock_server import MockAutoRiaServer
+
+def run(cars, workers, per_host, rate, max_rate, pooled):
+    if pooled:
+        stats = download_images.download_cars(iter(cars), workers, per_host, rate, max_rate)
+    else:
+        # Baseline: module-level requests.get, a new connection per image
+        start = time.time()
+        stats = {'results': {'downloaded': 0}, 'bytes': 0}
+        bucket = AdaptiveTokenBucket(rate, max_rate=rate)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for result in executor.map(lambda car: download_images.download_image(car, bucket=bucket), cars):
+                stats['results'][result.status] = stats['results'].get(result.status, 0) + 1
+                stats['bytes'] += result.size
+        stats['download_seconds'] = time.time() - start
+    return stats
+
+def report(label, stats):
+    seconds = max(stats['download_seconds'], 1e-9)
+    downloaded = stats['results'].get('downloaded', 0)
+    print(f"{label}: {downloaded / seconds:,.1f} images/sec, {stats['bytes'] / seconds / 1e6:.2f} MB/sec "
+          f"({downloaded} images in {seconds:.2f}s)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=40)
+    parser.add_argument('--per-host', type=int, default=16)
+    parser.add_argument('--rate', type=float, default=0, help="requests/sec, 0 for unlimited")
+    parser.add_argument('--max-rate', type=float, default=0)
+    parser.add_argument('--throttle-every', type=int, default=0, help="answer every Nth request with 429")
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with MockAutoRiaServer(throttle_every=args.throttle_every) as server:
+        for label, pooled in (("Unpooled requests.get", False), ("Pooled session", True)):
+            with tempfile.TemporaryDirectory() as tmp:
+                os.chdir(tmp)
+                try:
+                    cars = [{'ID': str(10000000 + i), 'ImageURL': server.image_url(10000000 + i)}
+                            for i in range(args.images)]
+                    stats = run(cars, args.workers, args.per_host, args.rate, args.max_rate, pooled)
+                finally:
+                    os.chdir(cwd)
+            report(label, stats)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Run the whole pipeline offline against the local mock auto.ria server
+(benchmarks/mock_server.py): the brand/model catalog fetch, the CarSpider
+crawl over generated listing pages, process_vehicles matching,
+download_images and the image validators. Each stage runs in its own
+fresh process inside a scratch working directory, in pipeline order, and
+reports pages/sec, items/sec or images/sec and the peak RSS of that
+process. Validators only run when their weights are in --weights-dir.
+
+Results are written as JSON (with the commit they were measured on) so
+runs can be compared across commits with --compare.
+
+    python -m benchmarks.bench_end_to_end [--pages 50] [--weights-dir .] [--compare benchmark_results/end_to_end_<sha>.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.mock_server import MockAutoRiaServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VALIDATORS = ('check_images_classify', 'check_images_detect', 'check_images_cascade')
+# Higher is better for these, lower for seconds and peak RSS
+RATE_KEYS = ('pages_per_second', 'items_per_second', 'images_per_second')
+
+def _enter_workdir(workdir):
+    # Runs first in every stage process: the scripts use paths relative to data/
+    sys.path.insert(0, ROOT)
+    os.chdir(workdir)
+    os.makedirs('data', exist_ok=True)
+
+def _peak_rss_mb():
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+def stage_catalog(workdir, base_url, options):
+    _enter_workdir(workdir)
+    import download_vehicle_data
+    start = time.perf_counter()
+    download_vehicle_data.main(['--base-url', base_url, '--data-dir', 'data', '--rate', '0'])
+    seconds = time.perf_counter() - start
+    with open(os.path.join('data', 'car_brands.json'), encoding='utf-8') as f:
+        brands = len(json.load(f))
+    model_files = sum(len(files) for _, _, files in os.walk(os.path.join('data', 'vehicle_models')))
+    return {'seconds': seconds, 'items': brands + model_files, 'items_per_second': (brands + model_files) / seconds,
+            'peak_rss_mb': _peak_rss_mb()}
+
+def stage_crawl(workdir, base_url, options):
+    _enter_workdir(workdir)
+    os.environ['SCRAPY_SETTINGS_MODULE'] = 'car_scraper.settings'
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+    from car_scraper.spiders.car_spider import CarSpiderSpider
+
+    class MockCarSpider(CarSpiderSpider):
+        allowed_domains = None
+        start_urls = [f"{base_url}/car/used/"]
+
+    settings = get_project_settings()
+    settings.set('ROBOTSTXT_OBEY', False)
+    settings.set('DOWNLOAD_DELAY', 0)
+    settings.set('AUTOTHROTTLE_ENABLED', False)
+    settings.set('HTTPCACHE_ENABLED', False)
+    settings.set('CARS_OUTPUT_FILE', 'data/cars.jsonl')
+    settings.set('LOG_LEVEL', 'WARNING')
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler(MockCarSpider)
+    start = time.perf_counter()
+    process.crawl(crawler)
+    process.start()
+    seconds = time.perf_counter() - start
+    pages = crawler.stats.get_value('response_received_count', 0)
+    items = crawler.stats.get_value('item_scraped_count', 0)
+    return {'seconds': seconds, 'pages': pages, 'items': items, 'pages_per_second': pages / seconds,
+            'items_per_second': items / seconds, 'peak_rss_mb': _peak_rss_mb()}
+
+def stage_enrich(workdir, base_url, options):
+    _enter_workdir(workdir)
+    import process_vehicles
+    from car_scraper.records import iter_records
+    output = os.path.join('data', 'cars_with_brands_and_models.jsonl')
+    sys.argv = ['process_vehicles.py', '--input', os.path.join('data', 'cars.jsonl'), '--output', output]
+    start = time.perf_counter()
+    process_vehicles.main()
+    seconds = time.perf_counter() - start
+    items = sum(1 for _ in iter_records(output))
+    return {'seconds': seconds, 'items': items, 'items_per_second': items / seconds, 'peak_rss_mb': _peak_rss_mb()}
+
+def stage_download(workdir, base_url, options):
+    _enter_workdir(workdir)
+    import download_images
+    from car_scraper.records import iter_records
+    from download_manifest import DownloadManifest
+    manifest = DownloadManifest(os.path.join('data', 'download_manifest.sqlite3'))
+    try:
+        stats = download_images.download_cars(iter_records(os.path.join('data', 'cars_with_brands_and_models.jsonl')),
+                                              options['download_workers'], rate=0, max_rate=0, manifest=manifest)
+    finally:
+        manifest.close()
+    seconds = max(stats['download_seconds'], 1e-9)
+    images = stats['results']['downloaded']
+    return {'seconds': seconds, 'images': images, 'images_per_second': images / seconds,
+            'mb_per_second': stats['bytes'] / seconds / 1e6, 'failed': stats['results']['failed'],
+            'peak_rss_mb': _peak_rss_mb()}
+
+def stage_validate(workdir, base_url, options, module_name):
+    _enter_workdir(workdir)
+    import contextlib
+    import io
+    module = __import__(module_name)
+    start = time.perf_counter()
+    # The validators print a line per image
+    with contextlib.redirect_stdout(io.StringIO()):
+        valid, invalid = module.process_images('data/pictures', batch_size=options['batch_size'],
+                                               decode_workers=options['decode_workers'], device='cpu')
+    seconds = time.perf_counter() - start
+    images = valid + invalid
+    return {'seconds': seconds, 'images': images, 'images_per_second': images / seconds, 'valid': valid,
+            'peak_rss_mb': _peak_rss_mb()}
+
+def validator_weights(module_name):
+    import ast
+    # Read the weights names without importing the validator
+    with open(os.path.join(ROOT, f"{module_name}.py"), encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    return [node.value.value for node in tree.body
+            if isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant)
+            and any(getattr(target, 'id', '') in ('WEIGHTS', 'CLASSIFIER_WEIGHTS', 'DETECTOR_WEIGHTS')
+                    for target in node.targets)]
+
+def run_stage(context, function, *args):
+    # A fresh process per stage so ru_maxrss only covers that stage
+    with context.Pool(1) as pool:
+        return pool.apply(function, args)
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def format_stage(name, result):
+    rates = [f"{result[key]:,.1f} {key.replace('_per_second', '')}/sec" for key in RATE_KEYS if key in result]
+    return f"{name}: {', '.join(rates)} ({result['seconds']:.2f}s, peak RSS {result['peak_rss_mb']:,.0f} MB)"
+
+def compare(results, baseline):
+    print(f"\nCompared with {baseline['commit']} ({baseline['timestamp']}):")
+    for name, result in results['stages'].items():
+        before = baseline['stages'].get(name)
+        if before is None:
+            continue
+        changes = []
+        for key in RATE_KEYS + ('seconds', 'peak_rss_mb'):
+            if key in result and before.get(key):
+                changes.append(f"{key} {before[key]:,.1f} -> {result[key]:,.1f} ({result[key] / before[key] - 1:+.1%})")
+        print(f"{name}: {'; '.join(changes)}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=50, help="listing pages served by the mock server")
+    parser.add_argument('--per-page', type=int, default=20, help="listings per page")
+    parser.add_argument('--weights-dir', default='.', help="directory holding the validator weights files")
+    parser.add_argument('--validators', nargs='*', choices=VALIDATORS, default=['check_images_classify',
+                                                                               'check_images_detect'])
+    parser.add_argument('--download-workers', type=int, default=16)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--decode-workers', type=int, default=2)
+    parser.add_argument('--output', default=None,
+                        help="results JSON (default benchmark_results/end_to_end_<commit>.json)")
+    parser.add_argument('--compare', default=None, help="earlier results JSON to compare against")
+    parser.add_argument('--keep-dir', default=None, help="run in this directory and keep it instead of a temp dir")
+    args = parser.parse_args()
+
+    options = {'download_workers': args.download_workers, 'batch_size': args.batch_size,
+               'decode_workers': args.decode_workers}
+    commit = git_commit()
+    results = {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'config': {'pages': args.pages, 'per_page': args.per_page, **options},
+        'stages': {},
+    }
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp, \
+            MockAutoRiaServer(listing_pages=args.pages, listings_per_page=args.per_page) as server:
+        workdir = os.path.abspath(args.keep_dir or tmp)
+        os.makedirs(workdir, exist_ok=True)
+        print(f"Mock server at {server.base_url}: {args.pages} pages x {args.per_page} listings, workdir {workdir}")
+        stages = [('catalog', stage_catalog), ('crawl', stage_crawl), ('enrich', stage_enrich),
+                  ('download', stage_download)]
+        for name, function in stages:
+            results['stages'][name] = run_stage(context, function, workdir, server.base_url, options)
+            print(format_stage(name, results['stages'][name]))
+
+        for module_name in args.validators:
+            weights = validator_weights(module_name)
+            missing = [w for w in weights if not os.path.isfile(os.path.join(args.weights_dir, w))]
+            if missing:
+                print(f"{module_name}: skipped, {', '.join(missing)} not in {args.weights_dir}")
+                continue
+            for w in weights:
+                link = os.path.join(workdir, w)
+                if not os.path.exists(link):
+                    os.symlink(os.path.abspath(os.path.join(args.weights_dir, w)), link)
+            results['stages'][module_name] = run_stage(context, stage_validate, workdir, server.base_url, options,
+                                                       module_name)
+            print(format_stage(module_name, results['stages'][module_name]))
+
+    output = args.output or os.path.join('benchmark_results', f"end_to_end_{commit}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+if __name__ == "__main__":
+    main()
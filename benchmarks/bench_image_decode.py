@@ -0,0 +1,84 @@
+"""
+Compare the old full-resolution decode (cv2.imread + resize) with the
+reduced-DCT-scale decode in image_inference.load_image on fixture JPEGs,
+for the classifier (224, short side) and detector (640, long side) sizes.
+Reports decode+resize time per image and how close the outputs are (PSNR
+against the full decode); with --cls-weights/--det-weights also how often
+the model's predictions are identical on both inputs.
+
+    python -m benchmarks.bench_image_decode [--images 200] [--cls-weights yolov8m-cls.pt] [--det-weights yolov8m.pt]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from image_inference import BatchBuffer, letterbox, load_image
+from benchmarks.mock_server import make_fixture_jpeg
+
+def legacy_load_image(image_path, imgsz, fit='long'):
+    # load_image before reduced decoding: full-size imread, then INTER_AREA
+    img = cv2.imread(image_path)
+    height, width = img.shape[:2]
+    side = min(height, width) if fit == 'short' else max(height, width)
+    if side > imgsz:
+        scale = imgsz / side
+        img = cv2.resize(img, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+    return img
+
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float32) - b.astype(np.float32)) ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+def time_loader(loader, paths, imgsz, fit, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        images = [letterbox(loader(path, imgsz, fit), imgsz, fit) for path in paths]
+    return (time.perf_counter() - start) / (repeat * len(paths)), images
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=100)
+    parser.add_argument('--width', type=int, default=1280, help="fixture width (riastatic 'hd' is 1280x960)")
+    parser.add_argument('--height', type=int, default=960)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--cls-weights', default=None, help="classifier to compare top-1 predictions with")
+    parser.add_argument('--det-weights', default=None, help="detector to compare detected classes with")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for seed in range(args.images):
+            path = os.path.join(tmp, f"{seed}.jpg")
+            with open(path, 'wb') as f:
+                f.write(make_fixture_jpeg(args.width, args.height, seed))
+            paths.append(path)
+
+        for label, imgsz, fit, weights in (("classifier", 224, 'short', args.cls_weights),
+                                           ("detector", 640, 'long', args.det_weights)):
+            legacy_seconds, legacy_images = time_loader(legacy_load_image, paths, imgsz, fit, args.repeat)
+            reduced_seconds, reduced_images = time_loader(load_image, paths, imgsz, fit, args.repeat)
+            quality = np.mean([psnr(a, b) for a, b in zip(legacy_images, reduced_images)])
+            print(f"{label} ({imgsz}, fit={fit}): full decode {legacy_seconds * 1000:.2f} ms/image, "
+                  f"reduced decode {reduced_seconds * 1000:.2f} ms/image, "
+                  f"speedup {legacy_seconds / reduced_seconds:.2f}x, mean PSNR {quality:.1f} dB")
+
+            if weights:
+                from ultralytics import YOLO
+                model = YOLO(weights)
+                buffer = BatchBuffer(len(paths), imgsz)
+                legacy_results = model(buffer.fill(legacy_images).clone(), imgsz=imgsz, verbose=False)
+                reduced_results = model(buffer.fill(reduced_images), imgsz=imgsz, verbose=False)
+                if legacy_results[0].probs is not None:
+                    verdicts = [(a.probs.top1, b.probs.top1) for a, b in zip(legacy_results, reduced_results)]
+                else:
+                    verdicts = [(sorted(a.boxes.cls.tolist()), sorted(b.boxes.cls.tolist()))
+                                for a, b in zip(legacy_results, reduced_results)]
+                agreement = sum(a == b for a, b in verdicts) / len(verdicts)
+                print(f"  {weights}: {agreement * 100:.1f}% identical predictions")
+
+if __name__ == "__main__":
+    main()
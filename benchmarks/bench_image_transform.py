@@ -0,0 +1,74 @@
+"""
+Measure the post-download transform (image_transform.py) on fixture
+'hd' JPEGs for a few max edge / format / quality settings: bytes saved,
+transform time per image, and the validators' decode time (load_image +
+letterbox at 224 short side and 640 long side) on the transformed files
+compared with the originals, with the PSNR of the model input against
+the one decoded from the original.
+
+    python -m benchmarks.bench_image_transform [--images 100] [--max-edges 1024 800 640] [--formats jpeg webp]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from image_inference import load_image
+from image_transform import FORMATS, transform_file
+from benchmarks.bench_image_decode import psnr, time_loader
+from benchmarks.mock_server import make_fixture_jpeg
+
+INPUTS = (("classifier", 224, 'short'), ("detector", 640, 'long'))
+
+def write_fixtures(directory, count, width, height):
+    paths = []
+    for seed in range(count):
+        path = os.path.join(directory, f"{seed}.jpg")
+        with open(path, 'wb') as f:
+            f.write(make_fixture_jpeg(width, height, seed, quality=90))
+        paths.append(path)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=100)
+    parser.add_argument('--width', type=int, default=1280, help="fixture width (riastatic 'hd' is 1280x960)")
+    parser.add_argument('--height', type=int, default=960)
+    parser.add_argument('--max-edges', type=int, nargs='+', default=[1024, 960, 800, 640])
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=list(FORMATS))
+    parser.add_argument('--quality', type=int, default=85)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        originals = write_fixtures(tmp, args.images, args.width, args.height)
+        original_bytes = sum(os.path.getsize(path) for path in originals)
+        baseline = {label: time_loader(load_image, originals, imgsz, fit, args.repeat)
+                    for label, imgsz, fit in INPUTS}
+        print(f"{args.images} images {args.width}x{args.height}, {original_bytes / args.images / 1e3:.1f} KB/image; "
+              + ", ".join(f"{label} decode {seconds * 1000:.2f} ms/image" for label, (seconds, _) in baseline.items()))
+
+        for image_format in args.formats:
+            for max_edge in args.max_edges:
+                directory = os.path.join(tmp, f"{image_format}_{max_edge}")
+                os.makedirs(directory)
+                paths = [shutil.copy(path, directory) for path in originals]
+                start = time.perf_counter()
+                after = sum(transform_file(path, max_edge, image_format, args.quality, root_dir=directory)[1]
+                            for path in paths)
+                transform_ms = (time.perf_counter() - start) / len(paths) * 1000
+                line = (f"{image_format} q{args.quality} max edge {max_edge}: {after / len(paths) / 1e3:.1f} KB/image "
+                        f"({1 - after / original_bytes:.1%} saved), transform {transform_ms:.2f} ms/image")
+                for label, imgsz, fit in INPUTS:
+                    seconds, images = time_loader(load_image, paths, imgsz, fit, args.repeat)
+                    base_seconds, base_images = baseline[label]
+                    quality = np.mean([psnr(a, b) for a, b in zip(base_images, images)])
+                    line += (f"; {label} decode {seconds * 1000:.2f} ms ({seconds / base_seconds - 1:+.0%}), "
+                             f"PSNR {quality:.1f} dB")
+                print(line)
+
+if __name__ == "__main__":
+    main()
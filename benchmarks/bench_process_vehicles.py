@@ -0,0 +1,119 @@
+"""
+Compare the legacy per-car brand/model matching in process_vehicles.py with
+VehicleMatcher. Uses data/cars.json and data/car_brands.json when present,
+otherwise a synthetic catalog is generated in a temporary directory.
+
+    python -m benchmarks.bench_process_vehicles [--cars 50000]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+import process_vehicles
+from process_vehicles import VehicleMatcher, find_matching_brand, find_matching_model, load_json, sanitize_filename
+
+BRAND_WORDS = ['Alfa', 'Aston', 'Land', 'Great', 'Rolls', 'Mercedes', 'Daewoo', 'Skoda', 'Chery', 'Geely',
+               'Tesla', 'Volvo', 'Ford', 'Opel', 'Mazda', 'Honda', 'Nissan', 'Kia', 'Lada', 'Zaz']
+MODEL_WORDS = ['Sprinter', 'Octavia', 'Camry', 'Focus', 'Astra', 'Model', 'Sportage', 'Civic', 'Leaf', 'Golf',
+               'Passat', 'Vivaro', 'X5', 'A6', 'Tiguan', 'Transit', 'Caddy', 'Sens', 'Lanos', 'Vesta']
+
+def build_synthetic_catalog(directory, brand_count=400, models_per_brand=40, seed=1):
+    rng = random.Random(seed)
+    models_dir = os.path.join(directory, 'vehicle_models')
+    os.makedirs(models_dir, exist_ok=True)
+    brands = {}
+    while len(brands) < brand_count:
+        words = rng.sample(BRAND_WORDS, rng.choice([1, 1, 1, 2]))
+        name = ' '.join(words) + ('' if len(brands) < len(BRAND_WORDS) else f"{len(brands)}")
+        brands[name] = {"value": len(brands) + 1, "categories": ["passenger_car"]}
+
+    for brand_name in brands:
+        models = [{"name": ' '.join(rng.sample(MODEL_WORDS, rng.choice([1, 2]))) + f" {i}", "value": i}
+                  for i in range(models_per_brand)]
+        for category in VehicleMatcher.CATEGORIES:
+            path = os.path.join(models_dir, f"{sanitize_filename(brand_name)}_{category}_models.json")
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(models if category == 'passenger_car' else models[:5], f, ensure_ascii=False)
+
+    brands_file = os.path.join(directory, 'car_brands.json')
+    with open(brands_file, 'w', encoding='utf-8') as f:
+        json.dump(brands, f, ensure_ascii=False)
+    return brands_file, models_dir
+
+def build_synthetic_titles(brands, models_dir, count, seed=2):
+    rng = random.Random(seed)
+    names = list(brands)
+    titles = []
+    for _ in range(count):
+        brand_name = rng.choice(names)
+        path = os.path.join(models_dir, f"{sanitize_filename(brand_name)}_passenger_car_models.json")
+        model = rng.choice(load_json(path))['name']
+        title = f"{brand_name} {model} {rng.choice(['1.6', '2.0 TDI', 'AT', ''])} {rng.randint(1995, 2024)}"
+        if rng.random() < 0.05:
+            title = f"Unknown {rng.choice(MODEL_WORDS)} {rng.randint(1995, 2024)}"
+        titles.append(title)
+    return titles
+
+def legacy_match(title, brands, models_dir):
+    matching_brand, _ = find_matching_brand(title, brands)
+    if not matching_brand:
+        return None, None, None
+    for category in VehicleMatcher.CATEGORIES:
+        brand_models_file = os.path.join(models_dir, f"{sanitize_filename(matching_brand)}_{category}_models.json")
+        if os.path.exists(brand_models_file):
+            brand_models = load_json(brand_models_file)
+            if brand_models:
+                matching_model = find_matching_model(title, brand_models)
+                if matching_model:
+                    return matching_brand, matching_model['name'], category
+    return matching_brand, None, None
+
+def indexed_match(title, matcher):
+    matching_brand, _ = matcher.find_brand(title)
+    if not matching_brand:
+        return None, None, None
+    matching_model, category = matcher.find_model(title, matching_brand)
+    return matching_brand, matching_model['name'] if matching_model else None, category
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cars', type=int, default=20000, help="number of titles to match")
+    parser.add_argument('--legacy-cars', type=int, default=2000, help="titles to run through the slow legacy path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if os.path.exists('data/car_brands.json') and os.path.exists('data/cars.json'):
+            brands_file, models_dir = 'data/car_brands.json', 'data/vehicle_models'
+            brands = load_json(brands_file)
+            titles = [car['Title'] for car in load_json('data/cars.json') if car.get('Title')][:args.cars]
+        else:
+            brands_file, models_dir = build_synthetic_catalog(tmp)
+            brands = load_json(brands_file)
+            titles = build_synthetic_titles(brands, models_dir, args.cars)
+
+        process_vehicles.logging.disable(process_vehicles.logging.CRITICAL)
+
+        legacy_titles = titles[:args.legacy_cars]
+        start = time.perf_counter()
+        legacy_results = [legacy_match(title, brands, models_dir) for title in legacy_titles]
+        legacy_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        matcher = VehicleMatcher(brands, models_dir)
+        indexed_results = [indexed_match(title, matcher) for title in titles]
+        indexed_elapsed = time.perf_counter() - start
+
+        mismatches = sum(1 for a, b in zip(legacy_results, indexed_results) if a != b)
+        legacy_rate = len(legacy_titles) / legacy_elapsed
+        indexed_rate = len(titles) / indexed_elapsed
+        print(f"Brands: {len(brands)}, titles: {len(titles)}")
+        print(f"Legacy matcher:  {legacy_rate:,.0f} cars/sec ({len(legacy_titles)} cars)")
+        print(f"Indexed matcher: {indexed_rate:,.0f} cars/sec ({len(titles)} cars, index build included)")
+        print(f"Speedup: {indexed_rate / legacy_rate:.1f}x")
+        print(f"Mismatches against legacy results: {mismatches}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Parse the saved listing pages in benchmarks/fixtures/listing_pages with
+CarSpiderSpider.parse and with the previous selector-per-field extraction,
+check that both produce the same CarItem fields and report items/sec.
+
+    python -m benchmarks.bench_spider_parse [--rounds 50]
+"""
+import argparse
+import glob
+import os
+import time
+
+from scrapy.http import HtmlResponse, Request
+
+from car_scraper.items import CarItem
+from car_scraper.spiders.car_spider import CarSpiderSpider
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures', 'listing_pages')
+
+def legacy_parse(response):
+    # Reference copy of the original CarSpiderSpider.parse item extraction
+    for content in response.xpath('//section[contains(@class, "ticket-item")]'):
+        car = CarItem()
+
+        data_div = content.xpath('.//div[@data-advertisement-data]')
+        car['ID'] = data_div.xpath('@data-id').get('')
+        car['URL'] = 'https://auto.ria.com' + data_div.xpath('@data-link-to-view').get('')
+        car['Brand'] = data_div.xpath('@data-mark-name').get('')
+        car['Model'] = data_div.xpath('@data-model-name').get('')
+        car['Year'] = data_div.xpath('@data-year').get('')
+
+        car['Title'] = content.css('span.blue.bold::text').get('').strip()
+        car['Price'] = content.css('span.bold.size22.green::text').get('').replace(" ", "")
+        car['Mileage'] = content.css('li.item-char.js-race::text').get('').replace(' тис. км', '000').strip()
+
+        location = content.xpath('.//li[contains(@class, "js-location")]/i[@class="icon-location"]/following-sibling::text()').get()
+        car['Location'] = location.strip() if location else None
+
+        fuel_type_nodes = content.xpath('.//li[i[contains(@class, "icon-fuel") or contains(@class, "icon-battery")]]/text()').extract()
+        fuel_type = next((node.strip() for node in fuel_type_nodes if node.strip()), None)
+        if fuel_type:
+            if ',' in fuel_type:
+                fuel_parts = fuel_type.split(',')
+                car['FuelType'] = fuel_parts[0].strip()
+                car['EngineVolume'] = fuel_parts[1].strip() if len(fuel_parts) > 1 else None
+            else:
+                car['FuelType'] = fuel_type
+                car['EngineVolume'] = None
+        else:
+            car['FuelType'] = None
+            car['EngineVolume'] = None
+
+        generation_text = ' '.join(text.strip() for text in content.css('div.generation ::text').getall() if text.strip())
+        if generation_text:
+            parts = generation_text.split(' • ')
+            car['Generation'] = parts[0] if parts else None
+            car['Trim'] = parts[-1] if len(parts) > 1 else None
+            car['EnginePowertrain'] = ' • '.join(parts[1:-1]) if len(parts) > 2 else None
+        else:
+            car['Generation'] = None
+            car['EnginePowertrain'] = None
+            car['Trim'] = None
+
+        gearbox_nodes = content.xpath('.//li[i[contains(@class, "icon-akp") or contains(@class, "icon-transmission")]]/text()').extract()
+        car['Gearbox'] = next((node.strip() for node in gearbox_nodes if node.strip()), None)
+
+        car['ImageURL'] = content.css('picture img::attr(src)').get()
+        yield car
+
+def load_pages():
+    pages = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, '*.html'))):
+        with open(path, 'rb') as f:
+            body = f.read()
+        url = 'https://auto.ria.com/car/used/'
+        pages.append((url, body))
+    return pages
+
+def make_response(url, body):
+    # A fresh response per round so cached selectors don't skew the timings
+    return HtmlResponse(url=url, body=body, encoding='utf-8', request=Request(url))
+
+def run(parse, pages, rounds):
+    items = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for url, body in pages:
+            for result in parse(make_response(url, body)):
+                if isinstance(result, CarItem):
+                    items += 1
+    return items, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=50, help="times to parse every fixture page")
+    args = parser.parse_args()
+
+    pages = load_pages()
+    spider = CarSpiderSpider()
+
+    mismatches = 0
+    for url, body in pages:
+        new_items = [dict(r) for r in spider.parse(make_response(url, body)) if isinstance(r, CarItem)]
+        old_items = [dict(r) for r in legacy_parse(make_response(url, body))]
+        mismatches += sum(1 for a, b in zip(new_items, old_items) if a != b) + abs(len(new_items) - len(old_items))
+
+    legacy_items, legacy_elapsed = run(legacy_parse, pages, args.rounds)
+    items, elapsed = run(spider.parse, pages, args.rounds)
+
+    print(f"Fixture pages: {len(pages)}, rounds: {args.rounds}")
+    print(f"Legacy selectors:   {legacy_items / legacy_elapsed:,.0f} items/sec")
+    print(f"Compiled selectors: {items / elapsed:,.0f} items/sec")
+    print(f"Speedup: {(items / elapsed) / (legacy_items / legacy_elapsed):.2f}x")
+    print(f"Items differing from legacy extraction: {mismatches}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Time importing each image validator module in a fresh interpreter, and
+the first model load that used to happen as part of that import. "before"
+is import + model load (what `import check_images_detect` cost when the
+module built YOLO(WEIGHTS) at import time), "after" is the import alone.
+Also lists which heavy packages the import pulled in. Run it from the
+directory holding the weights files; modules whose weights aren't there
+only get the import timed (ultralytics would try to download them).
+
+    python -m benchmarks.bench_validator_import [--modules check_images_detect ...] [--repeat 3]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+MODULES = ('check_images_classify', 'check_images_detect', 'check_images_cascade', 'validation_results',
+           'reset_detection_state')
+HEAVY = ('torch', 'ultralytics', 'cv2', 'onnxruntime')
+
+PROBE = """
+import json, os, sys, time
+start = time.perf_counter()
+module = __import__({module!r})
+imported = time.perf_counter() - start
+loaded = [name for name in {heavy!r} if name in sys.modules]
+weights = [w for w in (getattr(module, name, None) for name in ('WEIGHTS', 'CLASSIFIER_WEIGHTS', 'DETECTOR_WEIGHTS'))
+           if w and os.path.isfile(w)]
+load_seconds = None
+if weights:
+    from image_inference import load_model
+    start = time.perf_counter()
+    for w in weights:
+        load_model(w)
+    load_seconds = time.perf_counter() - start
+print(json.dumps({{'import': imported, 'load': load_seconds, 'loaded': loaded}}))
+"""
+
+def probe(module, root):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')])))
+    output = subprocess.run([sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY)], env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modules', nargs='+', default=list(MODULES))
+    parser.add_argument('--repeat', type=int, default=3, help="fresh interpreters per module (best time is reported)")
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for module in args.modules:
+        runs = [probe(module, root) for _ in range(args.repeat)]
+        imported = min(run['import'] for run in runs)
+        line = f"{module}: import {imported:.2f}s"
+        loads = [run['load'] for run in runs if run['load'] is not None]
+        if loads:
+            line += f", first model load {min(loads):.2f}s (before: {imported + min(loads):.2f}s at import)"
+        print(f"{line}; loaded at import: {', '.join(runs[0]['loaded']) or 'none of ' + '/'.join(HEAVY)}")
+
+if __name__ == "__main__":
+    main()
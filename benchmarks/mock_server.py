@@ -0,0 +1,232 @@
+"""
+Local stand-in for auto.ria used by the offline benchmarks.
+
+Image URLs look like the real ones, `/photos/<slug>__<photo id><variant>.jpg`,
+where variant is `hd` (full size) or `f` (small). Photo ids divisible by
+`missing_hd_every` answer 500 for `hd` so the `f` fallback is exercised.
+
+With listing_pages > 0 it also serves `/car/used/?page=N`: generated
+listing pages with `ticket-item` sections and `js-next` pagination whose
+photos point back at this server, and the brand/model catalog endpoints
+download_vehicle_data.py reads (with ETags, so --refresh gets 304s).
+"""
+import hashlib
+import html
+import io
+import json
+import random
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+IMAGE_PATH_RE = re.compile(r'^/photos/[\w-]+__(\d+)(hd|f)\.jpg$')
+LISTING_PATH = '/car/used/'
+BRANDS_PATH_RE = re.compile(r'^/demo/api/categories/(\d+)/brands/_active/_with_count/_with_country$')
+MODELS_PATH_RE = re.compile(r'^/api/categories/(\d+)/marks/(\d+)/models/_active/_with_count$')
+
+# category id -> {brand: (marka id, [models])}, a small slice of the real catalog
+CATALOG = {
+    1: {
+        'Toyota': (79, ['Camry', 'Corolla', 'RAV4', 'Land Cruiser Prado']),
+        'BMW': (9, ['X5', '320', '520', 'X3']),
+        'Volkswagen': (84, ['Passat B8', 'Golf', 'Tiguan', 'Touareg']),
+        'Skoda': (70, ['Octavia', 'Fabia', 'Superb', 'Kodiaq']),
+        'Renault': (62, ['Megane', 'Logan', 'Duster', 'Kangoo']),
+        'Mercedes-Benz': (48, ['E 220', 'C 200', 'GLE 350', 'Vito']),
+        'Hyundai': (29, ['Tucson', 'Sonata', 'Elantra', 'Santa FE']),
+        'Nissan': (55, ['Leaf', 'Qashqai', 'X-Trail', 'Juke']),
+    },
+    7: {
+        'Mercedes-Benz': (48, ['Sprinter', 'Tourismo']),
+        'Volkswagen': (84, ['Crafter', 'Transporter']),
+    },
+}
+FUELS = ('Бензин', 'Дизель', 'Газ / Бензин', 'Електро')
+GEARBOXES = ('Ручна / Механіка', 'Автомат')
+CITIES = ('Київ', 'Львів', 'Одеса', 'Харків', 'Дніпро (Дніпропетровськ)')
+
+def listing_ticket(listing_id, image_url):
+    """
+    One `section.ticket-item` in the markup CarSpiderSpider parses, with
+    fields derived deterministically from the listing id.
+    """
+    rng = random.Random(listing_id)
+    brand = rng.choice(sorted(CATALOG[1]))
+    model = rng.choice(CATALOG[1][brand][1])
+    year = rng.randint(2000, 2024)
+    link = f"/auto_{brand.lower()}_{model.lower().replace(' ', '_')}_{listing_id}.html"
+    title = html.escape(f"{brand} {model}")
+    fuel = rng.choice(FUELS)
+    return f"""<section class="ticket-item ">
+  <div class="hide" data-advertisement-data="" data-id="{listing_id}" data-link-to-view="{link}" data-mark-name="{html.escape(brand)}" data-model-name="{html.escape(model)}" data-year="{year}"></div>
+  <div class="ticket-photo loaded"><a class="m-link-ticket" href="{link}"><picture><img src="{image_url}" title="{title} {year}" alt="{title}" width="290" height="192"></picture></a></div>
+  <div class="content-bar">
+    <div class="content">
+      <div class="head-ticket"><div class="item ticket-title"><a class="address" href="{link}" title="{title} {year}"><span class="blue bold">{title} </span> {year}</a></div></div>
+      <div class="price-ticket" data-main-currency="USD"><span class="bold size22 green" data-currency="USD">{rng.randint(3, 90)} {rng.randint(0, 999):03d}</span> <span data-currency="USD">$</span></div>
+      <div class="definition-data">
+        <div class="generation"><span>{year - rng.randint(0, 5)} - {year}</span></div>
+        <ul class="unstyle characteristic">
+          <li class="item-char js-race"><i class="icon-mileage" title="Пробіг"></i> {rng.randint(1, 400)} тис. км</li>
+          <li class="item-char view-location js-location"><i class="icon-location"></i> {rng.choice(CITIES)} <span class="grey size13">( від )</span></li>
+          <li class="item-char"><i class="{'icon-battery' if fuel == 'Електро' else 'icon-fuel'}" title="Тип палива"></i> {fuel}{'' if fuel == 'Електро' else f', {rng.choice(["1.4", "1.6", "2.0", "3.0"])} л.'}</li>
+          <li class="item-char"><i class="icon-akp" title="Тип коробки передач"></i> {rng.choice(GEARBOXES)}</li>
+        </ul>
+      </div>
+    </div>
+  </div>
+</section>
+"""
+
+def listing_page(page, total_pages, per_page, image_url):
+    first_id = 30000000 + (page - 1) * per_page
+    tickets = ''.join(listing_ticket(listing_id, image_url(listing_id))
+                      for listing_id in range(first_id, first_id + per_page))
+    pager = f'<span class="page-item"><a class="page-link" href="{LISTING_PATH}?page={max(page - 1, 1)}">Попередня</a></span>'
+    if page < total_pages:
+        pager += f'<span class="page-item"><a class="page-link js-next " href="{LISTING_PATH}?page={page + 1}">Наступна</a></span>'
+    return (f'<!DOCTYPE html>\n<html lang="uk">\n<head><meta charset="utf-8"><title>Вживані авто — AUTO.RIA</title></head>\n'
+            f'<body>\n<div id="searchResults" class="standart-view">\n{tickets}</div>\n'
+            f'<div class="pager">{pager}</div>\n</body>\n</html>\n')
+
+def catalog_brands(category):
+    return [{'name': name, 'value': value, 'count': len(models) * 100}
+            for name, (value, models) in sorted(CATALOG.get(category, {}).items())]
+
+def catalog_models(category, marka_id):
+    for value, models in CATALOG.get(category, {}).values():
+        if value == marka_id:
+            return [{'name': name, 'value': marka_id * 1000 + position, 'count': 10}
+                    for position, name in enumerate(models)]
+    return []
+
+def make_fixture_jpeg(width, height, seed=0, quality=85):
+    """
+    Synthetic photo-like JPEG (smooth gradients plus a few shapes and noise),
+    so compressed sizes are close to real listing photos.
+    """
+    from PIL import Image, ImageDraw, ImageFilter
+
+    rng = random.Random(seed)
+    image = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1, y1 = x0 + rng.randrange(width // 2), y0 + rng.randrange(height // 2)
+        draw.rectangle((x0, y0, x1, y1), fill=tuple(rng.randrange(256) for _ in range(3)))
+    image = image.filter(ImageFilter.GaussianBlur(2))
+    noise = Image.effect_noise((width, height), 24).convert('RGB')
+    image = Image.blend(image, noise, 0.15)
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+def make_fixture_images(count=4):
+    """
+    {'hd': [jpeg bytes, ...], 'f': [...]} with hd and f variants in the
+    sizes riastatic serves.
+    """
+    return {
+        'hd': [make_fixture_jpeg(1280, 960, seed) for seed in range(count)],
+        'f': [make_fixture_jpeg(620, 465, seed) for seed in range(count)],
+    }
+
+class MockAutoRiaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, body, content_type, status=200, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_status(self, status, headers=None):
+        self.send_body(b'', 'text/plain', status, headers)
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+        if server.throttle_every and server.request_count % server.throttle_every == 0:
+            return self.send_status(429, {'Retry-After': '0'})
+
+        match = IMAGE_PATH_RE.match(self.path)
+        if match:
+            return self.handle_image(int(match.group(1)), match.group(2))
+        url = urlsplit(self.path)
+        if server.listing_pages and url.path == LISTING_PATH:
+            page = int(parse_qs(url.query).get('page', ['1'])[0])
+            if not 1 <= page <= server.listing_pages:
+                return self.send_status(404)
+            body = listing_page(page, server.listing_pages, server.listings_per_page, server.image_url)
+            return self.send_body(body.encode('utf-8'), 'text/html; charset=utf-8')
+        match = BRANDS_PATH_RE.match(url.path)
+        if match:
+            return self.send_json(catalog_brands(int(match.group(1))))
+        match = MODELS_PATH_RE.match(url.path)
+        if match:
+            return self.send_json(catalog_models(int(match.group(1)), int(match.group(2))))
+        self.send_status(404)
+
+    def send_json(self, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        if self.headers.get('If-None-Match') == etag:
+            return self.send_status(304, {'ETag': etag})
+        self.send_body(body, 'application/json', headers={'ETag': etag})
+
+    def handle_image(self, photo_id, variant):
+        server = self.server
+        if variant == 'hd' and server.missing_hd_every and photo_id % server.missing_hd_every == 0:
+            return self.send_status(500)
+        images = server.images[variant]
+        self.send_body(images[photo_id % len(images)], 'image/jpeg')
+
+class MockAutoRiaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), images=None, missing_hd_every=10, throttle_every=0,
+                 listing_pages=0, listings_per_page=20):
+        super().__init__(address, MockAutoRiaHandler)
+        self.images = images or make_fixture_images()
+        self.missing_hd_every = missing_hd_every
+        self.throttle_every = throttle_every
+        self.listing_pages = listing_pages
+        self.listings_per_page = listings_per_page
+        self.request_count = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def image_url(self, photo_id, slug='toyota_camry'):
+        return f"{self.base_url}/photos/{slug}__{photo_id}f.jpg"
+
+    @property
+    def listing_url(self):
+        return f"{self.base_url}{LISTING_PATH}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,239 @@
+import bisect
+import json
+import logging
+import os
+import tempfile
+import time
+
+from scrapy import Request, signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+logger = logging.getLogger(__name__)
+
+# Millisecond bucket bounds: 0.25 ms doubling up to ~2 minutes
+MS_BOUNDS = [0.25 * 2 ** i for i in range(20)]
+ITEMS_PER_PAGE_BOUNDS = [0, 1, 2, 5, 10, 15, 20, 25, 30, 40, 50, 75, 100]
+
+class Histogram:
+    """
+    Fixed-bucket histogram: observe() is a bisect and two additions, so it
+    is cheap enough to call for every response. Percentiles are reported
+    as the upper bound of the bucket they fall in (capped at the max).
+    """
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+        threshold = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= threshold:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+            'buckets': {f"le_{bound:g}": count for bound, count in zip(self.bounds, self.counts) if count},
+        }
+
+class CrawlMetrics:
+    """
+    Crawl observability: histograms of download latency, parse callback
+    time (ParseTimingMiddleware), CarScraperPipeline write time and items
+    per page, plus pages/items per second, response status and retry
+    counts. A snapshot is written to METRICS_FILE every METRICS_INTERVAL
+    seconds and when the spider closes; the main figures are also copied
+    into the crawl stats.
+    """
+
+    def __init__(self, crawler, path, interval):
+        self.crawler = crawler
+        self.path = path
+        self.interval = interval
+        self.histograms = {
+            'download_latency_ms': Histogram(MS_BOUNDS),
+            'parse_ms': Histogram(MS_BOUNDS),
+            'pipeline_write_ms': Histogram(MS_BOUNDS),
+            'items_per_page': Histogram(ITEMS_PER_PAGE_BOUNDS),
+        }
+        self.statuses = {}
+        self.pages = 0
+        self.items = 0
+        self.start_time = None
+        self.last_export = None
+        self.task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('METRICS_ENABLED'):
+            raise NotConfigured
+        extension = cls(crawler, settings.get('METRICS_FILE', 'data/crawl_metrics.json'),
+                        settings.getfloat('METRICS_INTERVAL', 30.0))
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(extension.response_received, signal=signals.response_received)
+        crawler.signals.connect(extension.item_scraped, signal=signals.item_scraped)
+        return extension
+
+    def observe(self, name, value):
+        self.histograms[name].observe(value)
+
+    def spider_opened(self, spider):
+        self.start_time = time.time()
+        self.last_export = (self.start_time, 0, 0)
+        if self.path and self.interval > 0:
+            self.task = task.LoopingCall(self.export, spider)
+            self.task.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.start_time is None:
+            return  # the spider never opened
+        if self.task is not None and self.task.running:
+            self.task.stop()
+        snapshot = self.export(spider)
+        stats = self.crawler.stats
+        for name in ('download_latency_ms', 'parse_ms', 'pipeline_write_ms'):
+            for key in ('p50', 'p99'):
+                if snapshot['histograms'][name][key] is not None:
+                    stats.set_value(f"metrics/{name}/{key}", snapshot['histograms'][name][key])
+        stats.set_value('metrics/items_per_second', round(snapshot['items_per_second'], 2))
+
+    def response_received(self, response, request, spider):
+        self.pages += 1
+        self.statuses[response.status] = self.statuses.get(response.status, 0) + 1
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            self.histograms['download_latency_ms'].observe(latency * 1000)
+
+    def item_scraped(self, item, response, spider):
+        self.items += 1
+
+    def snapshot(self, spider):
+        now = time.time()
+        elapsed = max(now - self.start_time, 1e-9)
+        last_time, last_pages, last_items = self.last_export
+        interval = max(now - last_time, 1e-9)
+        self.last_export = (now, self.pages, self.items)
+        stats = self.crawler.stats
+        retry_reasons = {key[len('retry/reason_count/'):]: value for key, value in stats.get_stats().items()
+                         if key.startswith('retry/reason_count/')}
+        return {
+            'spider': spider.name,
+            'updated_at': now,
+            'elapsed_seconds': elapsed,
+            'pages': self.pages,
+            'items': self.items,
+            'pages_per_second': self.pages / elapsed,
+            'items_per_second': self.items / elapsed,
+            'recent_pages_per_second': (self.pages - last_pages) / interval,
+            'recent_items_per_second': (self.items - last_items) / interval,
+            'statuses': {str(status): count for status, count in sorted(self.statuses.items())},
+            'http_429': self.statuses.get(429, 0),
+            'retries': stats.get_value('retry/count', 0),
+            'retries_exhausted': stats.get_value('retry/max_reached', 0),
+            'retry_reasons': retry_reasons,
+            'histograms': {name: histogram.snapshot() for name, histogram in self.histograms.items()},
+        }
+
+    def export(self, spider):
+        snapshot = self.snapshot(spider)
+        if not self.path:
+            return snapshot
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        # Write and rename so a reader never sees a half-written file
+        fd, temp_name = tempfile.mkstemp(dir=directory, suffix='.part')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, indent=2)
+        os.replace(temp_name, self.path)
+        logger.debug(f"Crawl metrics written to {self.path}")
+        return snapshot
+
+def get_metrics(crawler):
+    """
+    The running CrawlMetrics extension, or None when it is disabled.
+    """
+    get_extension = getattr(crawler, 'get_extension', None)
+    return get_extension(CrawlMetrics) if get_extension is not None else None
+
+class ParseTimingMiddleware:
+    """
+    Spider middleware that times the spider callbacks (time spent producing
+    their output, not time spent downstream) and counts items per page
+    for CrawlMetrics. Registered closest to the spider.
+    """
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        metrics = get_metrics(crawler)
+        if metrics is None:
+            raise NotConfigured
+        return cls(metrics)
+
+    def _record(self, elapsed, items):
+        self.metrics.observe('parse_ms', elapsed * 1000)
+        self.metrics.observe('items_per_page', items)
+
+    def process_spider_output(self, response, result, spider):
+        elapsed = 0.0
+        items = 0
+        iterator = iter(result)
+        while True:
+            start = time.perf_counter()
+            try:
+                output = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - start
+                break
+            elapsed += time.perf_counter() - start
+            if not isinstance(output, Request):
+                items += 1
+            yield output
+        self._record(elapsed, items)
+
+    async def process_spider_output_async(self, response, result, spider):
+        elapsed = 0.0
+        items = 0
+        iterator = result.__aiter__()
+        while True:
+            start = time.perf_counter()
+            try:
+                output = await iterator.__anext__()
+            except StopAsyncIteration:
+                elapsed += time.perf_counter() - start
+                break
+            elapsed += time.perf_counter() - start
+            if not isinstance(output, Request):
+                items += 1
+            yield output
+        self._record(elapsed, items)
@@ -0,0 +1,72 @@
+import logging
+import time
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet import reactor, task
+
+from throttling import PAGES_ENDPOINT, SharedTokenBucket
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_STATUSES = (429, 500, 502, 503, 504)
+
+class SharedRateLimitMiddleware:
+    """
+    Downloader middleware that takes a token from the endpoint's
+    SharedTokenBucket in SHARED_RATE_LIMIT_DIR before every request, so
+    the crawl shares one request budget with download_vehicle_data.py and
+    other crawl processes on the host, and reports 429/5xx responses to
+    it (everything else counts as a success). Waiting doesn't block the
+    reactor. Registered after HttpCacheMiddleware's process_request would
+    answer from the cache, so cache hits don't spend tokens.
+    """
+
+    def __init__(self, crawler, bucket):
+        self.crawler = crawler
+        self.bucket = bucket
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        state_dir = settings.get('SHARED_RATE_LIMIT_DIR')
+        if not state_dir:
+            raise NotConfigured
+        rate = settings.getfloat('SHARED_RATE_LIMIT_RATE', 1.0)
+        bucket = SharedTokenBucket(settings.get('SHARED_RATE_LIMIT_ENDPOINT', PAGES_ENDPOINT), rate,
+                                   settings.getfloat('SHARED_RATE_LIMIT_BURST', 1.0), min(1.0, rate),
+                                   settings.getfloat('SHARED_RATE_LIMIT_MAX_RATE', rate * 4), state_dir=state_dir)
+        middleware = cls(crawler, bucket)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    async def process_request(self, request, spider=None):
+        waited = 0.0
+        while True:
+            wait_time = self.bucket.try_acquire()
+            if not wait_time:
+                break
+            waited += wait_time
+            await maybe_deferred_to_future(task.deferLater(reactor, wait_time, lambda: None))
+        if waited:
+            self.crawler.stats.inc_value('shared_rate_limit/wait_seconds', waited)
+        request.meta['shared_rate_limit_sent_at'] = time.time()
+        return None
+
+    def process_response(self, request, response, spider=None):
+        if 'cached' in response.flags:
+            return response
+        if response.status in THROTTLE_STATUSES:
+            self.bucket.on_throttle(request.meta.get('shared_rate_limit_sent_at'))
+            self.crawler.stats.inc_value('shared_rate_limit/throttled')
+            if logger.isEnabledFor(logging.DEBUG):
+                # Reading the shared rate takes the bucket's file lock
+                logger.debug("%s from %s, shared rate now %.2f/s", response.status, response.url, self.bucket.rate)
+        else:
+            self.bucket.on_success()
+        return response
+
+    def spider_closed(self, spider, reason):
+        self.crawler.stats.set_value('shared_rate_limit/final_rate', self.bucket.rate)
+        self.bucket.close()
@@ -0,0 +1,156 @@
+import gzip
+import io
+import json
+
+# Output formats understood by RecordWriter / iter_records
+JSON_ARRAY = 'json'
+JSON_LINES = 'jsonl'
+
+def detect_compression(filename):
+    if filename.endswith('.gz'):
+        return 'gzip'
+    if filename.endswith('.zst'):
+        return 'zstd'
+    return None
+
+def detect_format(filename):
+    base = filename
+    for suffix in ('.gz', '.zst'):
+        if base.endswith(suffix):
+            base = base[:-len(suffix)]
+    return JSON_LINES if base.endswith(('.jsonl', '.ndjson')) else JSON_ARRAY
+
+def open_text(filename, mode, compression=None):
+    """
+    Open filename as text, transparently (de)compressing gzip or zstd.
+    zstd needs the optional `zstandard` package.
+    """
+    if compression == 'gzip':
+        return gzip.open(filename, mode + 't', encoding='utf-8')
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("zstd compression requires the 'zstandard' package (pip install zstandard)")
+        raw = open(filename, mode + 'b')
+        if mode == 'w':
+            stream = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return io.TextIOWrapper(stream, encoding='utf-8')
+    if compression:
+        raise ValueError(f"Unknown compression: {compression}")
+    return open(filename, mode, encoding='utf-8')
+
+class RecordWriter:
+    """
+    Incrementally write dict records as a JSON array or as JSON Lines.
+    With flush_every > 0 the file is flushed every N records so readers
+    can follow a crawl that is still running.
+    """
+
+    def __init__(self, filename, fmt=None, compression=None, flush_every=0):
+        self.format = fmt or detect_format(filename)
+        if self.format not in (JSON_ARRAY, JSON_LINES):
+            raise ValueError(f"Unknown output format: {self.format}")
+        self.file = open_text(filename, 'w', compression if compression is not None else detect_compression(filename))
+        self.flush_every = flush_every
+        self.count = 0
+        if self.format == JSON_ARRAY:
+            self.file.write('[\n')
+
+    def write(self, record):
+        self.write_serialized(json.dumps(record, ensure_ascii=False))
+
+    def write_serialized(self, line):
+        # `line` is one record already encoded as compact JSON
+        if self.format == JSON_LINES:
+            self.file.write(line + '\n')
+        else:
+            self.file.write((',\n' if self.count else '') + line)
+        self.count += 1
+        if self.flush_every and self.count % self.flush_every == 0:
+            self.file.flush()
+
+    def close(self):
+        if self.format == JSON_ARRAY:
+            self.file.write('\n]')
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _iter_json_array(f, chunk_size=1 << 16):
+    # Decode one array element at a time instead of json.load on the whole file
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if not started and position < len(buffer):
+            if buffer[position] != '[':
+                raise ValueError("Expected a JSON array")
+            started = True
+            position += 1
+            continue
+        if started and position < len(buffer) and buffer[position] == ']':
+            return
+        if position < len(buffer):
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # A number at the end of the buffer may still be incomplete
+                if end < len(buffer) or eof:
+                    yield record
+                    position = end
+                    continue
+        if eof:
+            if started:
+                raise ValueError("Unterminated JSON array")
+            return
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+def iter_records(filename, fmt=None, compression=None):
+    """
+    Lazily yield records from a JSON array or JSON Lines file, optionally
+    gzip/zstd compressed, without loading the whole file into memory.
+    """
+    fmt = fmt or detect_format(filename)
+    compression = compression if compression is not None else detect_compression(filename)
+    with open_text(filename, 'r', compression) as f:
+        if fmt == JSON_LINES:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        else:
+            yield from _iter_json_array(f)
+
+def iter_serialized_records(filename, fmt=None, compression=None):
+    """
+    Like iter_records, but JSON Lines records are yielded as their raw JSON
+    text so the decoding can happen elsewhere (e.g. in worker processes).
+    JSON arrays still have to be decoded here and are yielded as dicts.
+    """
+    fmt = fmt or detect_format(filename)
+    if fmt != JSON_LINES:
+        yield from iter_records(filename, fmt, compression)
+        return
+    compression = compression if compression is not None else detect_compression(filename)
+    with open_text(filename, 'r', compression) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
@@ -0,0 +1,46 @@
+import os
+import sqlite3
+import time
+
+class SeenStore:
+    """
+    SQLite record of every listing ID the spider has seen, with its last
+    price and first/last seen times, used by the delta crawl mode.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS listings (
+                id TEXT PRIMARY KEY,
+                price TEXT,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL
+            )
+        ''')
+        self.conn.commit()
+
+    def get_prices(self, listing_ids):
+        listing_ids = list(listing_ids)
+        if not listing_ids:
+            return {}
+        placeholders = ','.join('?' * len(listing_ids))
+        return dict(self.conn.execute(f'SELECT id, price FROM listings WHERE id IN ({placeholders})', listing_ids))
+
+    def mark_seen(self, listings):
+        """
+        Upsert (id, price) pairs and bump their last_seen time.
+        """
+        now = time.time()
+        self.conn.executemany(
+            '''INSERT INTO listings (id, price, first_seen, last_seen) VALUES (?, ?, ?, ?)
+               ON CONFLICT(id) DO UPDATE SET price = excluded.price, last_seen = excluded.last_seen''',
+            [(listing_id, price, now, now) for listing_id, price in listings])
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
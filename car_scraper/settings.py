@@ -11,6 +11,55 @@ ITEM_PIPELINES = {
    "car_scraper.pipelines.CarScraperPipeline": 300,
 }
 
+# Crawl metrics (car_scraper/extensions.py): download latency, parse time,
+# pipeline write time and items/page histograms plus items/sec and
+# retry/429 counts, written to METRICS_FILE every METRICS_INTERVAL seconds
+EXTENSIONS = {
+   "car_scraper.extensions.CrawlMetrics": 500,
+}
+SPIDER_MIDDLEWARES = {
+   "car_scraper.extensions.ParseTimingMiddleware": 990,
+}
+METRICS_ENABLED = True
+METRICS_FILE = "data/crawl_metrics.json"
+METRICS_INTERVAL = 30
+
 DOWNLOAD_DELAY = 1
 # RANDOMIZE_DOWNLOAD_DELAY = True
 AUTOTHROTTLE_ENABLED = True
+
+# Shared rate limiter (car_scraper/middlewares.py): with SHARED_RATE_LIMIT_DIR
+# set, every request takes a token from the cross-process bucket for
+# SHARED_RATE_LIMIT_ENDPOINT, the same one download_vehicle_data.py
+# --shared-limiter uses, and 429/5xx responses slow all of its users down.
+# run_spider.py --shared-limiter sets it and turns DOWNLOAD_DELAY and
+# AUTOTHROTTLE off so the bucket is the only limit.
+DOWNLOADER_MIDDLEWARES = {
+   "car_scraper.middlewares.SharedRateLimitMiddleware": 950,
+}
+SHARED_RATE_LIMIT_DIR = None
+SHARED_RATE_LIMIT_ENDPOINT = "auto.ria.com"
+SHARED_RATE_LIMIT_RATE = 1.0
+SHARED_RATE_LIMIT_BURST = 1.0
+SHARED_RATE_LIMIT_MAX_RATE = 4.0
+
+# CarScraperPipeline output. Use a .jsonl path (optionally .jsonl.gz or
+# .jsonl.zst) or CARS_OUTPUT_FORMAT = "jsonl" for JSON Lines that downstream
+# scripts can stream; CARS_OUTPUT_FLUSH_ITEMS flushes every N items.
+CARS_OUTPUT_FILE = "cars.json"
+CARS_OUTPUT_FORMAT = None
+CARS_OUTPUT_COMPRESSION = None
+CARS_OUTPUT_FLUSH_ITEMS = 0
+
+# Delta crawl (scrapy crawl CarSpider -a delta=1): only new or re-priced
+# listings are emitted, and pagination stops after this many consecutive
+# pages without any (0 never stops early).
+SEEN_STORE_PATH = "data/seen_listings.sqlite3"
+DELTA_STOP_AFTER_KNOWN_PAGES = 3
+
+# Partitioned crawl (scrapy crawl CarSpider -a partitioned=1 [-a partition=i/N]
+# [-a year_ranges=2000-2009,2010-2024]): one start request per brand from
+# download_vehicle_data.py's catalog, paginated independently.
+PARTITION_BRANDS_FILE = "data/car_brands.json"
+PARTITION_URL_TEMPLATE = "https://auto.ria.com/car/{brand_slug}/"
+PARTITION_YEAR_URL_TEMPLATE = "https://auto.ria.com/car/{brand_slug}/?year[0].gte={year_from}&year[0].lte={year_to}"
@@ -1,75 +1,276 @@
+import json
+import logging
 import scrapy
 import re
+import zlib
+from lxml import etree
+from parsel import css2xpath
+from scrapy import signals
 from car_scraper.items import CarItem
+from car_scraper.seen_store import SeenStore
+
+# Selectors are compiled once and evaluated directly on each ticket's lxml
+# element instead of building parsel Selectors for every intermediate result.
+def _compile(expression):
+    return etree.XPath(expression, smart_strings=False)
+
+TICKETS_XPATH = _compile('//section[contains(@class, "ticket-item")]')
+DATA_DIVS_XPATH = _compile('.//div[@data-advertisement-data]')
+TITLE_XPATH = _compile(css2xpath('span.blue.bold::text'))
+PRICE_XPATH = _compile(css2xpath('span.bold.size22.green::text'))
+MILEAGE_XPATH = _compile(css2xpath('li.item-char.js-race::text'))
+LOCATION_XPATH = _compile('.//li[contains(@class, "js-location")]/i[@class="icon-location"]/following-sibling::text()')
+FUEL_XPATH = _compile('.//li[i[contains(@class, "icon-fuel") or contains(@class, "icon-battery")]]/text()')
+GENERATION_XPATH = _compile(css2xpath('div.generation ::text'))
+GEARBOX_XPATH = _compile('.//li[i[contains(@class, "icon-akp") or contains(@class, "icon-transmission")]]/text()')
+IMAGE_XPATH = _compile(css2xpath('picture img::attr(src)'))
+
+DATA_ATTRIBUTES = (
+    ('ID', 'data-id'),
+    ('URL', 'data-link-to-view'),
+    ('Brand', 'data-mark-name'),
+    ('Model', 'data-model-name'),
+    ('Year', 'data-year'),
+)
+
+def _first(results, default=None):
+    return results[0] if results else default
+
+def _first_stripped(nodes):
+    return next((node.strip() for node in nodes if node.strip()), None)
+
+def _as_bool(value):
+    return str(value).lower() in ('1', 'true', 'yes', 'on')
+
+def _parse_partition(value):
+    index, count = (int(part) for part in str(value).split('/'))
+    if not 0 <= index < count:
+        raise ValueError(f"Invalid partition {value}: expected i/N with 0 <= i < N")
+    return index, count
+
+def _parse_year_ranges(value):
+    # "2000-2009,2010-2015,2016-2024" -> [(2000, 2009), (2010, 2015), (2016, 2024)]
+    ranges = []
+    for part in str(value).split(','):
+        year_from, year_to = (int(year) for year in part.strip().split('-'))
+        ranges.append((year_from, year_to))
+    return ranges
+
+def brand_slug(brand_name):
+    return re.sub(r'[^\w]+', '-', brand_name.lower()).strip('-')
 
 class CarSpiderSpider(scrapy.Spider):
     name = "CarSpider"
     allowed_domains = ['auto.ria.com']
     start_urls = ["https://auto.ria.com/car/used/"]
 
-    def parse(self, response):
-        for content in response.xpath('//section[contains(@class, "ticket-item")]'):
-        # for content in response.css('div.content-bar'):
-            car = CarItem()
-            
-            # Extract data from data attributes
-            data_div = content.xpath('.//div[@data-advertisement-data]')
-            car['ID'] = data_div.xpath('@data-id').get('')
-            car['URL'] = 'https://auto.ria.com' + data_div.xpath('@data-link-to-view').get('')
-            car['Brand'] = data_div.xpath('@data-mark-name').get('')
-            car['Model'] = data_div.xpath('@data-model-name').get('')
-            car['Year'] = data_div.xpath('@data-year').get('')
-
-            # Extract other details
-            car['Title'] = content.css('span.blue.bold::text').get('').strip()
-            car['Price'] = content.css('span.bold.size22.green::text').get('').replace(" ", "")
-            car['Mileage'] = content.css('li.item-char.js-race::text').get('').replace(' тис. км', '000').strip()
-
-            # Location extraction
-            location = content.xpath('.//li[contains(@class, "js-location")]/i[@class="icon-location"]/following-sibling::text()').get()
-            car['Location'] = location.strip() if location else None
-
-            # Extract fuel type and engine volume
-            fuel_type_nodes = content.xpath('.//li[i[contains(@class, "icon-fuel") or contains(@class, "icon-battery")]]/text()').extract()
-            fuel_type = next((node.strip() for node in fuel_type_nodes if node.strip()), None)
-
-            if fuel_type:
-                if ',' in fuel_type:
-                    fuel_parts = fuel_type.split(',')
-                    car['FuelType'] = fuel_parts[0].strip()
-                    car['EngineVolume'] = fuel_parts[1].strip() if len(fuel_parts) > 1 else None
-                else:
-                    car['FuelType'] = fuel_type
-                    car['EngineVolume'] = None
-            else:
-                car['FuelType'] = None
-                car['EngineVolume'] = None
+    def __init__(self, *args, delta=False, known_pages=None, partitioned=False, partition=None, year_ranges=None,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delta = _as_bool(delta)
+        self.known_pages = int(known_pages) if known_pages is not None else None
+        # Consecutive known pages per partition ('' for the single start URL chain)
+        self.consecutive_known_pages = {}
+        self.seen_store = None
+        # ID -> Price of listings emitted this run but not yet marked seen,
+        # so filter_seen doesn't emit them again before they are stored
+        self.emitted = {}
+        # Stored listings waiting to be marked seen (see item_scraped)
+        self.pending_seen = []
+        self.partition = _parse_partition(partition) if partition else None
+        self.partitioned = _as_bool(partitioned) or self.partition is not None or bool(year_ranges)
+        self.year_ranges = _parse_year_ranges(year_ranges) if year_ranges else None
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        if spider.delta:
+            spider.seen_store = SeenStore(crawler.settings.get('SEEN_STORE_PATH', 'data/seen_listings.sqlite3'))
+            if spider.known_pages is None:
+                spider.known_pages = crawler.settings.getint('DELTA_STOP_AFTER_KNOWN_PAGES', 3)
+            crawler.signals.connect(spider.item_scraped, signal=signals.item_scraped)
+            crawler.signals.connect(spider.spider_closed, signal=signals.spider_closed)
+        return spider
+
+    async def start(self):
+        for request in self.start_requests():
+            yield request
+
+    def start_requests(self):
+        if not self.partitioned:
+            for url in self.start_urls:
+                yield scrapy.Request(url, dont_filter=True)
+            return
 
-            # Extract generation, engine powertrain, and trim
-            generation_text = ' '.join(text.strip() for text in content.css('div.generation ::text').getall() if text.strip())
-            if generation_text:
-                parts = generation_text.split(' • ')
-                car['Generation'] = parts[0] if parts else None
-                car['Trim'] = parts[-1] if len(parts) > 1 else None
-                car['EnginePowertrain'] = ' • '.join(parts[1:-1]) if len(parts) > 2 else None
+        # One pagination chain per brand (and year range); the chains are
+        # independent, so Scrapy can keep several listing requests in flight.
+        # Like the plain start URL they bypass the dupefilter, which a
+        # resumed JOBDIR has already filled with them.
+        for key, url in self.build_partitions():
+            yield scrapy.Request(url, callback=self.parse, meta={'partition': key}, dont_filter=True)
+
+    def build_partitions(self):
+        """
+        (partition key, start URL) pairs from the brands catalog written by
+        download_vehicle_data.py, limited to this host's share with -a partition=i/N.
+        """
+        settings = self.crawler.settings
+        brands_file = settings.get('PARTITION_BRANDS_FILE', 'data/car_brands.json')
+        with open(brands_file, 'r', encoding='utf-8') as f:
+            brands = json.load(f)
+        url_template = settings.get('PARTITION_URL_TEMPLATE', 'https://auto.ria.com/car/{brand_slug}/')
+        year_url_template = settings.get('PARTITION_YEAR_URL_TEMPLATE',
+                                         url_template + '?year[0].gte={year_from}&year[0].lte={year_to}')
+
+        partitions = []
+        for brand_name, brand_info in brands.items():
+            values = {'brand_slug': brand_slug(brand_name), 'brand_value': brand_info.get('value')}
+            if self.year_ranges:
+                for year_from, year_to in self.year_ranges:
+                    key = f"{brand_name}:{year_from}-{year_to}"
+                    partitions.append((key, year_url_template.format(year_from=year_from, year_to=year_to, **values)))
             else:
-                car['Generation'] = None
-                car['EnginePowertrain'] = None
-                car['Trim'] = None
+                partitions.append((brand_name, url_template.format(**values)))
+
+        if self.partition is not None:
+            # crc32 is stable across processes and hosts, unlike hash()
+            index, count = self.partition
+            partitions = [(key, url) for key, url in partitions if zlib.crc32(key.encode('utf-8')) % count == index]
+        self.logger.info(f"Partitioned crawl: {len(partitions)} partitions")
+        return partitions
+
+    def item_scraped(self, item, response, spider):
+        # Only mark an emitted listing seen once the item pipelines have
+        # stored it; if the crawl dies first it is emitted again next time.
+        # The marks are written once per parsed page (see parse).
+        if item.get('ID'):
+            self.pending_seen.append((item['ID'], item['Price']))
 
-            # Gearbox extraction
-            gearbox_nodes = content.xpath('.//li[i[contains(@class, "icon-akp") or contains(@class, "icon-transmission")]]/text()').extract()
-            car['Gearbox'] = next((node.strip() for node in gearbox_nodes if node.strip()), None)
+    def flush_seen(self):
+        if self.pending_seen:
+            self.seen_store.mark_seen(self.pending_seen)
+            for listing_id, price in self.pending_seen:
+                if self.emitted.get(listing_id) == price:
+                    del self.emitted[listing_id]
+            self.pending_seen = []
 
-            car['ImageURL'] = content.css('picture img::attr(src)').get()
+    def spider_closed(self, spider):
+        if self.seen_store is not None:
+            self.flush_seen()
+            self.seen_store.close()
 
+    def parse(self, response):
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+
+        cars = [self.parse_ticket(content) for content in TICKETS_XPATH(response.selector.root)]
+        if self.delta:
+            self.flush_seen()
+            cars = self.filter_seen(cars)
+
+        for car in cars:
             # Debugging output
-            self.logger.debug(f"Location: {car['Location']}")
-            self.logger.debug(f"Fuel Type: {car['FuelType']}, Engine Volume: {car['EngineVolume']}")
-            self.logger.debug(f"Gearbox: {car['Gearbox']}")
+            if debug:
+                self.logger.debug(f"Location: {car['Location']}")
+                self.logger.debug(f"Fuel Type: {car['FuelType']}, Engine Volume: {car['EngineVolume']}")
+                self.logger.debug(f"Gearbox: {car['Gearbox']}")
 
             yield car
 
+        partition = response.meta.get('partition', '')
+        if self.delta:
+            streak = 0 if cars else self.consecutive_known_pages.get(partition, 0) + 1
+            self.consecutive_known_pages[partition] = streak
+            if 0 < self.known_pages <= streak:
+                self.logger.info(f"Delta crawl: {streak} consecutive pages of known listings, "
+                                 f"stopping at {response.url}")
+                return
+
         next_page = response.css('a.page-link.js-next::attr(href)').get()
         if next_page is not None:
-            yield response.follow(next_page, callback=self.parse)
+            # Delta runs revisit the pages of the previous run, so they must
+            # not be dropped by a persisted dupefilter (-s JOBDIR=...)
+            yield response.follow(next_page, callback=self.parse, meta={'partition': partition} if partition else None,
+                                  dont_filter=self.delta)
+
+    def filter_seen(self, cars):
+        """
+        Keep only listings that are new or whose price changed since the
+        last crawl. Unchanged listings get their last seen time bumped
+        here; the ones kept are marked seen by item_scraped once stored,
+        and until then are skipped if they show up again at the same price.
+        """
+        known_prices = self.seen_store.get_prices(car['ID'] for car in cars if car['ID'])
+        stats = self.crawler.stats
+        fresh = []
+        for car in cars:
+            if car['ID'] in self.emitted and self.emitted[car['ID']] == car['Price']:
+                stats.inc_value('delta/duplicate')
+                continue
+            if not car['ID'] or car['ID'] not in known_prices:
+                stats.inc_value('delta/new')
+            elif known_prices[car['ID']] != car['Price']:
+                stats.inc_value('delta/changed')
+            else:
+                stats.inc_value('delta/unchanged')
+                continue
+            if car['ID']:
+                self.emitted[car['ID']] = car['Price']
+            fresh.append(car)
+        self.seen_store.mark_seen((car['ID'], known_prices[car['ID']]) for car in cars
+                                  if car['ID'] in known_prices and known_prices[car['ID']] == car['Price'])
+        return fresh
+
+    def parse_ticket(self, content):
+        """
+        Build a CarItem from one `section.ticket-item` lxml element.
+        """
+        car = CarItem()
+
+        # Extract data from data attributes (first div that carries each one)
+        data_divs = DATA_DIVS_XPATH(content)
+        for field, attribute in DATA_ATTRIBUTES:
+            car[field] = next((value for value in (div.get(attribute) for div in data_divs) if value is not None), '')
+        car['URL'] = 'https://auto.ria.com' + car['URL']
+
+        # Extract other details
+        car['Title'] = _first(TITLE_XPATH(content), '').strip()
+        car['Price'] = _first(PRICE_XPATH(content), '').replace(" ", "")
+        car['Mileage'] = _first(MILEAGE_XPATH(content), '').replace(' тис. км', '000').strip()
+
+        # Location extraction
+        location = _first(LOCATION_XPATH(content))
+        car['Location'] = location.strip() if location else None
+
+        # Extract fuel type and engine volume
+        fuel_type = _first_stripped(FUEL_XPATH(content))
+
+        if fuel_type:
+            if ',' in fuel_type:
+                fuel_parts = fuel_type.split(',')
+                car['FuelType'] = fuel_parts[0].strip()
+                car['EngineVolume'] = fuel_parts[1].strip() if len(fuel_parts) > 1 else None
+            else:
+                car['FuelType'] = fuel_type
+                car['EngineVolume'] = None
+        else:
+            car['FuelType'] = None
+            car['EngineVolume'] = None
+
+        # Extract generation, engine powertrain, and trim
+        generation_text = ' '.join(text.strip() for text in GENERATION_XPATH(content) if text.strip())
+        if generation_text:
+            parts = generation_text.split(' • ')
+            car['Generation'] = parts[0] if parts else None
+            car['Trim'] = parts[-1] if len(parts) > 1 else None
+            car['EnginePowertrain'] = ' • '.join(parts[1:-1]) if len(parts) > 2 else None
+        else:
+            car['Generation'] = None
+            car['EnginePowertrain'] = None
+            car['Trim'] = None
+
+        # Gearbox extraction
+        car['Gearbox'] = _first_stripped(GEARBOX_XPATH(content))
+
+        car['ImageURL'] = _first(IMAGE_XPATH(content))
+
+        return car
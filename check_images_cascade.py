@@ -0,0 +1,120 @@
+import argparse
+import os
+import time
+from image_inference import (IMAGENET_CAR_CLASSES, ValidationRun, add_arguments, load_model, loaded_weights_version,
+                             run_sharded, select_device, validate_tree, validator_options)
+from validation_results import print_counts
+
+# Stage 1: small ImageNet classifier; stage 2: the COCO detector from check_images_detect.py
+CLASSIFIER_WEIGHTS = 'yolov8n-cls.pt'
+DETECTOR_WEIGHTS = 'yolov8m.pt'
+CLASSIFIER_IMGSZ = 224
+DETECTOR_IMGSZ = 640
+
+# Classifier car probability (summed over the car classes) at or below
+# which an image is rejected and at or above which it is accepted; images
+# in between go to the detector
+REJECT_BELOW = 0.05
+ACCEPT_ABOVE = 0.5
+
+# Detector verdict, same as check_images_detect.py: a COCO 'car' box above 0.25
+CAR_CLASS = 2
+DETECTOR_THRESHOLD = 0.25
+
+def car_probability(result):
+    probs = result.probs.data
+    return float(sum(probs[class_id] for class_id in IMAGENET_CAR_CLASSES if class_id < len(probs)))
+
+def detect_result(result):
+    car_boxes = result.boxes.cls == CAR_CLASS
+    if not car_boxes.any():
+        return False, None, 0.0
+    confidence = result.boxes.conf[car_boxes].max().item()
+    return confidence > DETECTOR_THRESHOLD, CAR_CLASS, confidence
+
+def cascade_model_name(classifier_weights, detector_weights):
+    return f"cascade:{os.path.basename(classifier_weights)}+{os.path.basename(detector_weights)}"
+
+def validate_paths(image_paths, batch_size=32, decode_workers=4, queue_size=None, classifier_weights=CLASSIFIER_WEIGHTS,
+                   detector_weights=DETECTOR_WEIGHTS, reject_below=REJECT_BELOW, accept_above=ACCEPT_ABOVE,
+                   detector_batch_size=8, backend='torch', backend_threads=None, device=None, **options):
+    """
+    Run the classifier over image_paths and decide the confident ones
+    directly; only images whose car probability falls between reject_below
+    and accept_above are run through the detector. Verdicts are recorded
+    under a 'cascade' model name whose version covers both weights and the
+    band, so --incremental re-scores everything when either changes.
+    options are ValidationRun's.
+    """
+    classifier = load_model(classifier_weights, device, backend, CLASSIFIER_IMGSZ, backend_threads)
+    detector = load_model(detector_weights, device, backend, DETECTOR_IMGSZ, backend_threads)
+    model_version = (f"{loaded_weights_version(classifier, classifier_weights)}+"
+                     f"{loaded_weights_version(detector, detector_weights)}"
+                     f"@{reject_below}-{accept_above}")
+    counts = {'accepted': 0, 'rejected': 0, 'detector': 0, 'detector_valid': 0, 'detector_invalid': 0}
+    start = time.time()
+    with ValidationRun(image_paths, cascade_model_name(classifier_weights, detector_weights), model_version,
+                       DETECTOR_THRESHOLD, backend=backend, device=device, **options) as run:
+        uncertain = []
+        stage1 = run.inference(classifier, CLASSIFIER_IMGSZ, 'short', batch_size, decode_workers, queue_size)
+        for image_path, result in run.results(stage1, "Stage 1 (classifier)"):
+            car_score = car_probability(result)
+            top1 = result.probs.top1
+            if car_score >= accept_above:
+                counts['accepted'] += 1
+                run.record(image_path, True, top1, result.names[top1], car_score)
+            elif car_score <= reject_below:
+                counts['rejected'] += 1
+                run.record(image_path, False, top1, result.names[top1], car_score)
+            else:
+                uncertain.append(image_path)
+
+        counts['detector'] = len(uncertain)
+        stage2 = run.inference(detector, DETECTOR_IMGSZ, 'long', detector_batch_size, decode_workers, queue_size)
+        for image_path, result in run.results(stage2, "Stage 2 (detector)", uncertain):
+            car_detected, class_id, confidence = detect_result(result)
+            counts['detector_valid' if car_detected else 'detector_invalid'] += 1
+            run.record(image_path, car_detected, class_id, result.names[CAR_CLASS] if class_id is not None else None,
+                       confidence)
+    elapsed = max(time.time() - start, 1e-9)
+    images = len(run.image_keys)
+    print(f"Stage 1: {counts['accepted']} accepted, {counts['rejected']} rejected, "
+          f"{counts['detector']} sent to the detector ({stage1.images_per_second:.1f} images/sec)")
+    print(f"Stage 2: {counts['detector_valid']} valid, {counts['detector_invalid']} invalid "
+          f"({stage2.images_per_second:.1f} images/sec)")
+    print(f"Errors: {run.errors}")
+    print(f"Throughput: {images / elapsed:.1f} images/sec overall, "
+          f"{(1 - counts['detector'] / max(images, 1)) * 100:.1f}% of images never reached the detector")
+    return run.valid_count, run.invalid_count
+
+def process_images(root_dir='data/pictures', **options):
+    return validate_tree(validate_paths, root_dir, **options)
+
+if __name__ == "__main__":
+    parser = add_arguments(argparse.ArgumentParser(
+        description="Sort downloaded images with a small classifier, asking the detector only when it is unsure."),
+        batch_size=32)
+    parser.add_argument('--classifier-weights', default=CLASSIFIER_WEIGHTS)
+    parser.add_argument('--detector-weights', default=DETECTOR_WEIGHTS)
+    parser.add_argument('--reject-below', type=float, default=REJECT_BELOW,
+                        help="reject without the detector when the classifier's car probability is at most this")
+    parser.add_argument('--accept-above', type=float, default=ACCEPT_ABOVE,
+                        help="accept without the detector when the classifier's car probability is at least this")
+    parser.add_argument('--detector-batch-size', type=int, default=8)
+    args = parser.parse_args()
+
+    args.device = args.device or str(select_device())
+    print(f"Using device: {args.device}")
+
+    options = validator_options(args)
+    options.update(classifier_weights=args.classifier_weights, detector_weights=args.detector_weights,
+                   reject_below=args.reject_below, accept_above=args.accept_above,
+                   detector_batch_size=args.detector_batch_size)
+    if args.workers > 1 or args.shard:
+        # Each worker process loads its own models on first use
+        valid, invalid = run_sharded('check_images_cascade', args.content_store or args.root_dir, args.shard or (0, 1),
+                                     args.workers, args.torch_threads, **options)
+    else:
+        valid, invalid = process_images(args.root_dir, **options)
+    print_counts(valid, invalid, args.incremental, args.results_db,
+                 cascade_model_name(args.classifier_weights, args.detector_weights))
@@ -1,111 +1,66 @@
+import argparse
 import os
-import shutil
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from tqdm import tqdm
-from ultralytics import YOLO
-import cv2
-import torch
-import traceback
+from image_inference import (IMAGENET_CAR_CLASSES, ValidationRun, add_arguments, load_model, loaded_weights_version,
+                             run_sharded, select_device, validate_tree, validator_options)
+from validation_results import print_counts
 
-# Load YOLOv8 classification model
-model = YOLO('yolov8m-cls.pt')
+# YOLOv8 classification model weights, loaded on first use (image_inference.load_model)
+WEIGHTS = 'yolov8m-cls.pt'
+
+# Classifier input size and minimum top-1 confidence for a car class
+IMGSZ = 224
+CONFIDENCE_THRESHOLD = 0.19
 
 # List of car-related classes from ImageNet
-car_classes = {
-    436: 'beach_wagon, station_wagon, wagon, estate_car, beach_waggon, station_waggon, waggon',
-    511: 'convertible',
-    581: 'grille, radiator grille',
-    609: 'jeep, landrover',
-    627: 'limousine, limo',
-    656: 'minivan',
-    705: 'passenger_car, coach, carriage',
-    717: 'pickup, pickup_truck',
-    751: 'racer, race_car, racing_car',
-    817: 'sports_car, sport_car',
-    864: 'tow_truck, tow_car, wrecker',
-    867: 'trailer_truck, tractor_trailer, trucking_rig, rig, articulated_lorry, semi',
-}
+car_classes = IMAGENET_CAR_CLASSES
 
-def validate_image(image_path, valid_dir, invalid_dir):
-    try:
-        # Read image using OpenCV
-        img = cv2.imread(image_path)
-        if img is None:
-            raise ValueError(f"Unable to read image: {image_path}")
+def classify_result(result):
+    # Get the top predicted class and its confidence
+    top_pred = result.probs.top1
+    confidence = result.probs.top1conf.item()
+    class_name = result.names[top_pred]
 
-        # Run inference
-        results = model(img)[0]
-        
-        # Get the top predicted class and its confidence
-        top_pred = results.probs.top1
-        confidence = results.probs.top1conf.item()
-        class_name = results.names[top_pred]
-        
-        # Check if the predicted class is in our list of car classes
-        car_detected = top_pred in car_classes and confidence > 0.19
-        
-        # Create the same subfolder structure in valid or invalid directory
-        rel_path = os.path.relpath(image_path, 'data/pictures')
-        new_dir = os.path.join(valid_dir if car_detected else invalid_dir, os.path.dirname(rel_path))
-        os.makedirs(new_dir, exist_ok=True)
-        
-        # Move the image to the appropriate directory
-        new_path = os.path.join(new_dir, os.path.basename(image_path))
-        shutil.move(image_path, new_path)
-        
-        print(f"Image: {image_path}, Class: {class_name}, Confidence: {confidence:.2f}, Car detected: {car_detected}")
-        
-        return car_detected, new_path
-    except Exception as e:
-        error_msg = f"Error processing image {image_path}: {str(e)}\n{traceback.format_exc()}"
-        print(error_msg)
-        with open('error_log.txt', 'a') as f:
-            f.write(error_msg + '\n\n')
-        return False, image_path
+    # Check if the predicted class is in our list of car classes
+    car_detected = top_pred in car_classes and confidence > CONFIDENCE_THRESHOLD
+    return car_detected, top_pred, class_name, confidence
 
-def process_images(root_dir='data/pictures', valid_dir='data/valid_pictures', invalid_dir='data/invalid_pictures'):
-    os.makedirs(valid_dir, exist_ok=True)
-    os.makedirs(invalid_dir, exist_ok=True)
-    
-    image_paths = []
-    for root, _, files in os.walk(root_dir):
-        for file in files:
-            if file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                image_paths.append(os.path.join(root, file))
-    
-    valid_count = 0
-    invalid_count = 0
-    
-    with ThreadPoolExecutor(max_workers=40) as executor:
-        futures = [executor.submit(validate_image, path, valid_dir, invalid_dir) for path in image_paths]
-        
-        for future in tqdm(as_completed(futures), total=len(futures), desc="Validating images"):
-            is_valid, new_path = future.result()
-            if is_valid:
-                valid_count += 1
-            else:
-                invalid_count += 1
-    
-    # Clean up empty directories
-    cleanup_empty_dirs(root_dir)
-    
-    return valid_count, invalid_count
+def validate_paths(image_paths, batch_size=32, decode_workers=4, queue_size=None, backend='torch', backend_threads=None,
+                   device=None, **options):
+    """
+    Classify image_paths and record a verdict for each; options (move,
+    incremental, content_store, shards, ...) are ValidationRun's. A backend
+    other than 'torch' runs an exported copy of WEIGHTS with
+    backend_threads threads (see export_backend.py), recorded under the
+    same model name and version. The model is loaded on the first call and
+    reused by later calls in the same process.
+    """
+    model = load_model(WEIGHTS, device, backend, IMGSZ, backend_threads)
+    # Hash the checkpoint ultralytics resolved, which may not be WEIGHTS in the working directory
+    with ValidationRun(image_paths, os.path.basename(WEIGHTS), loaded_weights_version(model, WEIGHTS),
+                       CONFIDENCE_THRESHOLD, backend=backend, device=device, **options) as run:
+        engine = run.inference(model, IMGSZ, 'short', batch_size, decode_workers, queue_size)
+        for image_path, result in run.results(engine, "Validating images"):
+            car_detected, class_id, class_name, confidence = classify_result(result)
+            if run.record(image_path, car_detected, class_id, class_name, confidence) is not None:
+                print(f"Image: {image_path}, Class: {class_name}, Confidence: {confidence:.2f}, "
+                      f"Car detected: {car_detected}")
+    print(f"Throughput: {engine.images_per_second:.1f} images/sec")
+    return run.valid_count, run.invalid_count
 
-def cleanup_empty_dirs(path):
-    for root, dirs, files in os.walk(path, topdown=False):
-        for dir in dirs:
-            dir_path = os.path.join(root, dir)
-            if not os.listdir(dir_path):  # check if directory is empty
-                os.rmdir(dir_path)
-                print(f"Removed empty directory: {dir_path}")
+def process_images(root_dir='data/pictures', **options):
+    return validate_tree(validate_paths, root_dir, **options)
 
 if __name__ == "__main__":
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    print(f"Using device: {device}")
-    
-    model.to(device)
-    
-    valid, invalid = process_images()
-    print(f"Validation complete.")
-    print(f"Valid images: {valid}")
-    print(f"Invalid images: {invalid}")
+    args = add_arguments(argparse.ArgumentParser(description="Sort downloaded images with a YOLOv8 classifier."),
+                         batch_size=32).parse_args()
+
+    args.device = args.device or str(select_device())
+    print(f"Using device: {args.device}")
+
+    if args.workers > 1 or args.shard:
+        # Each worker process loads its own model on first use
+        valid, invalid = run_sharded('check_images_classify', args.content_store or args.root_dir, args.shard or (0, 1), args.workers,
+                                     args.torch_threads, **validator_options(args))
+    else:
+        valid, invalid = process_images(args.root_dir, **validator_options(args))
+    print_counts(valid, invalid, args.incremental, args.results_db, os.path.basename(WEIGHTS))
@@ -1,94 +1,67 @@
+import argparse
 import os
-import shutil
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from tqdm import tqdm
-from ultralytics import YOLO
-import cv2
-import torch
-import traceback
+from image_inference import (ValidationRun, add_arguments, load_model, loaded_weights_version, run_sharded,
+                             select_device, validate_tree, validator_options)
+from validation_results import print_counts
 
-# Load YOLOv8 model
-model = YOLO('yolov8m.pt')
+# YOLOv8 model weights, loaded on first use (image_inference.load_model)
+WEIGHTS = 'yolov8m.pt'
 
-def validate_image(image_path, valid_dir, invalid_dir):
-    try:
-        # Read image using OpenCV
-        img = cv2.imread(image_path)
-        if img is None:
-            raise ValueError(f"Unable to read image: {image_path}")
+# Detector input size, COCO 'car' class and minimum box confidence
+IMGSZ = 640
+CAR_CLASS = 2
+CONFIDENCE_THRESHOLD = 0.25
 
-        # Run inference
-        results = model(img)
-        
-        # Check if 'car' is detected with confidence > 0.25
-        car_detected = any(result.boxes.cls[result.boxes.cls == 2].numel() > 0 and 
-                           result.boxes.conf[result.boxes.cls == 2].max() > 0.25 
-                           for result in results)
-        
-        # Create the same subfolder structure in valid or invalid directory
-        rel_path = os.path.relpath(image_path, 'data/pictures')
-        new_dir = os.path.join(valid_dir if car_detected else invalid_dir, os.path.dirname(rel_path))
-        os.makedirs(new_dir, exist_ok=True)
-        
-        # Move the image to the appropriate directory
-        new_path = os.path.join(new_dir, os.path.basename(image_path))
-        shutil.move(image_path, new_path)
-        
-        return car_detected, new_path
-    except Exception as e:
-        error_msg = f"Error processing image {image_path}: {str(e)}\n{traceback.format_exc()}"
-        print(error_msg)
-        with open('error_log.txt', 'a') as f:
-            f.write(error_msg + '\n\n')
-        return False, image_path
+def detect_result(result):
+    """
+    Returns (car_detected, class_id, confidence): class_id is CAR_CLASS when
+    any car box was found and confidence is the best car box confidence.
+    """
+    car_boxes = result.boxes.cls == CAR_CLASS
+    if not car_boxes.any():
+        return False, None, 0.0
+    confidence = result.boxes.conf[car_boxes].max().item()
+    # Check if 'car' is detected with confidence > 0.25
+    return confidence > CONFIDENCE_THRESHOLD, CAR_CLASS, confidence
 
-def process_images(root_dir='data/pictures', valid_dir='data/valid_pictures', invalid_dir='data/invalid_pictures'):
-    os.makedirs(valid_dir, exist_ok=True)
-    os.makedirs(invalid_dir, exist_ok=True)
-    
-    image_paths = []
-    for root, _, files in os.walk(root_dir):
-        for file in files:
-            if file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                image_paths.append(os.path.join(root, file))
-    
-    valid_count = 0
-    invalid_count = 0
-    
-    with ThreadPoolExecutor(max_workers=20) as executor:
-        futures = [executor.submit(validate_image, path, valid_dir, invalid_dir) for path in image_paths]
-        
-        for future in tqdm(as_completed(futures), total=len(futures), desc="Validating images"):
-            is_valid, new_path = future.result()
-            if is_valid:
-                valid_count += 1
-                print(f"Moved valid image to: {new_path}")
-            else:
-                invalid_count += 1
-                print(f"Moved invalid image to: {new_path}")
-    
-    # Clean up empty directories
-    cleanup_empty_dirs(root_dir)
-    
-    return valid_count, invalid_count
+def validate_paths(image_paths, batch_size=8, decode_workers=4, queue_size=None, backend='torch', backend_threads=None,
+                   device=None, **options):
+    """
+    Run the detector over image_paths and record a verdict for each;
+    options (move, incremental, content_store, shards, ...) are
+    ValidationRun's. A backend other than 'torch' runs an exported copy of
+    WEIGHTS with backend_threads threads (see export_backend.py), recorded
+    under the same model name and version. The model is loaded on the
+    first call and reused by later calls in the same process.
+    """
+    model = load_model(WEIGHTS, device, backend, IMGSZ, backend_threads)
+    # Hash the checkpoint ultralytics resolved, which may not be WEIGHTS in the working directory
+    with ValidationRun(image_paths, os.path.basename(WEIGHTS), loaded_weights_version(model, WEIGHTS),
+                       CONFIDENCE_THRESHOLD, backend=backend, device=device, **options) as run:
+        engine = run.inference(model, IMGSZ, 'long', batch_size, decode_workers, queue_size)
+        for image_path, result in run.results(engine, "Validating images"):
+            car_detected, class_id, confidence = detect_result(result)
+            class_name = result.names[CAR_CLASS] if class_id is not None else None
+            stored_path = run.record(image_path, car_detected, class_id, class_name, confidence)
+            if stored_path is not None:
+                print(f"{'Valid' if car_detected else 'Invalid'} image: {stored_path}")
+    print(f"Throughput: {engine.images_per_second:.1f} images/sec")
+    return run.valid_count, run.invalid_count
 
-def cleanup_empty_dirs(path):
-    for root, dirs, files in os.walk(path, topdown=False):
-        for dir in dirs:
-            dir_path = os.path.join(root, dir)
-            if not os.listdir(dir_path):  # check if directory is empty
-                os.rmdir(dir_path)
-                print(f"Removed empty directory: {dir_path}")
+def process_images(root_dir='data/pictures', **options):
+    return validate_tree(validate_paths, root_dir, **options)
 
 if __name__ == "__main__":
-    # Set the device
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    print(f"Using device: {device}")
-    
-    # Move model to the appropriate device
-    model.to(device)
-    
-    valid, invalid = process_images()
-    print(f"Validation complete.")
-    print(f"Valid images: {valid}")
-    print(f"Invalid images: {invalid}")
+    args = add_arguments(argparse.ArgumentParser(description="Sort downloaded images with a YOLOv8 car detector."),
+                         batch_size=8).parse_args()
+
+    args.device = args.device or str(select_device())
+    print(f"Using device: {args.device}")
+
+    if args.workers > 1 or args.shard:
+        # Each worker process loads its own model on first use
+        valid, invalid = run_sharded('check_images_detect', args.content_store or args.root_dir, args.shard or (0, 1), args.workers,
+                                     args.torch_threads, **validator_options(args))
+    else:
+        valid, invalid = process_images(args.root_dir, **validator_options(args))
+    print_counts(valid, invalid, args.incremental, args.results_db, os.path.basename(WEIGHTS))
@@ -1,117 +1,359 @@
-import json
 import os
 import requests
 import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from tqdm import tqdm
-from ratelimit import limits, sleep_and_retry
+from requests.adapters import HTTPAdapter
+from collections import namedtuple
+import argparse
+import hashlib
+import tempfile
 import time
+from download_manifest import DownloadManifest
+from image_store import ContentStore, DEFAULT_CONTENT_STORE
+from image_shards import DEFAULT_SHARD_DIR, ShardWriter
+from image_transform import ImageTransformer, add_arguments as add_transform_arguments
+from throttling import DEFAULT_LIMITER_DIR, IMAGES_ENDPOINT, open_bucket
+from car_scraper.records import iter_records
+
+THROTTLE_STATUSES = (429, 502, 503, 504)
+POSTFIX_INTERVAL = 1.0  # seconds between progress bar rate refreshes
+
+DownloadResult = namedtuple('DownloadResult', 'success status size variant sha256')
 
 def get_folder_path(car_id):
     car_id = str(car_id).zfill(8)
     return os.path.join('data', 'pictures', car_id[:2], car_id[2:4], car_id[4:6])
 
-@sleep_and_retry
-@limits(calls=20, period=1)
-def download_image(car):
+def make_session(per_host_connections=16):
+    """
+    One pooled session shared by all download threads. pool_block caps the
+    number of open connections per host instead of opening extra ones.
+    """
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=per_host_connections, pool_block=True)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def download_image(car, session=requests, bucket=None, max_attempts=4, chunk_size=64 * 1024, check_exists=True,
+                   image_store=None):
     car_id = car.get('ID')
     if not car_id:
-        return False, "no_id"
+        return DownloadResult(False, "no_id", 0, None, None)
     
     image_url = car.get('ImageURL')
     if not image_url:
-        return False, "no_url"
+        return DownloadResult(False, "no_url", 0, None, None)
 
     folder_path = get_folder_path(car_id)
     file_name = os.path.join(folder_path, f"{car_id}.jpg")
     
-    if os.path.exists(file_name):
-        return True, "exists"
-
-    os.makedirs(folder_path, exist_ok=True)
+    if image_store is not None:
+        if check_exists and image_store.has(car_id):
+            return DownloadResult(True, "exists", 0, None, None)
+    elif check_exists and os.path.exists(file_name):
+        return DownloadResult(True, "exists", 0, None, None)
+    else:
+        os.makedirs(folder_path, exist_ok=True)
 
     def try_download(url_suffix):
-        try:
-            modified_url = re.sub(r'(\w{2})\.jpg$', f'{url_suffix}.jpg', image_url)
-            response = requests.get(modified_url)
-            response.raise_for_status()
-            
-            with open(file_name, 'wb') as file:
-                file.write(response.content)
-            
-            return True
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 500:
-                return False
-            raise
-        except Exception as e:
-            print(f"Error downloading image for car ID {car_id}: {str(e)}")
-            return False
-
-    if try_download('hd') or try_download('f'):
-        return True, "downloaded"
+        modified_url = re.sub(r'(\w{2})\.jpg$', f'{url_suffix}.jpg', image_url)
+        for attempt in range(max_attempts):
+            sent_at = bucket.acquire() if bucket else None
+            temp_name = None
+            try:
+                with session.get(modified_url, stream=True, timeout=30) as response:
+                    if response.status_code in THROTTLE_STATUSES:
+                        if bucket:
+                            bucket.on_throttle(sent_at)
+                        time.sleep(min(2 ** attempt, 30))
+                        continue
+                    # riastatic answers 500 when a variant doesn't exist
+                    if response.status_code == 500:
+                        return None
+                    response.raise_for_status()
+
+                    if image_store is not None:
+                        # Keep the photo in memory and hand it to the store (content store or shards)
+                        data = b''.join(response.iter_content(chunk_size))
+                        status, sha256 = image_store.put(car_id, data, hashlib.sha256(data).hexdigest())
+                        if bucket:
+                            bucket.on_success()
+                        return len(data), sha256, status
+
+                    # Stream into a temp file and rename so readers never see partial images
+                    fd, temp_name = tempfile.mkstemp(dir=folder_path, suffix='.part')
+                    size = 0
+                    digest = hashlib.sha256()
+                    with os.fdopen(fd, 'wb') as file:
+                        for chunk in response.iter_content(chunk_size):
+                            file.write(chunk)
+                            digest.update(chunk)
+                            size += len(chunk)
+                    os.replace(temp_name, file_name)
+                    temp_name = None
+                if bucket:
+                    bucket.on_success()
+                return size, digest.hexdigest(), 'stored'
+            except Exception as e:
+                print(f"Error downloading image for car ID {car_id}: {str(e)}")
+                return None
+            finally:
+                if temp_name and os.path.exists(temp_name):
+                    os.remove(temp_name)
+        return None
+
+    for url_suffix in ('hd', 'f'):
+        downloaded = try_download(url_suffix)
+        if downloaded is not None:
+            size, sha256, stored = downloaded
+            return DownloadResult(True, "downloaded" if stored == 'stored' else "duplicate", size, url_suffix, sha256)
     
-    return False, "failed"
+    return DownloadResult(False, "failed", 0, None, None)
 
-def batch_check_existence(cars, batch_size=1000):
+def batch_check_existence(cars):
     existing_files = set()
     skipped_cars = 0
-    for i in range(0, len(cars), batch_size):
-        batch = cars[i:i+batch_size]
-        for car in batch:
-            car_id = car.get('ID')
-            if car_id:
-                file_path = os.path.join(get_folder_path(car_id), f"{car_id}.jpg")
-                if os.path.exists(file_path):
-                    existing_files.add(file_path)
-            else:
-                skipped_cars += 1
+    for car in cars:
+        car_id = car.get('ID')
+        if car_id:
+            file_path = os.path.join(get_folder_path(car_id), f"{car_id}.jpg")
+            if os.path.exists(file_path):
+                existing_files.add(file_path)
+        else:
+            skipped_cars += 1
     return existing_files, skipped_cars
 
-def main():
+def iter_batches(records, batch_size=1000):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def batch_check_manifest(cars, manifest):
+    """
+    Same contract as batch_check_existence, answered from the download
+    manifest instead of one os.path.exists per car.
+    """
+    car_ids = [str(car['ID']) for car in cars if car.get('ID')]
+    statuses = manifest.get_statuses(car_ids)
+    existing_files = {os.path.join(get_folder_path(car_id), f"{car_id}.jpg")
+                      for car_id in car_ids if statuses.get(car_id) == 'downloaded'}
+    return existing_files, len(cars) - len(car_ids)
+
+def batch_check_image_store(cars, image_store):
+    """
+    Same contract as batch_check_existence, answered from the content
+    store's or shard writer's ID index.
+    """
+    car_ids = [str(car['ID']) for car in cars if car.get('ID')]
+    known = image_store.known_ids(car_ids)
+    existing_files = {os.path.join(get_folder_path(car_id), f"{car_id}.jpg") for car_id in known}
+    return existing_files, len(cars) - len(car_ids)
+
+def download_cars(cars, workers=40, per_host_connections=16, rate=20.0, max_rate=100.0, max_in_flight=2000, manifest=None,
+                  image_store=None, limiter_dir=None, transformer=None):
+    """
+    Download images for an iterable of car records over a shared pooled
+    session and an adaptive rate limiter. Returns a stats dict. With a
+    DownloadManifest, existence checks come from the manifest and every
+    result is recorded in it. With an image_store (ContentStore or
+    ShardWriter) images are handed to it instead of written per ID. With
+    limiter_dir the rate limiter is the image endpoint's SharedTokenBucket
+    there, shared with every other process using it. With an
+    ImageTransformer every downloaded file is handed to it, and its
+    manifest row is recorded once the transform is done, with the size and
+    hash of the file it left on disk; the caller closes the transformer.
+    """
+    session = make_session(per_host_connections)
+    bucket = open_bucket(IMAGES_ENDPOINT, rate, max(rate, 1.0), 1.0, max_rate, limiter_dir)
+    stats = {
+        'total_cars': 0,
+        'skipped_cars': 0,
+        'existing': 0,
+        'existence_check_seconds': 0.0,
+        'bytes': 0,
+        'bytes_deduplicated': 0,
+        'results': {'downloaded': 0, 'duplicate': 0, 'exists': 0, 'failed': 0, 'no_id': 0, 'no_url': 0},
+    }
+
+    def record_transformed(done):
+        # Manifest rows describe the file on disk, so the transformed one (or
+        # the original when the transform failed)
+        for future in done:
+            car_id, result = transforming.pop(future)
+            size, sha256 = future.result() or (result.size, result.sha256)
+            manifest.record(car_id, 'downloaded', result.variant, size, sha256)
+
+    def collect(done):
+        record_transformed([future for future in transforming if future.done()])
+        for future in done:
+            car_id = in_flight.pop(future)
+            result = future.result()
+            stats['results'][result.status] += 1
+            stats['bytes'] += result.size
+            if result.status == 'duplicate':
+                stats['bytes_deduplicated'] += result.size
+            if transformer is not None and result.status == 'downloaded':
+                transformed = transformer.submit(os.path.join(get_folder_path(car_id), f"{car_id}.jpg"))
+                if manifest is not None:
+                    transforming[transformed] = (car_id, result)
+            elif manifest is not None and result.status in ('downloaded', 'duplicate', 'failed'):
+                status = 'failed' if result.status == 'failed' else 'downloaded'
+                manifest.record(car_id, status, result.variant, result.size, result.sha256)
+            progress.update(1)
+        # bucket.rate takes the limiter's file lock, so refresh the postfix about once a second
+        nonlocal postfix_time
+        now = time.time()
+        if now - postfix_time < POSTFIX_INTERVAL:
+            return
+        postfix_time = now
+        elapsed = max(now - download_start, 1e-9)
+        progress.set_postfix(img_s=f"{stats['results']['downloaded'] / elapsed:.1f}",
+                             MB_s=f"{stats['bytes'] / elapsed / 1e6:.2f}", rate=f"{bucket.rate:.1f}")
+
+    transforming = {}
+    download_start = time.time()
+    postfix_time = 0.0
+    with ThreadPoolExecutor(max_workers=workers) as executor, tqdm(desc="Downloading images") as progress:
+        in_flight = {}
+        for batch in iter_batches(cars):
+            if not stats['total_cars']:
+                # Debug: Print the first few car objects
+                print("Sample car data:")
+                for i, car in enumerate(batch[:5]):
+                    print(f"Car {i + 1}: {car}")
+            stats['total_cars'] += len(batch)
+
+            check_start = time.time()
+            if image_store is not None:
+                existing_files, batch_skipped = batch_check_image_store(batch, image_store)
+            elif manifest is not None:
+                existing_files, batch_skipped = batch_check_manifest(batch, manifest)
+            else:
+                existing_files, batch_skipped = batch_check_existence(batch)
+            stats['existence_check_seconds'] += time.time() - check_start
+            stats['skipped_cars'] += batch_skipped
+            stats['existing'] += len(existing_files)
+
+            for car in batch:
+                if car.get('ID') and os.path.join(get_folder_path(car['ID']), f"{car['ID']}.jpg") not in existing_files:
+                    future = executor.submit(download_image, car, session, bucket,
+                                             check_exists=manifest is None and image_store is None,
+                                             image_store=image_store)
+                    in_flight[future] = car['ID']
+
+            # Backpressure: don't read further ahead than max_in_flight downloads
+            while len(in_flight) >= max_in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+
+        done, _ = wait(in_flight)
+        collect(done)
+        done, _ = wait(transforming)
+        record_transformed(done)
+
+    bucket.close()
+    if manifest is not None:
+        manifest.commit()
+
+    stats['download_seconds'] = time.time() - download_start
+    return stats
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Download listing images into data/pictures.")
+    parser.add_argument('--input', default='data/cars_with_brands_and_models.json',
+                        help="JSON array or JSON Lines (.jsonl[.gz|.zst]) of cars")
+    parser.add_argument('--workers', type=int, default=40, help="download threads")
+    parser.add_argument('--per-host', type=int, default=16, help="max open connections per image host")
+    parser.add_argument('--rate', type=float, default=20.0, help="initial requests per second")
+    parser.add_argument('--max-rate', type=float, default=100.0, help="ceiling for the adaptive rate limiter (0 for none)")
+    parser.add_argument('--shared-limiter', nargs='?', const=DEFAULT_LIMITER_DIR, default=None,
+                        help=f"draw from the cross-process rate limiter in this directory (default {DEFAULT_LIMITER_DIR})")
+    parser.add_argument('--max-in-flight', type=int, default=2000, help="queued downloads before reading more cars")
+    parser.add_argument('--manifest', default='data/download_manifest.sqlite3', help="download manifest (SQLite)")
+    parser.add_argument('--no-manifest', action='store_true', help="check every file on disk instead")
+    parser.add_argument('--rebuild-manifest', action='store_true',
+                        help="resync the manifest with data/pictures before downloading")
+    parser.add_argument('--content-store', nargs='?', const=DEFAULT_CONTENT_STORE, default=None,
+                        help=f"store images by content hash (default root {DEFAULT_CONTENT_STORE}) and skip duplicates")
+    parser.add_argument('--dhash-distance', type=int, default=3,
+                        help="max dHash bit distance for near-duplicates with --content-store, -1 for exact only "
+                             "(larger distances split the hash into more, narrower lookup bands)")
+    parser.add_argument('--shards', nargs='?', const=DEFAULT_SHARD_DIR, default=None,
+                        help=f"append images to tar shards with an offset index (default {DEFAULT_SHARD_DIR})")
+    parser.add_argument('--max-shard-mb', type=int, default=1024, help="start a new shard after this many MB")
+    parser.add_argument('--transform', action='store_true',
+                        help="resize and re-encode each image after download on a worker pool (see image_transform.py)")
+    add_transform_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.transform and (args.content_store or args.shards):
+        parser.error("--transform only works with the data/pictures layout, not --content-store or --shards")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
     start_time = time.time()
 
     try:
-        with open('data/cars_with_brands_and_models.json', 'r') as file:
-            cars = json.load(file)
-        
-        json_load_time = time.time()
-        print(f"JSON loading time: {json_load_time - start_time:.2f} seconds")
-
-        # Debug: Print the first few car objects
-        print("Sample car data:")
-        for i, car in enumerate(cars[:5]):
-            print(f"Car {i + 1}: {car}")
-
-        # eligible_cars = [car for car in cars if car.get('VehicleType', '').lower() != 'unknown']
-        eligible_cars = cars 
-        filtering_time = time.time()
-        print(f"Filtering time: {filtering_time - json_load_time:.2f} seconds")
-
-        existing_files, skipped_cars = batch_check_existence(eligible_cars)
-        
-        existence_check_time = time.time()
-        print(f"Batch existence check time: {existence_check_time - filtering_time:.2f} seconds")
-        print(f"Skipped {skipped_cars} cars due to missing ID")
-
-        cars_to_download = [car for car in eligible_cars if car.get('ID') and os.path.join(get_folder_path(car['ID']), f"{car['ID']}.jpg") not in existing_files]
-
-        with ThreadPoolExecutor(max_workers=40) as executor:
-            futures = [executor.submit(download_image, car) for car in cars_to_download]
-            
-            results = list(tqdm(as_completed(futures), total=len(futures), desc="Downloading images"))
-
-        download_time = time.time()
-        print(f"Download time: {download_time - existence_check_time:.2f} seconds")
-
-        result_counts = {'downloaded': 0, 'exists': 0, 'failed': 0, 'no_id': 0, 'no_url': 0}
-        for future in results:
-            _, status = future.result()
-            result_counts[status] += 1
-
-        print(f"Download results: {result_counts}")
-        print(f"Skipped {len(eligible_cars) - len(cars_to_download)} existing images.")
-        print(f"Skipped {len(cars) - len(eligible_cars)} cars with Unknown VehicleType.")
+        # Cars are streamed in batches (JSON array or JSON Lines, optionally
+        # compressed) so memory stays flat no matter how large the crawl was
+        manifest = None
+        if not args.no_manifest:
+            is_new = not os.path.exists(args.manifest)
+            manifest = DownloadManifest(args.manifest)
+            # The manifest scan only understands the per-ID layout; the content store is its own index
+            if (is_new or args.rebuild_manifest) and not (args.content_store or args.shards):
+                scan_start = time.time()
+                found, removed = manifest.rebuild(os.path.join('data', 'pictures'))
+                print(f"Manifest rebuilt from disk: {found} images, {removed} stale entries "
+                      f"({time.time() - scan_start:.2f} seconds)")
+
+        image_store = None
+        if args.content_store:
+            image_store = ContentStore(args.content_store, args.dhash_distance)
+        elif args.shards:
+            image_store = ShardWriter(args.shards, args.max_shard_mb << 20)
+
+        transformer = None
+        if args.transform:
+            transformer = ImageTransformer(args.max_edge, args.image_format, args.quality, args.cold_storage,
+                                           workers=args.transform_workers)
+
+        try:
+            stats = download_cars(iter_records(args.input), args.workers, args.per_host,
+                                  args.rate, args.max_rate, args.max_in_flight, manifest, image_store,
+                                  args.shared_limiter, transformer)
+        finally:
+            if transformer is not None:
+                transformer.close()
+            if manifest is not None:
+                manifest.close()
+            if image_store is not None:
+                if args.content_store:
+                    images, blobs, stored_bytes = image_store.counts()
+                image_store.close()
+
+        download_seconds = max(stats['download_seconds'], 1e-9)
+        print(f"Batch existence check time: {stats['existence_check_seconds']:.2f} seconds")
+        print(f"Skipped {stats['skipped_cars']} cars due to missing ID")
+        print(f"Download results: {stats['results']}")
+        print(f"Skipped {stats['existing']} existing images.")
+        print(f"Total cars read: {stats['total_cars']}")
+        print(f"Download time: {download_seconds:.2f} seconds")
+        print(f"Throughput: {stats['results']['downloaded'] / download_seconds:.1f} images/sec, "
+              f"{stats['bytes'] / download_seconds / 1e6:.2f} MB/sec")
+        if args.content_store:
+            print(f"Duplicates not written: {stats['results']['duplicate']} images, "
+                  f"{stats['bytes_deduplicated'] / 1e6:.2f} MB saved")
+            print(f"Content store: {images} listings -> {blobs} unique images ({stored_bytes / 1e6:.2f} MB)")
+        if transformer is not None:
+            print(transformer.summary())
 
         print(f"Total execution time: {time.time() - start_time:.2f} seconds")
 
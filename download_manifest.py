@@ -0,0 +1,114 @@
+import os
+import re
+import sqlite3
+import time
+
+ID_FILE_RE = re.compile(r'^(\d+)\.jpg$')
+
+class DownloadManifest:
+    """
+    SQLite index of downloaded images keyed by car ID, recording status,
+    the hd/f variant that was stored, size and sha256. Lets a restart skip
+    straight to the missing images without stat-ing every file.
+    """
+
+    def __init__(self, path='data/download_manifest.sqlite3', commit_every=500):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.commit_every = commit_every
+        self.pending = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS downloads (
+                car_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                variant TEXT,
+                size INTEGER,
+                sha256 TEXT,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        self.conn.commit()
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM downloads').fetchone()[0]
+
+    def get_statuses(self, car_ids, chunk_size=500):
+        statuses = {}
+        car_ids = [str(car_id) for car_id in car_ids]
+        for i in range(0, len(car_ids), chunk_size):
+            chunk = car_ids[i:i + chunk_size]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.conn.execute(f'SELECT car_id, status FROM downloads WHERE car_id IN ({placeholders})', chunk)
+            statuses.update(rows)
+        return statuses
+
+    def get(self, car_id):
+        row = self.conn.execute('SELECT status, variant, size, sha256 FROM downloads WHERE car_id = ?',
+                                (str(car_id),)).fetchone()
+        return dict(zip(('status', 'variant', 'size', 'sha256'), row)) if row else None
+
+    def record(self, car_id, status, variant=None, size=None, sha256=None):
+        self.conn.execute(
+            'INSERT OR REPLACE INTO downloads (car_id, status, variant, size, sha256, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (str(car_id), status, variant, size, sha256, time.time()))
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        self.conn.commit()
+        self.pending = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def rebuild(self, root_dir='data/pictures'):
+        """
+        Resync with the files on disk in one os.scandir sweep over the
+        xx/yy/zz fanout: present files become 'downloaded' (keeping any
+        known variant/hash), 'downloaded' rows without a file are dropped.
+        Returns (files found, rows removed).
+        """
+        present = {}
+        stack = [root_dir]
+        while stack:
+            try:
+                entries = os.scandir(stack.pop())
+            except FileNotFoundError:
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        match = ID_FILE_RE.match(entry.name)
+                        if match:
+                            present[match.group(1)] = entry.stat(follow_symlinks=False).st_size
+
+        now = time.time()
+        known = dict(self.conn.execute('SELECT car_id, size FROM downloads WHERE status = ?', ('downloaded',)))
+        stale = [(car_id,) for car_id in known if car_id not in present]
+        self.conn.executemany('DELETE FROM downloads WHERE car_id = ?', stale)
+        self.conn.executemany(
+            '''INSERT INTO downloads (car_id, status, size, updated_at) VALUES (?, 'downloaded', ?, ?)
+               ON CONFLICT(car_id) DO UPDATE SET
+                   status = 'downloaded',
+                   variant = CASE WHEN size = excluded.size THEN variant END,
+                   sha256 = CASE WHEN size = excluded.size THEN sha256 END,
+                   size = excluded.size,
+                   updated_at = excluded.updated_at''',
+            ((car_id, size, now) for car_id, size in present.items() if known.get(car_id) != size))
+        self.commit()
+        return len(present), len(stale)
@@ -1,8 +1,15 @@
+import argparse
 import requests
 import json
 import os
-import time
 import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from throttling import DEFAULT_LIMITER_DIR, PAGES_ENDPOINT, open_bucket
+
+HTTP_CACHE_FILE = '.http_cache.json'
+THROTTLE_STATUSES = (429, 500, 502, 503, 504)
 
 def sanitize_filename(filename):
     # Convert to lowercase and replace spaces with underscores
@@ -13,15 +20,67 @@ def sanitize_filename(filename):
     sanitized = sanitized.strip('. ')
     return sanitized if sanitized else 'unnamed'
 
-def download_and_save_json(url, filename):
+def make_session(pool_size=10, retries=3, backoff_factor=1.0):
+    """
+    Shared session so connections are reused; urllib3 retries 429/5xx
+    responses and connection errors with exponential backoff.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=THROTTLE_STATUSES,
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def download_and_save_json(url, filename, session=None, bucket=None, http_cache=None):
+    """
+    Download url and save it to filename. With http_cache (a dict of
+    url -> validators) the request is conditional when filename already
+    exists, and a 304 reuses the file on disk. 429/5xx answers that
+    urllib3 retried are reported to the bucket as throttling.
+    """
     try:
-        response = requests.get(url)
+        headers = {}
+        cached = http_cache.get(url) if http_cache is not None and os.path.isfile(filename) else None
+        if cached:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        if bucket:
+            sent_at = bucket.acquire()
+        response = (session or requests).get(url, headers=headers, timeout=30)
+        if bucket:
+            retries = getattr(response.raw, 'retries', None)
+            if retries is not None and any(attempt.status in THROTTLE_STATUSES for attempt in retries.history):
+                bucket.on_throttle(sent_at)
+            else:
+                bucket.on_success()
+        if response.status_code == 304:
+            print(f"Not modified: {filename}")
+            return load_json(filename)
         response.raise_for_status()
         data = response.json()
         with open(filename, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
+        if http_cache is not None:
+            validators = {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+            if validators['etag'] or validators['last_modified']:
+                http_cache[url] = validators
         print(f"Downloaded and saved: {filename}")
         return data
+    except requests.exceptions.RetryError as e:
+        # Still 429/5xx after the last retry
+        if bucket:
+            bucket.on_throttle(sent_at)
+        print(f"Error downloading {url}: {e}")
     except requests.RequestException as e:
         print(f"Error downloading {url}: {e}")
     except json.JSONDecodeError:
@@ -43,21 +102,47 @@ def load_json(filename):
 def file_exists(filename):
     return os.path.isfile(filename)
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Download the auto.ria brand and model catalog.")
+    parser.add_argument('--base-url', default="https://auto.ria.com", help="API host, e.g. a local stub server")
+    parser.add_argument('--data-dir', default="data")
+    parser.add_argument('--concurrency', type=int, default=4, help="parallel model list requests")
+    parser.add_argument('--rate', type=float, default=1.0, help="max requests per second (0 disables the limit)")
+    parser.add_argument('--burst', type=float, default=1.0, help="token bucket capacity")
+    parser.add_argument('--max-rate', type=float, default=None,
+                        help="ceiling the rate recovers to after 429/5xx (default --rate, 0 for none)")
+    parser.add_argument('--shared-limiter', nargs='?', const=DEFAULT_LIMITER_DIR, default=None,
+                        help=f"draw from the cross-process rate limiter in this directory (default {DEFAULT_LIMITER_DIR}), "
+                             "shared with the spider")
+    parser.add_argument('--retries', type=int, default=3, help="retries for 429/5xx and connection errors")
+    parser.add_argument('--backoff', type=float, default=1.0, help="exponential backoff factor in seconds")
+    parser.add_argument('--refresh', action='store_true',
+                        help="revalidate existing files with ETag/Last-Modified instead of skipping them")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
     categories = {1: "passenger_car", 7: "bus"}
-    brands_file = "data/car_brands.json"
-    models_dir = "data/vehicle_models"
+    brands_file = os.path.join(args.data_dir, "car_brands.json")
+    models_dir = os.path.join(args.data_dir, "vehicle_models")
+    http_cache_file = os.path.join(models_dir, HTTP_CACHE_FILE)
 
     os.makedirs(models_dir, exist_ok=True)
 
+    session = make_session(pool_size=max(args.concurrency, 1), retries=args.retries, backoff_factor=args.backoff)
+    bucket = open_bucket(PAGES_ENDPOINT, args.rate, args.burst, min(1.0, args.rate),
+                         args.max_rate if args.max_rate is not None else args.rate, args.shared_limiter)
+    http_cache = (load_json(http_cache_file) or {}) if file_exists(http_cache_file) else {}
+
     all_brands = {}
+    model_jobs = []
 
     for category, category_name in categories.items():
-        brands_url = f"https://auto.ria.com/demo/api/categories/{category}/brands/_active/_with_count/_with_country?langId=4"
-        category_brands_file = f"data/{category_name}_brands.json"
+        brands_url = f"{args.base_url}/demo/api/categories/{category}/brands/_active/_with_count/_with_country?langId=4"
+        category_brands_file = os.path.join(args.data_dir, f"{category_name}_brands.json")
 
-        if not file_exists(category_brands_file):
-            brands_data = download_and_save_json(brands_url, category_brands_file)
+        if not file_exists(category_brands_file) or args.refresh:
+            brands_data = download_and_save_json(brands_url, category_brands_file, session, bucket, http_cache)
         else:
             print(f"Using existing file: {category_brands_file}")
             brands_data = load_json(category_brands_file)
@@ -73,24 +158,35 @@ def main():
                     all_brands[brand_name] = {"value": brand_value, "categories": []}
                 all_brands[brand_name]["categories"].append(category_name)
 
-                models_url = f"https://auto.ria.com/api/categories/{category}/marks/{brand_value}/models/_active/_with_count?langId=4"
+                models_url = f"{args.base_url}/api/categories/{category}/marks/{brand_value}/models/_active/_with_count?langId=4"
                 sanitized_brand_name = sanitize_filename(brand_name)
                 models_file = os.path.join(models_dir, f"{sanitized_brand_name}_{category_name}_models.json")
-                
-                if file_exists(models_file):
+
+                if file_exists(models_file) and not args.refresh:
                     print(f"Skipping existing file: {models_file}")
-                    models_data = load_json(models_file)
                 else:
-                    models_data = download_and_save_json(models_url, models_file)
-                    time.sleep(1)  # Delay to avoid overloading the server
+                    model_jobs.append((models_url, models_file))
+
+    # Model lists are fetched concurrently over the pooled session; the token
+    # bucket (shared with other processes with --shared-limiter) replaces the
+    # fixed one second sleep between requests
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(args.concurrency, 1)) as executor:
+        futures = [executor.submit(download_and_save_json, url, filename, session, bucket, http_cache)
+                   for url, filename in model_jobs]
+        for future in as_completed(futures):
+            if future.result() is None:
+                failed += 1
+
+    bucket.close()
 
-                if models_data:
-                    for model in models_data:
-                        model['vehicle_type'] = category_name
+    with open(http_cache_file, 'w', encoding='utf-8') as f:
+        json.dump(http_cache, f, ensure_ascii=False, indent=2)
 
     # Save the combined brands data
     with open(brands_file, 'w', encoding='utf-8') as f:
         json.dump(all_brands, f, ensure_ascii=False, indent=2)
+    print(f"Fetched {len(model_jobs) - failed} of {len(model_jobs)} model lists")
     print(f"Combined brands data saved to: {brands_file}")
 
 if __name__ == "__main__":
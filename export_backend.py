@@ -0,0 +1,169 @@
+import ast
+import atexit
+import fcntl
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from image_inference import BatchBuffer, letterbox, weights_version
+
+DEFAULT_EXPORT_DIR = 'data/exported_models'
+
+# Same as the default `conf` of YOLO predict, so the exported detector sees
+# the same candidate boxes as the eager one
+DETECT_CONFIDENCE = 0.25
+
+def _import_onnxruntime():
+    try:
+        import onnxruntime
+    except ImportError:
+        raise RuntimeError("The onnx backend requires the 'onnxruntime' package (pip install onnx onnxruntime)")
+    return onnxruntime
+
+def resolve_weights(weights):
+    # Resolves (and downloads) names like 'yolov8n.pt' to a local file
+    if os.path.isfile(weights):
+        return weights
+    from ultralytics import YOLO
+    return YOLO(weights).ckpt_path or weights
+
+def _export(weights, imgsz, backend, calibration_data, directory):
+    # ultralytics writes the export next to the weights file, so export a
+    # copy in a directory of our own where concurrent workers can't collide
+    from ultralytics import YOLO
+
+    local = weights
+    if os.path.isfile(weights):
+        local = os.path.join(directory, os.path.basename(weights))
+        shutil.copy2(weights, local)
+    if backend == 'onnx':
+        return YOLO(local).export(format='onnx', imgsz=imgsz, dynamic=True)
+    # INT8 needs a calibration dataset YAML (ultralytics `data=`), e.g. a few hundred listing photos
+    return YOLO(local).export(format='openvino', imgsz=imgsz, dynamic=True, int8=backend == 'openvino-int8',
+                              data=calibration_data)
+
+def export_model(weights, imgsz, backend='onnx', export_dir=DEFAULT_EXPORT_DIR, calibration_data=None):
+    """
+    Export YOLO weights once and cache the result under export_dir, keyed by
+    the weights' content hash and input size. Workers exporting the same
+    model wait on a lock file and reuse the first one's export. Weights
+    whose hash can't be known (not a local file even after ultralytics
+    resolves the name) are exported for this process only and not cached.
+    Returns the path of the .onnx file or OpenVINO model directory.
+    """
+    weights = resolve_weights(weights)
+    name = os.path.splitext(os.path.basename(weights))[0]
+    version = weights_version(weights)
+    # ultralytics recognizes OpenVINO models by the _openvino_model directory suffix
+    suffix = {'onnx': '.onnx', 'openvino': '_openvino_model', 'openvino-int8': '-int8_openvino_model'}[backend]
+    os.makedirs(export_dir, exist_ok=True)
+    if version is None:
+        directory = tempfile.mkdtemp(prefix=f"{name}-", dir=export_dir)
+        atexit.register(shutil.rmtree, directory, ignore_errors=True)
+        return _export(weights, imgsz, backend, calibration_data, directory)
+
+    target = os.path.join(export_dir, f"{name}-{version}-{imgsz}{suffix}")
+    if os.path.exists(target):
+        return target
+    with open(target + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.exists(target):
+            return target
+        with tempfile.TemporaryDirectory(prefix=f"{name}-", dir=export_dir) as directory:
+            os.replace(_export(weights, imgsz, backend, calibration_data, directory), target)
+    return target
+
+class _Probs:
+    # The parts of ultralytics' Probs the validators use
+    def __init__(self, probs):
+        self.data = probs
+        self.top1 = int(probs.argmax())
+        self.top1conf = probs[self.top1]
+
+class _Boxes:
+    def __init__(self, cls, conf):
+        self.cls = cls
+        self.conf = conf
+
+class _Result:
+    def __init__(self, names, probs=None, boxes=None):
+        self.names = names
+        self.probs = probs
+        self.boxes = boxes
+
+class OnnxModel:
+    """
+    YOLO classifier or detector exported to ONNX, run with ONNX Runtime on
+    `threads` intra-op threads. Called like a YOLO model with a list of BGR
+    images or a letterboxed (N, 3, imgsz, imgsz) tensor and returns objects
+    with the `probs` (top1, top1conf, data) or `boxes` (cls, conf) the
+    validators read. Detector outputs are not NMS-filtered: each anchor
+    whose best class scores above DETECT_CONFIDENCE counts as a box, which
+    gives the same "any car box above the threshold" verdicts.
+    """
+
+    def __init__(self, path, threads=None):
+        ort = _import_onnxruntime()
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.task = metadata.get('task', 'detect')
+        self.names = ast.literal_eval(metadata['names']) if 'names' in metadata else {}
+        self.buffer = None
+
+    def to(self, device):
+        # CPU only; kept for call sites written against YOLO models
+        return self
+
+    def _prepare(self, images, imgsz):
+        import torch
+        if isinstance(images, torch.Tensor):
+            return images.numpy()
+        fit = 'short' if self.task == 'classify' else 'long'
+        if self.buffer is None or len(self.buffer.array) < len(images) or self.buffer.array.shape[-1] != imgsz:
+            self.buffer = BatchBuffer(len(images), imgsz)
+        return self.buffer.fill([letterbox(img, imgsz, fit) for img in images]).numpy()
+
+    def __call__(self, images, imgsz=640, device=None, verbose=False):
+        import torch
+        output = self.session.run(None, {self.input_name: self._prepare(images, imgsz)})[0]
+        if self.task == 'classify':
+            return [_Result(self.names, probs=_Probs(torch.from_numpy(probs))) for probs in output]
+
+        results = []
+        for prediction in output:
+            # (4 + classes, anchors): box, then per-class scores
+            scores = prediction[4:]
+            best = scores.argmax(axis=0)
+            best_scores = scores[best, np.arange(scores.shape[1])]
+            keep = best_scores > DETECT_CONFIDENCE
+            results.append(_Result(self.names, boxes=_Boxes(torch.from_numpy(best[keep]).float(),
+                                                            torch.from_numpy(best_scores[keep]))))
+        return results
+
+def load_backend_model(weights, imgsz, backend='torch', threads=None, export_dir=DEFAULT_EXPORT_DIR,
+                       calibration_data=None):
+    """
+    A model for BatchInference: the eager YOLO model, or an exported copy
+    (ONNX through ONNX Runtime, OpenVINO through ultralytics) that is
+    exported on first use and cached on disk.
+    """
+    from ultralytics import YOLO
+
+    if backend == 'torch':
+        return YOLO(weights)
+    weights = resolve_weights(weights)
+    path = export_model(weights, imgsz, backend, export_dir, calibration_data)
+    if backend == 'onnx':
+        model = OnnxModel(path, threads)
+    else:
+        model = YOLO(path, task=YOLO(weights).task)
+    # The weights it was exported from, for image_inference.loaded_weights_version
+    model.ckpt_path = weights
+    return model
@@ -0,0 +1,171 @@
+import argparse
+import logging
+import math
+import re
+
+from car_scraper.items import CarItem
+from car_scraper.records import iter_records
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+NUMBER_RE = re.compile(r'\d+(?:[.,]\d+)?')
+
+# Fields added by process_vehicles.py on top of the spider's CarItem
+ENRICHED_FIELDS = ('VehicleType',)
+PARTITION_FIELDS = ('Brand', 'Year')
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+    except ImportError:
+        raise RuntimeError("Columnar export requires the 'pyarrow' package (pip install pyarrow)")
+    return pyarrow, pyarrow.dataset
+
+def parse_int(value):
+    """
+    "45 000" / "45000" / 45000 / 45000.0 / "45000.0" -> 45000; booleans,
+    NaN and anything without digits -> None.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return round(value) if math.isfinite(value) else None
+    text = re.sub(r'\s', '', str(value))
+    try:
+        number = float(text)
+    except ValueError:
+        # "45,000", "45000 грн": keep the digits
+        digits = re.sub(r'\D', '', text)
+        return int(digits) if digits else None
+    return round(number) if math.isfinite(number) else None
+
+def parse_mileage(value):
+    # The spider already expands "45 тис. км" to "45000", older dumps may not
+    if isinstance(value, str) and 'тис' in value:
+        number = NUMBER_RE.search(value)
+        return round(float(number.group().replace(',', '.')) * 1000) if number else None
+    return parse_int(value)
+
+def parse_float(value):
+    """
+    "1.6 л" / "1,6" / 1.6 / "1e3" -> float; booleans, NaN, infinities and
+    anything without a number -> None.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if math.isfinite(value) else None
+    try:
+        number = float(re.sub(r'\s', '', str(value)))
+    except ValueError:
+        # "1,6", "1.6 л": take the first number
+        number = NUMBER_RE.search(str(value))
+        return float(number.group().replace(',', '.')) if number else None
+    return number if math.isfinite(number) else None
+
+NUMERIC_PARSERS = {
+    'Price': parse_int,
+    'Mileage': parse_mileage,
+    'Year': parse_int,
+    'EngineVolume': parse_float,
+}
+
+def listing_schema():
+    """
+    Arrow schema for a listing: every CarItem field plus the enrichment
+    fields, with Price/Mileage/Year/EngineVolume as numbers and the rest as
+    strings.
+    """
+    pa, _ = _import_pyarrow()
+    types = {'Price': pa.int64(), 'Mileage': pa.int64(), 'Year': pa.int32(), 'EngineVolume': pa.float64()}
+    names = list(CarItem.fields) + [field for field in ENRICHED_FIELDS if field not in CarItem.fields]
+    return pa.schema([(name, types.get(name, pa.string())) for name in names])
+
+def to_row(record, field_names):
+    row = {}
+    for name in field_names:
+        value = record.get(name)
+        parser = NUMERIC_PARSERS.get(name)
+        if parser:
+            value = parser(value)
+        elif value is not None and not isinstance(value, str):
+            value = str(value)
+        row[name] = value
+    return row
+
+def iter_record_batches(records, schema, batch_size=50000):
+    pa, _ = _import_pyarrow()
+    rows = []
+    for record in records:
+        rows.append(to_row(record, schema.names))
+        if len(rows) >= batch_size:
+            yield pa.RecordBatch.from_pylist(rows, schema=schema)
+            rows = []
+    if rows:
+        yield pa.RecordBatch.from_pylist(rows, schema=schema)
+
+def export_listings(records, output_dir, batch_size=50000, compression='zstd', row_group_size=100000):
+    """
+    Write listing records into a Parquet dataset under output_dir,
+    hive-partitioned as Brand=<brand>/Year=<year>/. Records are converted
+    in batches, so the input is streamed rather than loaded. Returns the
+    number of rows written.
+    """
+    pa, ds = _import_pyarrow()
+    schema = listing_schema()
+    partition_schema = pa.schema([schema.field(name) for name in PARTITION_FIELDS])
+    written = 0
+
+    def counted(batches):
+        nonlocal written
+        for batch in batches:
+            written += batch.num_rows
+            yield batch
+
+    ds.write_dataset(
+        counted(iter_record_batches(records, schema, batch_size)),
+        output_dir,
+        schema=schema,
+        format='parquet',
+        partitioning=ds.partitioning(partition_schema, flavor='hive'),
+        existing_data_behavior='delete_matching',
+        file_options=ds.ParquetFileFormat().make_write_options(compression=compression),
+        max_rows_per_group=row_group_size,
+        min_rows_per_group=min(row_group_size, batch_size),
+    )
+    return written
+
+def open_listings(output_dir):
+    """
+    Open an exported dataset. Filters on Brand/Year prune whole partition
+    directories; filters on other columns (e.g. Price) use the Parquet
+    row-group statistics to skip data, e.g.
+
+        open_listings('data/listings').to_table(
+            columns=['Model', 'Price'],
+            filter=(ds.field('Brand') == 'BMW') & (ds.field('Year') >= 2015))
+    """
+    pa, ds = _import_pyarrow()
+    schema = listing_schema()
+    partition_schema = pa.schema([schema.field(name) for name in PARTITION_FIELDS])
+    return ds.dataset(output_dir, format='parquet', partitioning=ds.partitioning(partition_schema, flavor='hive'))
+
+def main():
+    parser = argparse.ArgumentParser(description="Export listings to a Parquet dataset partitioned by Brand/Year.")
+    parser.add_argument('--input', default='data/cars_with_brands_and_models.json',
+                        help="JSON array or JSON Lines (.jsonl[.gz|.zst]) listings")
+    parser.add_argument('--output-dir', default='data/listings_parquet')
+    parser.add_argument('--batch-size', type=int, default=50000, help="records converted per Arrow batch")
+    parser.add_argument('--row-group-size', type=int, default=100000, help="max rows per Parquet row group")
+    parser.add_argument('--compression', default='zstd', help="Parquet codec (zstd, snappy, gzip, none)")
+    args = parser.parse_args()
+
+    written = export_listings(iter_records(args.input), args.output_dir, args.batch_size, args.compression,
+                              args.row_group_size)
+    logging.info(f"Exported {written} listings to '{args.output_dir}'")
+
+if __name__ == "__main__":
+    main()
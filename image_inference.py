@@ -0,0 +1,641 @@
+import hashlib
+import importlib
+import multiprocessing
+import os
+import queue
+import shutil
+import threading
+import time
+import traceback
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+from tqdm import tqdm
+
+from validation_results import DEFAULT_RESULTS_DB, ResultsStore, filter_unscored, image_key, iter_image_keys
+
+# torch and ultralytics take seconds to import, so they are imported on
+# first use: importing a validator module stays cheap
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# Inference backends: eager PyTorch, or an exported copy of the weights (export_backend.py)
+BACKENDS = ('torch', 'onnx', 'openvino', 'openvino-int8')
+
+# Car-related ImageNet classes, shared by the classifier and the cascade
+IMAGENET_CAR_CLASSES = {
+    436: 'beach_wagon, station_wagon, wagon, estate_car, beach_waggon, station_waggon, waggon',
+    511: 'convertible',
+    581: 'grille, radiator grille',
+    609: 'jeep, landrover',
+    627: 'limousine, limo',
+    656: 'minivan',
+    705: 'passenger_car, coach, carriage',
+    717: 'pickup, pickup_truck',
+    751: 'racer, race_car, racing_car',
+    817: 'sports_car, sport_car',
+    864: 'tow_truck, tow_car, wrecker',
+    867: 'trailer_truck, tractor_trailer, trucking_rig, rig, articulated_lorry, semi',
+}
+
+def select_device():
+    import torch
+    return torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+_models = {}
+
+def load_model(weights, device=None, backend='torch', imgsz=None, threads=None):
+    """
+    Process-wide model cache: one model per weights file and device (and,
+    for exported backends, input size and thread count), built on first
+    use. backend='torch' returns the ultralytics YOLO model, moved to
+    `device` when one is given; the others come from export_backend.
+    """
+    if backend == 'torch':
+        key = (weights, str(device) if device is not None else None, backend)
+    else:
+        key = (weights, 'cpu', backend, imgsz, threads)
+    if key not in _models:
+        from export_backend import load_backend_model
+        model = load_backend_model(weights, imgsz, backend, threads)
+        if backend == 'torch' and device is not None:
+            model.to(device)
+        _models[key] = model
+    return _models[key]
+
+def weights_version(weights, length=12):
+    """
+    Short sha256 of a weights file, so stored verdicts say exactly which
+    weights produced them.
+    """
+    if not os.path.isfile(weights):
+        return None
+    digest = hashlib.sha256()
+    with open(weights, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:length]
+
+def loaded_weights_version(model, weights):
+    """
+    weights_version of the file a loaded model came from. Call it after
+    load_model: ultralytics resolves names like 'yolov8n.pt' to its
+    weights_dir (downloading them on first use), so hashing the name
+    before loading finds no file on a fresh machine.
+    """
+    path = getattr(model, 'ckpt_path', None)
+    return weights_version(path if path and os.path.isfile(str(path)) else weights)
+
+def iter_image_paths(root_dir):
+    for root, _, files in os.walk(root_dir):
+        for file in files:
+            if file.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(root, file)
+
+def log_error(image_path, error):
+    details = ''.join(traceback.format_exception(type(error), error, error.__traceback__))
+    error_msg = f"Error processing image {image_path}: {str(error)}\n{details}"
+    print(error_msg)
+    with open('error_log.txt', 'a') as f:
+        f.write(error_msg + '\n\n')
+
+# Largest JPEG DCT scale factor first: libjpeg decodes straight to 1/8, 1/4 or 1/2 size
+REDUCED_COLOR_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+# JPEG start-of-frame markers (SOF0-SOF15 without DHT, JPG and DAC)
+SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+LETTERBOX_COLOR = (114, 114, 114)
+
+def jpeg_dimensions(data):
+    """
+    (width, height) from a JPEG's start-of-frame header without decoding
+    it, or None if data isn't a JPEG.
+    """
+    if data[:2] != b'\xff\xd8':
+        return None
+    position = 2
+    while position + 9 <= len(data):
+        if data[position] != 0xFF:
+            position += 1
+            continue
+        marker = data[position + 1]
+        if marker == 0xFF or marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            position += 2 if marker != 0xFF else 1
+            continue
+        if marker in SOF_MARKERS:
+            height = int.from_bytes(data[position + 5:position + 7], 'big')
+            width = int.from_bytes(data[position + 7:position + 9], 'big')
+            return width, height
+        position += 2 + int.from_bytes(data[position + 2:position + 4], 'big')
+    return None
+
+def reduced_decode_flag(width, height, imgsz, fit='long'):
+    # Largest reduction that still leaves the fitted side at least imgsz
+    side = min(width, height) if fit == 'short' else max(width, height)
+    for factor, flag in REDUCED_COLOR_FLAGS:
+        if side // factor >= imgsz:
+            return flag
+    return cv2.IMREAD_COLOR
+
+def load_image(image_path, imgsz, fit='long', data=None):
+    """
+    Decode an image and shrink it towards the model input size so the
+    model's own resize works on a small array. fit='short' scales the
+    shorter side to imgsz (classifier resize + center crop), fit='long'
+    the longer side (detector letterbox). JPEGs are decoded at a reduced
+    DCT scale (IMREAD_REDUCED_*) when they are at least 2x the target.
+    `data` holds the encoded bytes when the image doesn't live in its own
+    file (packed shards).
+    """
+    if data is None:
+        with open(image_path, 'rb') as f:
+            data = f.read()
+    dimensions = jpeg_dimensions(data)
+    flag = reduced_decode_flag(*dimensions, imgsz, fit) if dimensions else cv2.IMREAD_COLOR
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), flag)
+    if img is None:
+        raise ValueError(f"Unable to read image: {image_path}")
+    height, width = img.shape[:2]
+    side = min(height, width) if fit == 'short' else max(height, width)
+    if side > imgsz:
+        scale = imgsz / side
+        img = cv2.resize(img, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+    return img
+
+def letterbox(img, imgsz, fit='long'):
+    """
+    Exact imgsz x imgsz RGB input: fit='short' resizes the shorter side to
+    imgsz and center-crops (classifier), fit='long' resizes the longer side
+    and pads with gray (detector).
+    """
+    height, width = img.shape[:2]
+    side = min(height, width) if fit == 'short' else max(height, width)
+    if side != imgsz:
+        scale = imgsz / side
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        img = cv2.resize(img, size, interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+        height, width = img.shape[:2]
+    if fit == 'short':
+        top = (height - imgsz) // 2
+        left = (width - imgsz) // 2
+        img = img[top:top + imgsz, left:left + imgsz]
+    else:
+        top = (imgsz - height) // 2
+        left = (imgsz - width) // 2
+        img = cv2.copyMakeBorder(img, top, imgsz - height - top, left, imgsz - width - left,
+                                 cv2.BORDER_CONSTANT, value=LETTERBOX_COLOR)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+class BatchBuffer:
+    """
+    Reusable float32 (batch, 3, imgsz, imgsz) array that letterboxed uint8
+    images are normalized into, so each batch reuses the same memory
+    instead of stacking a fresh array.
+    """
+
+    def __init__(self, batch_size, imgsz):
+        self.array = np.empty((batch_size, 3, imgsz, imgsz), dtype=np.float32)
+
+    def fill(self, images):
+        import torch
+        for slot, img in zip(self.array, images):
+            np.multiply(img.transpose(2, 0, 1), np.float32(1 / 255), out=slot)
+        return torch.from_numpy(self.array[:len(images)])
+
+_DONE = object()
+
+class BatchInference:
+    """
+    Decode images on a pool of producer threads into a bounded queue and run
+    them through the model in batches from a single consumer, so decoding
+    overlaps inference and the model is only ever called from one thread.
+    With a `reader` (image_shards.ShardReader) paths are read through it.
+    With letterbox=True the decode threads also produce exact model-size
+    inputs and batches go to the model as one normalized tensor from a
+    preallocated BatchBuffer, skipping the model's own preprocessing.
+    """
+
+    def __init__(self, model, imgsz, fit='long', batch_size=16, decode_workers=4, queue_size=None, device=None,
+                 reader=None, letterbox=False):
+        self.model = model
+        self.imgsz = imgsz
+        self.fit = fit
+        self.batch_size = batch_size
+        self.decode_workers = decode_workers
+        self.queue_size = queue_size or batch_size * 4
+        self.device = device
+        self.reader = reader
+        self.letterbox = letterbox
+        self.buffer = BatchBuffer(batch_size, imgsz) if letterbox else None
+        self.images = 0
+        self.elapsed = 0.0
+
+    def _produce(self, paths, paths_lock, out_queue):
+        while True:
+            with paths_lock:
+                image_path = next(paths, None)
+            if image_path is None:
+                break
+            try:
+                data = self.reader.read(image_path) if self.reader is not None else None
+                img = load_image(image_path, self.imgsz, self.fit, data)
+                if self.letterbox:
+                    img = letterbox(img, self.imgsz, self.fit)
+                out_queue.put((image_path, img, None))
+            except Exception as e:
+                out_queue.put((image_path, None, e))
+        out_queue.put(_DONE)
+
+    def _predict(self, batch):
+        images = [img for _, img in batch]
+        if self.buffer is not None:
+            images = self.buffer.fill(images)
+        return self.model(images, imgsz=self.imgsz, device=self.device, verbose=False)
+
+    def run(self, image_paths):
+        """
+        Yield (image_path, result, error) for every path; result is the
+        model's Results object, error is set when decoding or inference failed.
+        """
+        out_queue = queue.Queue(maxsize=self.queue_size)
+        paths = iter(image_paths)
+        paths_lock = threading.Lock()
+        producers = [threading.Thread(target=self._produce, args=(paths, paths_lock, out_queue), daemon=True)
+                     for _ in range(self.decode_workers)]
+        start = time.time()
+        for producer in producers:
+            producer.start()
+
+        running = len(producers)
+        batch = []
+        while running:
+            item = out_queue.get()
+            if item is _DONE:
+                running -= 1
+            else:
+                image_path, img, error = item
+                if error is not None:
+                    yield image_path, None, error
+                else:
+                    batch.append((image_path, img))
+
+            if batch and (len(batch) >= self.batch_size or not running):
+                try:
+                    results = self._predict(batch)
+                except Exception as e:
+                    for image_path, _ in batch:
+                        yield image_path, None, e
+                else:
+                    for (image_path, _), result in zip(batch, results):
+                        yield image_path, result, None
+                self.images += len(batch)
+                batch = []
+                self.elapsed = time.time() - start
+
+        self.elapsed = time.time() - start
+
+    @property
+    def images_per_second(self):
+        return self.images / self.elapsed if self.elapsed else 0.0
+
+def move_to_verdict_dir(image_path, car_detected, valid_dir, invalid_dir, root_dir='data/pictures'):
+    # Keep the same subfolder structure in the valid or invalid directory
+    rel_path = os.path.relpath(image_path, root_dir)
+    new_dir = os.path.join(valid_dir if car_detected else invalid_dir, os.path.dirname(rel_path))
+    os.makedirs(new_dir, exist_ok=True)
+    new_path = os.path.join(new_dir, os.path.basename(image_path))
+    shutil.move(image_path, new_path)
+    return new_path
+
+def cleanup_empty_dirs(path):
+    for root, dirs, files in os.walk(path, topdown=False):
+        for dir in dirs:
+            dir_path = os.path.join(root, dir)
+            if not os.listdir(dir_path):  # check if directory is empty
+                os.rmdir(dir_path)
+                print(f"Removed empty directory: {dir_path}")
+
+class ValidationRun:
+    """
+    Everything a validator's validate_paths does besides deciding
+    verdicts. Opens the results store and picks the images to run (with
+    incremental=True those already scored by the same model version and
+    threshold under an unchanged image key are skipped). record() stores a
+    verdict, after moving the image into valid_dir/invalid_dir with
+    move=True, and error() logs a failed image. Either way a failure only
+    costs that image, which counts as invalid. With content_store the
+    paths are unique blobs and each verdict is recorded for every car ID
+    using the blob. With shards the paths are members of the packed shards
+    in that directory, read through memory maps. A backend other than
+    'torch' runs on the CPU and always letterboxes. Use it as a context
+    manager so the store and the shard reader are closed.
+    """
+
+    def __init__(self, image_paths, model_name, model_version, threshold, root_dir='data/pictures',
+                 valid_dir='data/valid_pictures', invalid_dir='data/invalid_pictures', results_db=DEFAULT_RESULTS_DB,
+                 move=False, incremental=False, key_mode='stat', content_store=None, shards=None, letterbox=False,
+                 backend='torch', device=None):
+        self.model_name = model_name
+        self.model_version = model_version
+        self.threshold = threshold
+        self.root_dir = root_dir
+        self.valid_dir = valid_dir
+        self.invalid_dir = invalid_dir
+        self.move = move
+        self.letterbox = letterbox or backend != 'torch'
+        self.device = device if backend == 'torch' else None
+        self.valid_count = 0
+        self.invalid_count = 0
+        self.errors = 0
+
+        self.car_ids = None
+        if content_store:
+            if move:
+                raise ValueError("move is not supported for a content store, use validation_results.py export")
+            from image_store import content_store_car_ids
+            self.car_ids = content_store_car_ids(content_store, image_paths)
+            image_paths = [image_path for image_path in image_paths if self.car_ids[image_path]]
+        if shards and move:
+            raise ValueError("move is not supported for packed shards, use image_shards.py unpack first")
+        if move:
+            os.makedirs(valid_dir, exist_ok=True)
+            os.makedirs(invalid_dir, exist_ok=True)
+
+        self.reader = None
+        self.store = None
+        try:
+            if shards:
+                from image_shards import ShardReader
+                self.reader = ShardReader(shards)
+            key_func = self.reader.image_key if self.reader is not None else image_key
+            self.store = ResultsStore(results_db)
+            if incremental:
+                pending, skipped = filter_unscored(image_paths, self.store, model_name, model_version, threshold,
+                                                   key_mode, car_ids=self.car_ids, key_func=key_func)
+                print(f"Incremental run: {len(pending)} new or changed images, {skipped} already scored")
+            else:
+                pending = list(iter_image_keys(image_paths, key_mode, key_func))
+        except BaseException:
+            self.close()
+            raise
+        self.image_keys = dict(pending)
+        if self.car_ids is not None:
+            listings = sum(len(self.car_ids[image_path]) for image_path in self.image_keys)
+            print(f"Content store: {len(self.image_keys)} unique images for {listings} listings, "
+                  f"{listings - len(self.image_keys)} inference calls saved")
+
+    def inference(self, model, imgsz, fit, batch_size, decode_workers=4, queue_size=None):
+        return BatchInference(model, imgsz, fit, batch_size, decode_workers, queue_size, self.device,
+                              reader=self.reader, letterbox=self.letterbox)
+
+    def results(self, engine, desc, image_paths=None):
+        """
+        (image_path, result) for every image engine decoded and ran, over
+        image_paths (default: the images picked for this run); failed
+        images go to error().
+        """
+        image_paths = self.image_keys if image_paths is None else image_paths
+        for image_path, result, error in tqdm(engine.run(image_paths), total=len(image_paths), desc=desc):
+            if error is not None:
+                self.error(image_path, error)
+                continue
+            yield image_path, result
+
+    def error(self, image_path, error):
+        log_error(image_path, error)
+        self.errors += 1
+        self.invalid_count += 1
+
+    def record(self, image_path, car_detected, class_id, class_name, confidence):
+        """
+        Store the verdict for every listing using the image. Returns where
+        the image is now, or None when moving or recording it failed.
+        """
+        car_ids = self.car_ids[image_path] if self.car_ids is not None else [None]
+        try:
+            stored_path = image_path
+            if self.move:
+                stored_path = move_to_verdict_dir(image_path, car_detected, self.valid_dir, self.invalid_dir,
+                                                  self.root_dir)
+            for car_id in car_ids:
+                self.store.record(stored_path, car_detected, class_id, class_name, confidence, self.model_name,
+                                  self.model_version, self.threshold, self.image_keys[image_path], car_id)
+        except Exception as e:
+            self.error(image_path, e)
+            return None
+        if car_detected:
+            self.valid_count += len(car_ids)
+        else:
+            self.invalid_count += len(car_ids)
+        return stored_path
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def validate_tree(validate_paths, root_dir='data/pictures', content_store=None, shards=None, **options):
+    """
+    A validator's process_images: run its validate_paths over every image
+    under root_dir (or every blob of content_store, or every member of the
+    shards), then remove the directories --move emptied. Returns (valid,
+    invalid).
+    """
+    if shards:
+        from image_shards import ShardReader
+        with ShardReader(shards) as reader:
+            image_paths = list(reader.iter_paths())
+    else:
+        image_paths = list(iter_image_paths(content_store or root_dir))
+    valid_count, invalid_count = validate_paths(image_paths, root_dir=root_dir, content_store=content_store,
+                                                shards=shards, **options)
+    if options.get('move'):
+        cleanup_empty_dirs(root_dir)
+    return valid_count, invalid_count
+
+def parse_shard(value):
+    """
+    Parse '--shard i/N' into (i, N).
+    """
+    index, count = (int(part) for part in value.split('/'))
+    if not 0 <= index < count:
+        raise ValueError(f"Invalid shard {value}: expected i/N with 0 <= i < N")
+    return index, count
+
+def list_prefix_dirs(root_dir):
+    """
+    Relative xx/yy/zz leaf directories of the data/pictures fanout.
+    """
+    level = ['']
+    for _ in range(3):
+        next_level = []
+        for rel_dir in level:
+            try:
+                entries = os.scandir(os.path.join(root_dir, rel_dir))
+            except FileNotFoundError:
+                continue
+            with entries:
+                next_level.extend(os.path.join(rel_dir, entry.name) for entry in entries if entry.is_dir())
+        level = next_level
+    return sorted(level)
+
+def shard_key(prefix_dir):
+    digits = prefix_dir.replace(os.sep, '')
+    return int(digits) if digits.isdigit() else zlib.crc32(digits.encode('utf-8'))
+
+def select_shard(prefix_dirs, index, count):
+    # Stable across machines as long as they see the same ID prefixes
+    return [prefix_dir for prefix_dir in prefix_dirs if shard_key(prefix_dir) % count == index]
+
+def iter_prefix_dir_images(root_dir, prefix_dirs):
+    for prefix_dir in prefix_dirs:
+        directory = os.path.join(root_dir, prefix_dir)
+        try:
+            names = sorted(os.listdir(directory))
+        except FileNotFoundError:
+            continue
+        for name in names:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(directory, name)
+
+def cleanup_prefix_dirs(root_dir, prefix_dirs):
+    # Only touch this shard's directories; other shards may still be running
+    for prefix_dir in prefix_dirs:
+        path = os.path.join(root_dir, prefix_dir)
+        while path != root_dir and os.path.isdir(path) and not os.listdir(path):
+            try:
+                os.rmdir(path)
+            except OSError:
+                break
+            print(f"Removed empty directory: {path}")
+            path = os.path.dirname(path)
+
+def _init_shard_worker(torch_threads):
+    import torch
+    torch.set_num_threads(torch_threads)
+    torch.set_num_interop_threads(1)
+
+def _validate_prefix_dirs(module_name, root_dir, prefix_dirs, options):
+    # The validator's model is loaded on first use and cached for the life of this process
+    validator = importlib.import_module(module_name)
+    if options.get('shards'):
+        # Packed images: the work units are shard files instead of directories
+        from image_shards import ShardReader
+        with ShardReader(options['shards']) as reader:
+            image_paths = list(reader.iter_paths(prefix_dirs))
+    else:
+        image_paths = list(iter_prefix_dir_images(root_dir, prefix_dirs))
+    return validator.validate_paths(image_paths, root_dir=root_dir, **options)
+
+def run_sharded(module_name, root_dir, shard=(0, 1), workers=1, torch_threads=None, **options):
+    """
+    Validate this machine's shard of the xx/yy/zz prefix directories (or
+    of the tar shards with options['shards']) across `workers` processes,
+    each with its own model and `torch_threads` intra-op threads.
+    `module_name` must expose validate_paths(). Returns the merged
+    (valid, invalid) counts.
+    """
+    if options.get('shards'):
+        from image_shards import ShardReader
+        with ShardReader(options['shards']) as reader:
+            prefix_dirs = select_shard(reader.shards(), *shard)
+    else:
+        prefix_dirs = select_shard(list_prefix_dirs(root_dir), *shard)
+    workers = max(1, min(workers, len(prefix_dirs)))
+    torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // workers)
+    if options.get('backend', 'torch') != 'torch' and not options.get('backend_threads'):
+        # Exported models get the same per-worker share of the cores
+        options['backend_threads'] = torch_threads
+    groups = [prefix_dirs[i::workers] for i in range(workers)]
+    units = 'shard files' if options.get('shards') else 'prefix directories'
+    print(f"Shard {shard[0]}/{shard[1]}: {len(prefix_dirs)} {units}, "
+          f"{workers} worker processes x {torch_threads} torch threads")
+
+    valid_count = 0
+    invalid_count = 0
+    start = time.time()
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_shard_worker, initargs=(torch_threads,)) as executor:
+        futures = [executor.submit(_validate_prefix_dirs, module_name, root_dir, group, options)
+                   for group in groups if group]
+        for future in futures:
+            valid, invalid = future.result()
+            valid_count += valid
+            invalid_count += invalid
+
+    total = valid_count + invalid_count
+    print(f"Shard throughput: {total / max(time.time() - start, 1e-9):.1f} images/sec")
+    if options.get('move'):
+        cleanup_prefix_dirs(root_dir, prefix_dirs)
+    return valid_count, invalid_count
+
+def add_arguments(parser, batch_size=16, decode_workers=4):
+    parser.add_argument('--root-dir', default='data/pictures')
+    parser.add_argument('--valid-dir', default='data/valid_pictures')
+    parser.add_argument('--invalid-dir', default='data/invalid_pictures')
+    parser.add_argument('--batch-size', type=int, default=batch_size, help="images per inference call")
+    parser.add_argument('--decode-workers', type=int, default=decode_workers, help="image decode/resize threads")
+    parser.add_argument('--queue-size', type=int, default=None, help="decoded images buffered ahead of inference")
+    parser.add_argument('--letterbox', action='store_true',
+                        help="letterbox/crop in the decode threads and feed preallocated normalized batches to the model")
+    parser.add_argument('--device', default=None, help="torch device, e.g. cpu or cuda:0 (default: cuda if available)")
+    parser.add_argument('--backend', choices=BACKENDS, default='torch',
+                        help="run eager PyTorch or a copy of the weights exported once to ONNX Runtime / OpenVINO "
+                             "(CPU; implies --letterbox)")
+    parser.add_argument('--backend-threads', type=int, default=None,
+                        help="ONNX Runtime intra-op threads (default: all cores, or cores / workers when sharded)")
+    parser.add_argument('--results-db', default='data/validation_results.sqlite3', help="verdicts store (SQLite)")
+    parser.add_argument('--move', action='store_true',
+                        help="also sort images into the valid/invalid directories (the old behaviour)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="skip images already scored with the same weights, threshold and image key")
+    parser.add_argument('--key', dest='key_mode', choices=('stat', 'hash'), default='stat',
+                        help="image key: size+mtime (stat) or sha256 of the content (hash)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="worker processes, each with its own model, splitting the xx/yy/zz prefix directories")
+    parser.add_argument('--torch-threads', type=int, default=None, help="intra-op threads per worker (default: cores / workers)")
+    parser.add_argument('--shard', type=parse_shard, default=None,
+                        help="only process prefix directories of shard i/N, to split a run across machines")
+    parser.add_argument('--shards', default=None,
+                        help="validate images packed by image_shards.py / download_images.py --shards in this directory")
+    parser.add_argument('--content-store', default=None,
+                        help="validate a content-addressed store (download_images.py --content-store) instead of "
+                             "--root-dir: one inference per unique image, verdicts recorded for every listing using it")
+    return parser
+
+def validator_options(args):
+    """
+    Keyword arguments for a validator's process_images/validate_paths (and
+    run_sharded) from the parsed add_arguments() namespace.
+    """
+    return {
+        'valid_dir': args.valid_dir,
+        'invalid_dir': args.invalid_dir,
+        'batch_size': args.batch_size,
+        'decode_workers': args.decode_workers,
+        'queue_size': args.queue_size,
+        'letterbox': args.letterbox,
+        'device': args.device,
+        'backend': args.backend,
+        'backend_threads': args.backend_threads,
+        'results_db': args.results_db,
+        'move': args.move,
+        'incremental': args.incremental,
+        'key_mode': args.key_mode,
+        'content_store': args.content_store,
+        'shards': args.shards,
+    }
@@ -0,0 +1,342 @@
+import argparse
+import hashlib
+import io
+import mmap
+import os
+import re
+import sqlite3
+import tarfile
+import threading
+import time
+
+DEFAULT_SHARD_DIR = 'data/shards'
+INDEX_NAME = 'index.sqlite3'
+SHARD_NAME_RE = re.compile(r'^images-(\d+)\.tar$')
+ID_FILE_RE = re.compile(r'^(\d+)\.jpg$')
+
+def fanout_path(root_dir, car_id):
+    # Same layout as download_images.get_folder_path
+    padded = str(car_id).zfill(8)
+    return os.path.join(root_dir, padded[:2], padded[2:4], padded[4:6], f"{car_id}.jpg")
+
+def member_path(shard_dir, shard, car_id):
+    """
+    Virtual path of an image inside a shard, <shard_dir>/<shard>.tar/<ID>.jpg.
+    car_id_from_path() works on it like on a real file.
+    """
+    return os.path.join(shard_dir, shard, f"{car_id}.jpg")
+
+class ShardIndex:
+    """
+    SQLite offset index of the images packed into a shard directory: for
+    every car ID the shard file, the byte offset of the JPEG data inside
+    it, its size and sha256. With commit_every=None rows are only
+    committed by commit(), for writers that must make the data durable
+    first.
+    """
+
+    def __init__(self, shard_dir=DEFAULT_SHARD_DIR, commit_every=500):
+        os.makedirs(shard_dir, exist_ok=True)
+        self.commit_every = commit_every
+        self.pending = 0
+        self.conn = sqlite3.connect(os.path.join(shard_dir, INDEX_NAME), check_same_thread=False, timeout=60)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS members (
+                car_id TEXT PRIMARY KEY,
+                shard TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                sha256 TEXT
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS members_shard ON members (shard, offset)')
+        self.conn.commit()
+
+    def add(self, car_id, shard, offset, size, sha256=None):
+        self.conn.execute('INSERT OR REPLACE INTO members (car_id, shard, offset, size, sha256) VALUES (?, ?, ?, ?, ?)',
+                          (str(car_id), shard, offset, size, sha256))
+        self.pending += 1
+        if self.commit_every and self.pending >= self.commit_every:
+            self.commit()
+
+    def known_ids(self, car_ids, chunk_size=500):
+        known = set()
+        car_ids = [str(car_id) for car_id in car_ids]
+        for i in range(0, len(car_ids), chunk_size):
+            chunk = car_ids[i:i + chunk_size]
+            placeholders = ','.join('?' * len(chunk))
+            known.update(row[0] for row in
+                         self.conn.execute(f'SELECT car_id FROM members WHERE car_id IN ({placeholders})', chunk))
+        return known
+
+    def locate(self, car_id):
+        return self.conn.execute('SELECT shard, offset, size, sha256 FROM members WHERE car_id = ?',
+                                 (str(car_id),)).fetchone()
+
+    def shards(self):
+        return [row[0] for row in self.conn.execute('SELECT DISTINCT shard FROM members ORDER BY shard')]
+
+    def iter_members(self, shards=None):
+        """
+        (car_id, shard, offset, size, sha256) in on-disk order, so reading
+        them back is sequential I/O.
+        """
+        for shard in shards if shards is not None else self.shards():
+            yield from self.conn.execute(
+                'SELECT car_id, shard, offset, size, sha256 FROM members WHERE shard = ? ORDER BY offset', (shard,))
+
+    def counts(self):
+        return self.conn.execute('SELECT COUNT(*), COUNT(DISTINCT shard), COALESCE(SUM(size), 0) FROM members').fetchone()
+
+    def commit(self):
+        self.conn.commit()
+        self.pending = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+class ShardWriter:
+    """
+    Append images to large tar shards (images-000000.tar, ... with one
+    <ID>.jpg member each, readable by tar and WebDataset) and record their
+    offsets in the ShardIndex. A new shard is started once the current one
+    reaches max_shard_bytes; existing shards are never reopened. Has the
+    same put()/known_ids() interface as image_store.ContentStore so the
+    downloader can write into either. Safe to share between threads.
+
+    Index rows are committed every commit_every images, and only after
+    the shard file has been flushed and fsynced, so after a crash every
+    indexed car ID points at bytes that are on disk (images written since
+    the last commit are simply downloaded again).
+    """
+
+    def __init__(self, shard_dir=DEFAULT_SHARD_DIR, max_shard_bytes=1 << 30, commit_every=500):
+        self.shard_dir = shard_dir
+        self.max_shard_bytes = max_shard_bytes
+        self.commit_every = commit_every
+        self.index = ShardIndex(shard_dir, commit_every=None)
+        self.lock = threading.Lock()
+        self.file = None
+        self.tar = None
+        self.shard = None
+
+    def _sync(self):
+        # Data first, then the index rows that point at it
+        if self.tar is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        self.index.commit()
+
+    def _close_shard(self):
+        if self.tar is not None:
+            # Writes the end-of-archive blocks
+            self.tar.close()
+            self._sync()
+            self.file.close()
+            self.tar = None
+
+    def _next_shard(self):
+        self._close_shard()
+        numbers = [int(match.group(1)) for match in map(SHARD_NAME_RE.match, os.listdir(self.shard_dir)) if match]
+        self.shard = f"images-{max(numbers, default=-1) + 1:06d}.tar"
+        self.file = open(os.path.join(self.shard_dir, self.shard), 'xb')
+        self.tar = tarfile.open(fileobj=self.file, mode='w', format=tarfile.USTAR_FORMAT)
+
+    def put(self, car_id, data, sha256=None):
+        info = tarfile.TarInfo(f"{car_id}.jpg")
+        info.size = len(data)
+        info.mtime = int(time.time())
+        with self.lock:
+            if self.tar is None or self.file.tell() >= self.max_shard_bytes:
+                self._next_shard()
+            # The data follows the member's header block(s)
+            offset = self.tar.offset + len(info.tobuf(self.tar.format, self.tar.encoding, self.tar.errors))
+            self.tar.addfile(info, io.BytesIO(data))
+            self.index.add(car_id, self.shard, offset, len(data), sha256)
+            if self.index.pending >= self.commit_every:
+                self._sync()
+        return 'stored', sha256
+
+    def has(self, car_id):
+        return bool(self.known_ids([car_id]))
+
+    def known_ids(self, car_ids):
+        with self.lock:
+            return self.index.known_ids(car_ids)
+
+    def close(self):
+        with self.lock:
+            self._close_shard()
+            self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class ShardReader:
+    """
+    Read images back from a shard directory through memory-mapped shard
+    files. iter_paths() lists virtual member paths in on-disk order; read()
+    returns the JPEG bytes of one of them. Safe to share between threads.
+    """
+
+    def __init__(self, shard_dir=DEFAULT_SHARD_DIR):
+        self.shard_dir = shard_dir
+        self.index = ShardIndex(shard_dir)
+        self.lock = threading.Lock()
+        self.maps = {}
+        self.locations = {}
+
+    def shards(self):
+        with self.lock:
+            return self.index.shards()
+
+    def iter_paths(self, shards=None):
+        with self.lock:
+            members = list(self.index.iter_members(shards))
+        for car_id, shard, offset, size, _ in members:
+            path = member_path(self.shard_dir, shard, car_id)
+            self.locations[path] = (shard, offset, size)
+            yield path
+
+    def _locate(self, path):
+        location = self.locations.get(path)
+        if location is None:
+            with self.lock:
+                row = self.index.locate(os.path.splitext(os.path.basename(path))[0])
+            if row is None:
+                raise KeyError(f"Not in shard index: {path}")
+            location = self.locations[path] = row[:3]
+        return location
+
+    def _map(self, shard, remap=False):
+        shard_map = None if remap else self.maps.get(shard)
+        if shard_map is None:
+            with self.lock:
+                shard_map = None if remap else self.maps.get(shard)
+                if shard_map is None:
+                    with open(os.path.join(self.shard_dir, shard), 'rb') as f:
+                        shard_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                        shard_map.madvise(mmap.MADV_SEQUENTIAL)
+                    self.maps[shard] = shard_map
+        return shard_map
+
+    def read(self, path):
+        shard, offset, size = self._locate(path)
+        shard_map = self._map(shard)
+        if offset + size > len(shard_map):
+            # The shard grew since it was mapped (a writer is still appending to it)
+            shard_map = self._map(shard, remap=True)
+            if offset + size > len(shard_map):
+                raise ValueError(f"Shard {shard} ends before {path}: {offset + size} > {len(shard_map)} bytes")
+        return shard_map[offset:offset + size]
+
+    def image_key(self, path, mode='stat'):
+        """
+        Same idea as validation_results.image_key for packed images: the
+        shard position (no reads) or the sha256 of the bytes.
+        """
+        if mode == 'hash':
+            return f"sha256:{hashlib.sha256(self.read(path)).hexdigest()}"
+        shard, offset, size = self._locate(path)
+        return f"shard:{shard}:{offset}:{size}"
+
+    def close(self):
+        with self.lock:
+            for shard_map in self.maps.values():
+                shard_map.close()
+            self.maps = {}
+            self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def pack(root_dir, shard_dir, max_shard_bytes=1 << 30, delete=False):
+    """
+    Pack every <ID>.jpg under root_dir into shards. With delete=True the
+    loose files are removed once all shards are closed. Returns
+    (images packed, bytes packed).
+    """
+    packed = []
+    total_bytes = 0
+    stack = [root_dir]
+    with ShardWriter(shard_dir, max_shard_bytes) as writer:
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    continue
+                match = ID_FILE_RE.match(entry.name)
+                if not match:
+                    continue
+                with open(entry.path, 'rb') as f:
+                    data = f.read()
+                writer.put(match.group(1), data, hashlib.sha256(data).hexdigest())
+                packed.append(entry.path)
+                total_bytes += len(data)
+
+    if delete:
+        for path in packed:
+            os.remove(path)
+        for root, _, _ in os.walk(root_dir, topdown=False):
+            if root != root_dir and not os.listdir(root):
+                os.rmdir(root)
+    return len(packed), total_bytes
+
+def unpack(shard_dir, root_dir):
+    """
+    Write every indexed image back into the root_dir/xx/yy/zz/ID.jpg
+    layout. Returns the number of images written.
+    """
+    written = 0
+    with ShardReader(shard_dir) as reader:
+        for path in reader.iter_paths():
+            target = fanout_path(root_dir, os.path.splitext(os.path.basename(path))[0])
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(reader.read(path))
+            written += 1
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack loose images into tar shards with an offset index, or back.")
+    parser.add_argument('--shard-dir', default=DEFAULT_SHARD_DIR)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    pack_parser = subparsers.add_parser('pack', help="pack data/pictures/xx/yy/zz/ID.jpg into shards")
+    pack_parser.add_argument('--root-dir', default='data/pictures')
+    pack_parser.add_argument('--max-shard-mb', type=int, default=1024)
+    pack_parser.add_argument('--delete', action='store_true', help="remove the loose files after packing")
+    unpack_parser = subparsers.add_parser('unpack', help="write the shards back out as loose files")
+    unpack_parser.add_argument('--root-dir', default='data/pictures')
+    subparsers.add_parser('info', help="print image, shard and byte counts")
+    args = parser.parse_args()
+
+    start = time.time()
+    if args.command == 'pack':
+        images, total_bytes = pack(args.root_dir, args.shard_dir, args.max_shard_mb << 20, args.delete)
+        print(f"Packed {images} images ({total_bytes / 1e6:.2f} MB) in {time.time() - start:.2f} seconds")
+    elif args.command == 'unpack':
+        written = unpack(args.shard_dir, args.root_dir)
+        print(f"Unpacked {written} images into {args.root_dir} in {time.time() - start:.2f} seconds")
+    else:
+        index = ShardIndex(args.shard_dir)
+        images, shards, total_bytes = index.counts()
+        index.close()
+        print(f"{images} images in {shards} shards ({total_bytes / 1e6:.2f} MB)")
+
+if __name__ == "__main__":
+    main()
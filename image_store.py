@@ -0,0 +1,210 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+DEFAULT_CONTENT_STORE = 'data/pictures_cas'
+INDEX_NAME = 'index.sqlite3'
+
+def dhash(data, size=8):
+    """
+    64-bit difference hash of encoded image bytes: grayscale, shrink to
+    (size + 1) x size and compare horizontally adjacent pixels. Re-encoded
+    or slightly recompressed copies of a photo land within a few bits.
+    Returns None if the bytes can't be decoded.
+    """
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if img is None:
+        return None
+    small = cv2.resize(img, (size + 1, size), interpolation=cv2.INTER_AREA)
+    value = 0
+    for bit in (small[:, 1:] > small[:, :-1]).flatten():
+        value = (value << 1) | int(bit)
+    return value
+
+def _to_sqlite(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value is not None and value >= 1 << 63 else value
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+def blob_path(root, sha256):
+    # Same three-level fanout as data/pictures, so the sharded validators work unchanged
+    return os.path.join(root, sha256[:2], sha256[2:4], sha256[4:6], f"{sha256}.jpg")
+
+class ContentStore:
+    """
+    Content-addressed image storage: each distinct photo is written once
+    as <root>/ab/cd/ef/<sha256>.jpg and an SQLite index maps car IDs to
+    blobs. Photos within `max_distance` bits of a stored photo's dHash are
+    treated as the same image (dealers re-post listings under new IDs).
+    Safe to share between download threads.
+    """
+
+    def __init__(self, root=DEFAULT_CONTENT_STORE, max_distance=3):
+        if max_distance > 63:
+            raise ValueError(f"max_distance must be below 64 bits, got {max_distance}")
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.max_distance = max_distance
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(root, INDEX_NAME), check_same_thread=False, timeout=60)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha256 TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                dhash INTEGER,
+                created_at REAL NOT NULL
+            )
+        ''')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS images (
+                car_id TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS images_sha256 ON images (sha256)')
+        self.conn.commit()
+
+        # dHash split into max_distance + 1 bands (16 bits each at the
+        # default of 3): two hashes within max_distance bits share at least
+        # one band exactly, so candidates come from dict lookups
+        band_count = max(self.max_distance, 0) + 1
+        width = 64 // band_count
+        self.band_masks = [(band * width, (1 << (width if band < band_count - 1 else 64 - band * width)) - 1)
+                           for band in range(band_count)]
+        self.bands = [{} for _ in range(band_count)]
+        if self.max_distance >= 0:
+            for sha256, value in self.conn.execute('SELECT sha256, dhash FROM blobs WHERE dhash IS NOT NULL'):
+                self._index_dhash(sha256, value & 0xFFFFFFFFFFFFFFFF)
+
+    def _band_keys(self, value):
+        return [(value >> shift) & mask for shift, mask in self.band_masks]
+
+    def _index_dhash(self, sha256, value):
+        for band, key in zip(self.bands, self._band_keys(value)):
+            band.setdefault(key, []).append((value, sha256))
+
+    def _find_near_duplicate(self, value):
+        best = None
+        for band, key in zip(self.bands, self._band_keys(value)):
+            for candidate, sha256 in band.get(key, ()):
+                distance = hamming(value, candidate)
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, sha256)
+        return best[1] if best else None
+
+    def has(self, car_id):
+        return self.known_ids([car_id]) != set()
+
+    def known_ids(self, car_ids, chunk_size=500):
+        known = set()
+        car_ids = [str(car_id) for car_id in car_ids]
+        with self.lock:
+            for i in range(0, len(car_ids), chunk_size):
+                chunk = car_ids[i:i + chunk_size]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(f'SELECT car_id FROM images WHERE car_id IN ({placeholders})', chunk)
+                known.update(row[0] for row in rows)
+        return known
+
+    def put(self, car_id, data, sha256):
+        """
+        Store a downloaded photo for car_id. Returns (status, sha256 of the
+        stored blob) where status is 'stored' for a new blob, 'duplicate'
+        for an identical one and 'near_duplicate' for a dHash match; only
+        'stored' writes to disk. The blob file is in place before its index
+        rows are committed, so the index never points at a missing file.
+        """
+        now = time.time()
+        # Decode outside the lock so download threads hash in parallel
+        value = dhash(data) if self.max_distance >= 0 else None
+        with self.lock:
+            status = 'duplicate'
+            if self.conn.execute('SELECT 1 FROM blobs WHERE sha256 = ?', (sha256,)).fetchone() is None:
+                near = self._find_near_duplicate(value) if value is not None else None
+                if near is not None:
+                    status, sha256 = 'near_duplicate', near
+                else:
+                    status = 'stored'
+                    # Written under the lock so a concurrent identical photo
+                    # can't be indexed against a blob that isn't there yet
+                    self._write_blob(sha256, data)
+            try:
+                if status == 'stored':
+                    self.conn.execute('INSERT INTO blobs (sha256, size, dhash, created_at) VALUES (?, ?, ?, ?)',
+                                      (sha256, len(data), _to_sqlite(value), now))
+                self.conn.execute('INSERT OR REPLACE INTO images (car_id, sha256, updated_at) VALUES (?, ?, ?)',
+                                  (str(car_id), sha256, now))
+                self.conn.commit()
+            except BaseException:
+                # An orphaned blob file is harmless: the next put of the photo rewrites it
+                self.conn.rollback()
+                raise
+            # Only committed blobs become near-duplicate candidates
+            if status == 'stored' and value is not None:
+                self._index_dhash(sha256, value & 0xFFFFFFFFFFFFFFFF)
+        return status, sha256
+
+    def _write_blob(self, sha256, data):
+        path = blob_path(self.root, sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_name, path)
+        except BaseException:
+            os.remove(temp_name)
+            raise
+
+    def path_for(self, car_id):
+        with self.lock:
+            row = self.conn.execute('SELECT sha256 FROM images WHERE car_id = ?', (str(car_id),)).fetchone()
+        return blob_path(self.root, row[0]) if row else None
+
+    def car_ids_for_paths(self, image_paths, chunk_size=500):
+        """
+        {blob path: [car IDs using it]} for the given blob paths.
+        """
+        by_sha = {os.path.splitext(os.path.basename(path))[0]: path for path in image_paths}
+        car_ids = {path: [] for path in by_sha.values()}
+        shas = list(by_sha)
+        with self.lock:
+            for i in range(0, len(shas), chunk_size):
+                chunk = shas[i:i + chunk_size]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(
+                    f'SELECT sha256, car_id FROM images WHERE sha256 IN ({placeholders}) ORDER BY car_id', chunk)
+                for sha256, car_id in rows:
+                    car_ids[by_sha[sha256]].append(car_id)
+        return car_ids
+
+    def counts(self):
+        with self.lock:
+            blobs, stored_bytes = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs').fetchone()
+            images = self.conn.execute('SELECT COUNT(*) FROM images').fetchone()[0]
+        return images, blobs, stored_bytes
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def content_store_car_ids(root, image_paths):
+    with ContentStore(root, max_distance=-1) as store:
+        return store.car_ids_for_paths(image_paths)
@@ -0,0 +1,177 @@
+import argparse
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from image_inference import iter_image_paths, jpeg_dimensions, reduced_decode_flag
+
+# The detector's input size: the largest the validators ever look at, and
+# at this size they decode the file at full scale without a resize. Edges
+# between 640 and 1280 are slower to decode than a 1280 'hd' original,
+# which gets the reduced-DCT decode (benchmarks/bench_image_transform.py).
+DEFAULT_MAX_EDGE = 640
+DEFAULT_COLD_STORAGE = 'data/pictures_originals'
+FORMATS = ('jpeg', 'webp')
+
+def is_webp(data):
+    return data[:4] == b'RIFF' and data[8:12] == b'WEBP'
+
+def encode_params(image_format, quality):
+    if image_format == 'webp':
+        return '.webp', [cv2.IMWRITE_WEBP_QUALITY, quality]
+    return '.jpg', [cv2.IMWRITE_JPEG_QUALITY, quality, cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+
+def transform_image(data, max_edge=DEFAULT_MAX_EDGE, image_format='jpeg', quality=85):
+    """
+    Shrink an encoded image so its longer side is at most max_edge and
+    re-encode it as image_format at quality. Returns the new bytes, or
+    None when the image should be kept as it is: already small enough in
+    the target format (re-encoding would only lose quality) or when the
+    result wouldn't be smaller. Large JPEGs are decoded at a reduced DCT
+    scale that still covers max_edge.
+    """
+    dimensions = jpeg_dimensions(data)
+    if dimensions is not None and max(dimensions) <= max_edge and image_format == 'jpeg':
+        return None
+    if is_webp(data) and image_format == 'webp':
+        return None
+    flag = reduced_decode_flag(*dimensions, max_edge) if dimensions else cv2.IMREAD_COLOR
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), flag)
+    if img is None:
+        raise ValueError("Unable to decode image")
+    height, width = img.shape[:2]
+    if max(height, width) > max_edge:
+        scale = max_edge / max(height, width)
+        img = cv2.resize(img, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+    extension, params = encode_params(image_format, quality)
+    ok, encoded = cv2.imencode(extension, img, params)
+    if not ok:
+        raise ValueError(f"Unable to encode image as {image_format}")
+    encoded = encoded.tobytes()
+    return encoded if len(encoded) < len(data) else None
+
+def transform_file(path, max_edge=DEFAULT_MAX_EDGE, image_format='jpeg', quality=85, cold_storage=None,
+                   root_dir='data/pictures'):
+    """
+    Transform the image at path in place (temp file and rename, so readers
+    never see a partial image). With cold_storage the original is first
+    hard-linked (or copied) to the same relative path under it. The file
+    keeps its <ID>.jpg name whatever the format: every stage addresses
+    images by that name and the decoders go by content. Returns (bytes
+    before, bytes after, sha256 of the file now at path).
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    encoded = transform_image(data, max_edge, image_format, quality)
+    if encoded is None:
+        return len(data), len(data), hashlib.sha256(data).hexdigest()
+    if cold_storage:
+        original = os.path.join(cold_storage, os.path.relpath(path, root_dir))
+        os.makedirs(os.path.dirname(original), exist_ok=True)
+        if not os.path.exists(original):
+            try:
+                os.link(path, original)
+            except OSError:
+                shutil.copy2(path, original)
+    fd, temp_name = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(encoded)
+        os.replace(temp_name, path)
+    except BaseException:
+        os.remove(temp_name)
+        raise
+    return len(data), len(encoded), hashlib.sha256(encoded).hexdigest()
+
+class ImageTransformer:
+    """
+    Post-download transform stage: a pool of worker threads (OpenCV
+    releases the GIL while decoding, resizing and encoding) that runs
+    transform_file on every image submitted, so the download threads go
+    straight back to the network. submit() blocks once max_pending images
+    are waiting, so a slow transform applies backpressure instead of
+    queueing without bound. Each future resolves to the (size, sha256) of
+    the file left at the path, or None if the transform failed and the
+    original is still there. Keeps totals for the run summary.
+    """
+
+    def __init__(self, max_edge=DEFAULT_MAX_EDGE, image_format='jpeg', quality=85, cold_storage=None,
+                 root_dir='data/pictures', workers=None, max_pending=None):
+        self.options = {'max_edge': max_edge, 'image_format': image_format, 'quality': quality,
+                        'cold_storage': cold_storage, 'root_dir': root_dir}
+        workers = workers or os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-transform')
+        self.slots = threading.BoundedSemaphore(max_pending or workers * 4)
+        self.lock = threading.Lock()
+        self.stats = {'transformed': 0, 'unchanged': 0, 'failed': 0, 'bytes_before': 0, 'bytes_after': 0,
+                      'seconds': 0.0}
+
+    def _run(self, path):
+        start = time.perf_counter()
+        try:
+            before, after, sha256 = transform_file(path, **self.options)
+        except Exception as e:
+            print(f"Error transforming image {path}: {str(e)}")
+            with self.lock:
+                self.stats['failed'] += 1
+            return None
+        finally:
+            self.slots.release()
+        with self.lock:
+            self.stats['transformed' if after != before else 'unchanged'] += 1
+            self.stats['bytes_before'] += before
+            self.stats['bytes_after'] += after
+            self.stats['seconds'] += time.perf_counter() - start
+        return after, sha256
+
+    def submit(self, path):
+        self.slots.acquire()
+        return self.executor.submit(self._run, path)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        return self.stats
+
+    def summary(self):
+        saved = self.stats['bytes_before'] - self.stats['bytes_after']
+        images = self.stats['transformed'] + self.stats['unchanged']
+        return (f"Transformed {self.stats['transformed']} images ({self.stats['unchanged']} kept as they were, "
+                f"{self.stats['failed']} failed): {self.stats['bytes_before'] / 1e6:.2f} MB -> "
+                f"{self.stats['bytes_after'] / 1e6:.2f} MB, {saved / 1e6:.2f} MB saved "
+                f"({saved / max(self.stats['bytes_before'], 1):.1%}), "
+                f"{self.stats['seconds'] / max(images, 1) * 1000:.1f} ms/image of worker time")
+
+def add_arguments(parser):
+    parser.add_argument('--max-edge', type=int, default=DEFAULT_MAX_EDGE,
+                        help="longest side after resizing (keep it >= 640, the detector input)")
+    parser.add_argument('--format', dest='image_format', choices=FORMATS, default='jpeg')
+    parser.add_argument('--quality', type=int, default=85, help="JPEG/WebP quality")
+    parser.add_argument('--cold-storage', nargs='?', const=DEFAULT_COLD_STORAGE, default=None,
+                        help=f"keep the originals under this directory (default {DEFAULT_COLD_STORAGE})")
+    parser.add_argument('--transform-workers', type=int, default=None, help="transform threads (default: CPU count)")
+    return parser
+
+def main():
+    parser = add_arguments(argparse.ArgumentParser(
+        description="Resize and re-encode already downloaded images in place."))
+    parser.add_argument('--root-dir', default='data/pictures')
+    args = parser.parse_args()
+
+    start = time.time()
+    transformer = ImageTransformer(args.max_edge, args.image_format, args.quality, args.cold_storage, args.root_dir,
+                                   args.transform_workers)
+    for image_path in iter_image_paths(args.root_dir):
+        transformer.submit(image_path)
+    transformer.close()
+    print(transformer.summary())
+    print(f"Total execution time: {time.time() - start:.2f} seconds")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
+import argparse
 import json
 import os
 import re
 import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from car_scraper.records import RecordWriter, iter_serialized_records
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -51,63 +55,220 @@ def find_matching_model(title, models):
 
     return best_match
 
+class VehicleMatcher:
+    """
+    In-memory equivalent of find_matching_brand + find_matching_model.
+    Brand names are indexed in a reversed trie so every brand ending right
+    before a space in the title is found in one walk, and each brand's model
+    files are loaded once and turned into a token -> model inverted index.
+    """
+
+    CATEGORIES = ['passenger_car', 'bus']
+
+    def __init__(self, brands, models_dir):
+        self.brands = brands
+        self.models_dir = models_dir
+        self.brand_names = list(brands)
+        self.first_word_index = {}
+        self.reversed_trie = {}
+        self.model_indexes = {}
+
+        for order, brand_name in enumerate(self.brand_names):
+            brand_lower = brand_name.lower()
+            self.first_word_index.setdefault(brand_lower, order)
+            node = self.reversed_trie
+            for char in reversed(brand_lower):
+                node = node.setdefault(char, {})
+            node.setdefault(None, order)
+
+    def find_brand(self, title):
+        if not title:
+            return None, None
+        title_lower = title.lower()
+        title_words = title_lower.split()
+        best = self.first_word_index.get(title_words[0]) if title_words else None
+
+        # Same as `f"{brand} " in title`: walk backwards from every space.
+        position = title_lower.find(' ')
+        while position != -1:
+            node = self.reversed_trie
+            index = position
+            while node is not None:
+                order = node.get(None)
+                if order is not None and (best is None or order < best):
+                    best = order
+                index -= 1
+                if index < 0:
+                    break
+                node = node.get(title_lower[index])
+            position = title_lower.find(' ', position + 1)
+
+        if best is None:
+            return None, None
+        brand_name = self.brand_names[best]
+        return brand_name, self.brands[brand_name]
+
+    def get_model_indexes(self, brand_name):
+        indexes = self.model_indexes.get(brand_name)
+        if indexes is None:
+            indexes = []
+            for category in self.CATEGORIES:
+                brand_models_file = os.path.join(self.models_dir, f"{sanitize_filename(brand_name)}_{category}_models.json")
+                if not os.path.exists(brand_models_file):
+                    continue
+                brand_models = load_json(brand_models_file)
+                if not brand_models:
+                    continue
+                token_index = {}
+                for position, model in enumerate(brand_models):
+                    for word in set(model['name'].lower().split()):
+                        token_index.setdefault(word, []).append(position)
+                indexes.append((category, brand_models, token_index))
+            self.model_indexes[brand_name] = indexes
+        return indexes
+
+    def find_model(self, title, brand_name):
+        title_words = set(title.lower().split())
+        for category, brand_models, token_index in self.get_model_indexes(brand_name):
+            counts = {}
+            for word in title_words:
+                for position in token_index.get(word, ()):
+                    counts[position] = counts.get(position, 0) + 1
+            if counts:
+                # Most shared words wins, ties go to the earliest model like the linear scan
+                position = min(counts, key=lambda p: (-counts[p], p))
+                return brand_models[position], category
+        return None, None
+
+def enrich_car(car, matcher):
+    """
+    Fill in Brand, Model and VehicleType on a car record in place.
+    Returns 'missing_fields', 'unknown_brand', 'unknown_model' or 'matched'.
+    """
+    if 'Title' not in car or not car['Title']:
+        logging.error(f"Missing or empty 'Title' field in car entry: {car}")
+        return 'missing_fields'
+
+    title = car['Title']
+    matching_brand, brand_info = matcher.find_brand(title)
+
+    if matching_brand:
+        car['Brand'] = matching_brand
+        
+        # Try to find matching model
+        matching_model, category = matcher.find_model(title, matching_brand)
+        if matching_model:
+            car['Model'] = matching_model['name']
+            car['VehicleType'] = category
+            return 'matched'
+
+        car['Model'] = 'Unknown'
+        car['VehicleType'] = 'Unknown'
+        logging.warning(f"No matching model found for: {title} (Brand: {matching_brand})")
+        return 'unknown_model'
+
+    car['Brand'] = 'Unknown'
+    car['Model'] = 'Unknown'
+    car['VehicleType'] = 'Unknown'
+    id_info = f"(ID: {car['ID']})" if 'ID' in car else "(ID: Missing)"
+    logging.warning(f"Unknown brand for vehicle: {title} {id_info}")
+    return 'unknown_brand'
+
+# Matcher built once per worker process by _init_worker
+_worker_matcher = None
+
+def _init_worker(brands, models_dir):
+    global _worker_matcher
+    _worker_matcher = VehicleMatcher(brands, models_dir)
+
+def _enrich_batch(batch):
+    """
+    Enrich a batch of records (dicts or raw JSON text) in a worker and
+    return them serialized, so decoding and encoding also run in parallel.
+    """
+    lines = []
+    statuses = []
+    for car in batch:
+        if isinstance(car, str):
+            car = json.loads(car)
+        statuses.append(enrich_car(car, _worker_matcher))
+        lines.append(json.dumps(car, ensure_ascii=False))
+    return lines, statuses
+
+def iter_batches(records, batch_size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def enrich_records(records, brands, models_dir, workers=1, batch_size=2000):
+    """
+    Yield (serialized car, status) for every record, in input order. With
+    workers > 1 batches are matched in a process pool, with at most two
+    batches per worker in flight so memory stays bounded.
+    """
+    if workers <= 1:
+        _init_worker(brands, models_dir)
+        for batch in iter_batches(records, batch_size):
+            yield from zip(*_enrich_batch(batch))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(brands, models_dir)) as executor:
+        in_flight = deque()
+        for batch in iter_batches(records, batch_size):
+            in_flight.append(executor.submit(_enrich_batch, batch))
+            if len(in_flight) >= workers * 2:
+                yield from zip(*in_flight.popleft().result())
+        while in_flight:
+            yield from zip(*in_flight.popleft().result())
+
 def main():
-    cars_file = "data/cars.json"
+    parser = argparse.ArgumentParser(description="Match scraped cars against the brand/model catalog.")
+    parser.add_argument('--input', default="data/cars.json", help="JSON array or JSON Lines (.jsonl[.gz|.zst]) input")
+    parser.add_argument('--output', default="data/cars_with_brands_and_models.json", help="output file, format taken from the extension")
+    parser.add_argument('--workers', type=int, default=1, help="matcher processes (default 1: match in this process)")
+    parser.add_argument('--batch-size', type=int, default=2000, help="records per worker batch")
+    args = parser.parse_args()
+
+    cars_file = args.input
     brands_file = "data/car_brands.json"
     models_dir = "data/vehicle_models"
-    output_file = "data/cars_with_brands_and_models.json"
+    output_file = args.output
 
-    cars = load_json(cars_file)
+    if not os.path.exists(cars_file):
+        logging.error(f"File not found: {cars_file}")
+        return
     brands = load_json(brands_file)
 
-    if not cars or not brands:
+    if not brands:
         return
 
-    total_count = len(cars)
+    total_count = 0
     unknown_brand_count = 0
     unknown_model_count = 0
     missing_fields_count = 0
 
-    for car in cars:
-        if 'Title' not in car or not car['Title']:
-            logging.error(f"Missing or empty 'Title' field in car entry: {car}")
-            missing_fields_count += 1
-            continue
-
-        title = car['Title']
-        matching_brand, brand_info = find_matching_brand(title, brands)
-
-        if matching_brand:
-            car['Brand'] = matching_brand
-            
-            # Try to find matching model
-            model_found = False
-            for category in ['passenger_car', 'bus']:
-                brand_models_file = os.path.join(models_dir, f"{sanitize_filename(matching_brand)}_{category}_models.json")
-                if os.path.exists(brand_models_file):
-                    brand_models = load_json(brand_models_file)
-                    if brand_models:
-                        matching_model = find_matching_model(title, brand_models)
-                        if matching_model:
-                            car['Model'] = matching_model['name']
-                            car['VehicleType'] = category
-                            model_found = True
-                            break
-
-            if not model_found:
-                car['Model'] = 'Unknown'
-                car['VehicleType'] = 'Unknown'
+    # Stream records through so memory stays flat regardless of crawl size
+    with RecordWriter(output_file) as writer:
+        records = iter_serialized_records(cars_file)
+        for line, status in enrich_records(records, brands, models_dir, args.workers, args.batch_size):
+            total_count += 1
+            if status == 'missing_fields':
+                missing_fields_count += 1
+            elif status == 'unknown_brand':
+                unknown_brand_count += 1
+            elif status == 'unknown_model':
                 unknown_model_count += 1
-                logging.warning(f"No matching model found for: {title} (Brand: {matching_brand})")
-        else:
-            car['Brand'] = 'Unknown'
-            car['Model'] = 'Unknown'
-            car['VehicleType'] = 'Unknown'
-            unknown_brand_count += 1
-            id_info = f"(ID: {car['ID']})" if 'ID' in car else "(ID: Missing)"
-            logging.warning(f"Unknown brand for vehicle: {title} {id_info}")
-
-    save_json(cars, output_file)
+            writer.write_serialized(line)
+
+    if not total_count:
+        logging.error(f"No vehicles found in {cars_file}")
+        return
     
     # Log summary
     logging.info(f"Processing complete. Total vehicles: {total_count}")
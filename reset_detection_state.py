@@ -1,7 +1,9 @@
+import argparse
 import os
 import shutil
 from tqdm import tqdm
 import re
+from validation_results import DEFAULT_RESULTS_DB, ResultsStore
 
 def get_original_path(file_path, root_dir='data/pictures'):
     """
@@ -39,10 +41,27 @@ def clean_empty_dirs(directory):
                 os.rmdir(dir_path)
                 print(f"Removed empty directory: {dir_path}")
 
-def reset_detection_state(valid_dir='data/valid_pictures', invalid_dir='data/invalid_pictures', root_dir='data/pictures'):
+def reset_results_store(results_db=DEFAULT_RESULTS_DB, model=None):
     """
-    Move images from valid_dir and invalid_dir back to their original locations in root_dir.
+    Drop stored verdicts (optionally only one model's) so the validators
+    score those images again. Images never leave root_dir, so nothing moves.
     """
+    if not os.path.exists(results_db):
+        print(f"Results store does not exist: {results_db}")
+        return 0
+    with ResultsStore(results_db) as store:
+        removed = store.clear(model)
+    print(f"Removed {removed} stored verdicts from {results_db}")
+    return removed
+
+def reset_detection_state(valid_dir='data/valid_pictures', invalid_dir='data/invalid_pictures', root_dir='data/pictures',
+                          results_db=DEFAULT_RESULTS_DB, model=None):
+    """
+    Clear the verdicts store and move images from valid_dir and invalid_dir
+    (left by --move runs or exports) back to their original locations in root_dir.
+    """
+    reset_results_store(results_db, model)
+
     moved_files = 0
     errors = 0
 
@@ -69,4 +88,13 @@ def reset_detection_state(valid_dir='data/valid_pictures', invalid_dir='data/inv
     print(f"\nReset complete. Moved {moved_files} files. Encountered {errors} errors.")
 
 if __name__ == "__main__":
-    reset_detection_state()
+    parser = argparse.ArgumentParser(description="Reset image validation so every image is scored again.")
+    parser.add_argument('--results-db', default=DEFAULT_RESULTS_DB)
+    parser.add_argument('--model', default=None, help="only drop verdicts from this model (weights file name)")
+    parser.add_argument('--store-only', action='store_true', help="don't walk the valid/invalid directories")
+    args = parser.parse_args()
+
+    if args.store_only:
+        reset_results_store(args.results_db, args.model)
+    else:
+        reset_detection_state(results_db=args.results_db, model=args.model)
@@ -0,0 +1,386 @@
+import argparse
+import collections
+import importlib
+import os
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import download_images
+from download_manifest import DownloadManifest
+from process_vehicles import VehicleMatcher, enrich_car, load_json
+from image_transform import ImageTransformer, add_arguments as add_transform_arguments
+from throttling import DEFAULT_LIMITER_DIR, IMAGES_ENDPOINT, open_bucket
+from car_scraper.records import RecordWriter, iter_records
+
+_DONE = object()
+# Most recent validated images the reported latency percentile covers
+LATENCY_WINDOW = 10000
+
+class StageQueue(queue.Queue):
+    """
+    Bounded queue between two stages that counts what went through it, so
+    the producer's throughput can be reported without touching its code.
+    """
+
+    def __init__(self, maxsize):
+        super().__init__(maxsize)
+        self.put_count = 0
+
+    def __deepcopy__(self, memo):
+        # Handed to Scrapy as the CARS_ITEM_QUEUE setting; Scrapy copies
+        # its settings, and every copy must still feed the same queue
+        return self
+
+    def _put(self, item):
+        # Called with the queue's mutex held
+        if item is not _DONE:
+            self.put_count += 1
+        super()._put(item)
+
+class Pipeline:
+    """
+    Crawl -> enrich -> download -> validate with every stage running at
+    once, connected by bounded queues. Each stage is a thread reading its
+    input queue; when a queue is full the stage feeding it blocks, so a
+    slow stage (usually downloads) throttles everything upstream of it,
+    back to the crawl itself. A listing scraped now is validated as soon
+    as its image is downloaded instead of after the whole crawl.
+    """
+
+    STAGES = ('crawl', 'enrich', 'download', 'validate')
+
+    def __init__(self, brands, models_dir, enriched_output, queue_size=1000, download_workers=40, per_host=16,
+                 rate=20.0, max_rate=100.0, manifest_path=None, validator=None, validate_batch=64, flush_seconds=30.0,
+                 validate_options=None, limiter_dir=None, transformer=None):
+        self.brands = brands
+        self.models_dir = models_dir
+        self.enriched_output = enriched_output
+        self.download_workers = download_workers
+        self.per_host = per_host
+        self.rate = rate
+        self.max_rate = max_rate
+        self.limiter_dir = limiter_dir
+        self.transformer = transformer
+        self.manifest_path = manifest_path
+        self.manifest = None
+        self.validator = validator
+        self.validate_batch = validate_batch
+        self.flush_seconds = flush_seconds
+        self.validate_options = validate_options or {}
+
+        # crawl -> enrich is fed by CarScraperPipeline (or a record file)
+        self.queues = {stage: StageQueue(queue_size) for stage in self.STAGES[1:]}
+        self.outputs = {'crawl': self.queues['enrich'], 'enrich': self.queues['download'],
+                        'download': self.queues['validate'], 'validate': None}
+        self.counts = {'enriched': {}, 'downloaded': {}, 'valid': 0, 'invalid': 0, 'validated': 0,
+                       'validate_failed': 0}
+        self.in_flight = 0
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.max_latency = 0.0
+        self.failed_stages = []
+        self.threads = []
+        self.start_time = None
+        self.last_report = None
+        self.bucket = None
+
+    @property
+    def item_queue(self):
+        return self.queues['enrich']
+
+    def _run_stage(self, name, target):
+        try:
+            target()
+        except Exception:
+            print(f"Pipeline stage '{name}' failed:\n{traceback.format_exc()}")
+            self.failed_stages.append(name)
+            # Keep draining so upstream stages and the crawl never block on us
+            while self.queues[name].get() is not _DONE:
+                pass
+        finally:
+            if self.outputs[name] is not None:
+                self.outputs[name].put(_DONE)
+
+    def _enrich(self):
+        matcher = VehicleMatcher(self.brands, self.models_dir)
+        with RecordWriter(self.enriched_output, flush_every=100) as writer:
+            while True:
+                item = self.queues['enrich'].get()
+                if item is _DONE:
+                    break
+                car, scraped_at = item
+                status = enrich_car(car, matcher)
+                self.counts['enriched'][status] = self.counts['enriched'].get(status, 0) + 1
+                writer.write(car)
+                self.queues['download'].put((car, scraped_at))
+
+    def _download(self):
+        # SQLite connections belong to the thread that opened them
+        self.manifest = DownloadManifest(self.manifest_path) if self.manifest_path else None
+        session = download_images.make_session(self.per_host)
+        self.bucket = open_bucket(IMAGES_ENDPOINT, self.rate, max(self.rate, 1.0), 1.0, self.max_rate, self.limiter_dir)
+        out_queue = self.queues['validate']
+        in_flight = {}
+        transforming = {}
+
+        def record_transformed(done):
+            # The manifest describes the file on disk: the transformed one, or
+            # the original if the transform failed
+            for future in done:
+                car_id, result = transforming.pop(future)
+                size, sha256 = future.result() or (result.size, result.sha256)
+                self.manifest.record(car_id, result.status, result.variant, size, sha256)
+
+        def collect(done):
+            record_transformed([future for future in transforming if future.done()])
+            for future in done:
+                car_id, scraped_at = in_flight.pop(future)
+                result = future.result()
+                downloaded = self.counts['downloaded']
+                downloaded[result.status] = downloaded.get(result.status, 0) + 1
+                transformed = None
+                if result.status in ('downloaded', 'exists'):
+                    image_path = os.path.join(download_images.get_folder_path(car_id), f"{car_id}.jpg")
+                    if result.status == 'downloaded' and self.transformer is not None:
+                        # Validate the transformed image (or the original if the transform failed)
+                        transformed = self.transformer.submit(image_path)
+                        transformed.add_done_callback(lambda _, item=(image_path, scraped_at): out_queue.put(item))
+                    else:
+                        out_queue.put((image_path, scraped_at))
+                if self.manifest is not None and transformed is not None:
+                    transforming[transformed] = (car_id, result)
+                elif self.manifest is not None and result.status in ('downloaded', 'failed'):
+                    self.manifest.record(car_id, result.status, result.variant, result.size, result.sha256)
+            self.in_flight = len(in_flight)
+
+        with ThreadPoolExecutor(max_workers=self.download_workers) as executor:
+            while True:
+                collect([future for future in in_flight if future.done()])
+                if len(in_flight) >= self.download_workers * 2:
+                    # Backpressure: only queue a couple of downloads per thread
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                    continue
+                try:
+                    item = self.queues['download'].get(timeout=0.2)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    break
+                car, scraped_at = item
+                car_id = car.get('ID')
+                known = self.manifest.get(car_id) if self.manifest is not None and car_id else None
+                if known and known['status'] == 'downloaded':
+                    out_queue.put((os.path.join(download_images.get_folder_path(car_id), f"{car_id}.jpg"), scraped_at))
+                    self.counts['downloaded']['exists'] = self.counts['downloaded'].get('exists', 0) + 1
+                    continue
+                future = executor.submit(download_images.download_image, car, session, self.bucket,
+                                         check_exists=self.manifest is None)
+                in_flight[future] = (car_id, scraped_at)
+                self.in_flight = len(in_flight)
+            done, _ = wait(in_flight)
+            collect(done)
+            done, _ = wait(transforming)
+            record_transformed(done)
+        if self.transformer is not None:
+            # Everything submitted reaches the validate queue before _DONE does
+            self.transformer.close()
+        if self.manifest is not None:
+            self.manifest.close()
+
+    def _validate(self):
+        batch = []
+        batch_started = None
+        finished = False
+        while not finished:
+            try:
+                item = self.queues['validate'].get(timeout=1.0)
+            except queue.Empty:
+                item = None
+            if item is _DONE:
+                finished = True
+            elif item is not None:
+                batch.append(item)
+                batch_started = batch_started or time.time()
+            if batch and (finished or len(batch) >= self.validate_batch
+                          or time.time() - batch_started >= self.flush_seconds):
+                try:
+                    self._validate_batch(batch)
+                except Exception:
+                    # One bad batch (an image removed meanwhile, a decode
+                    # error) shouldn't stop validation for the rest of the run
+                    print(f"Validating a batch of {len(batch)} images failed:\n{traceback.format_exc()}")
+                    self.counts['validate_failed'] += len(batch)
+                batch = []
+                batch_started = None
+
+    def _validate_batch(self, batch):
+        image_paths = list(dict.fromkeys(image_path for image_path, _ in batch))
+        if self.validator is not None:
+            valid, invalid = self.validator.validate_paths(image_paths, **self.validate_options)
+            self.counts['valid'] += valid
+            self.counts['invalid'] += invalid
+        now = time.time()
+        latencies = [now - scraped_at for _, scraped_at in batch]
+        self.latencies.extend(latencies)
+        self.max_latency = max(self.max_latency, *latencies)
+        self.counts['validated'] += len(batch)
+
+    def start(self):
+        self.start_time = time.time()
+        self.last_report = (self.start_time, self.stage_counts())
+        for name, target in (('enrich', self._enrich), ('download', self._download), ('validate', self._validate)):
+            thread = threading.Thread(target=self._run_stage, args=(name, target), name=f"pipeline-{name}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def finish_crawl(self):
+        self.item_queue.put(_DONE)
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+
+    def stage_counts(self):
+        # Items each stage has passed on (validate: images validated)
+        return {
+            'crawl': self.queues['enrich'].put_count,
+            'enrich': self.queues['download'].put_count,
+            'download': self.queues['validate'].put_count,
+            'validate': self.counts['validated'],
+        }
+
+    def report(self):
+        """
+        Print each stage's total, its throughput since the last report,
+        the depth of its input queue and the scrape -> validated latency.
+        """
+        now = time.time()
+        last_time, last_counts = self.last_report
+        interval = max(now - last_time, 1e-9)
+        counts = self.stage_counts()
+        self.last_report = (now, counts)
+        parts = []
+        for stage, count in counts.items():
+            part = f"{stage} {count} ({(count - last_counts[stage]) / interval:.1f}/s"
+            if stage in self.queues:
+                part += f", queue {self.queues[stage].qsize()}/{self.queues[stage].maxsize}"
+            if stage == 'download':
+                part += f", in flight {self.in_flight}"
+                if self.bucket is not None:
+                    part += f", rate {self.bucket.rate:.1f}/s"
+            parts.append(part + ")")
+        line = " | ".join(parts)
+        if self.latencies:
+            latencies = sorted(self.latencies)
+            line += (f" | scrape->validated p50 {latencies[len(latencies) // 2]:.1f}s "
+                     f"(last {len(latencies)} images), max {self.max_latency:.1f}s")
+        print(f"[pipeline {now - self.start_time:.0f}s] {line}")
+
+def feed_records(pipeline, filename):
+    """
+    Stand-in for the crawl: replay a scraped record file into the pipeline.
+    """
+    for record in iter_records(filename):
+        pipeline.item_queue.put((record, time.time()))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Crawl, enrich, download and validate in one process, all stages running concurrently.")
+    source = parser.add_argument_group('crawl')
+    source.add_argument('--input', default=None,
+                        help="replay listings from this JSON/JSONL file instead of crawling")
+    source.add_argument('--delta', action='store_true', help="delta crawl (see run_spider.py)")
+    source.add_argument('--partitioned', action='store_true', help="partitioned crawl (see run_spider.py)")
+    source.add_argument('--partition', default=None, help="only crawl partition i/N of the brands")
+    source.add_argument('--year-ranges', default=None,
+                        help="further split each brand by year, e.g. 2000-2009,2010-2015,2016-2024")
+    enrich = parser.add_argument_group('enrich')
+    enrich.add_argument('--brands', default='data/car_brands.json', help="download_vehicle_data.py output")
+    enrich.add_argument('--models-dir', default='data/vehicle_models')
+    enrich.add_argument('--enriched-output', default='data/cars_with_brands_and_models.jsonl')
+    download = parser.add_argument_group('download')
+    download.add_argument('--download-workers', type=int, default=40, help="download threads")
+    download.add_argument('--per-host', type=int, default=16, help="max open connections per image host")
+    download.add_argument('--rate', type=float, default=20.0, help="initial image requests per second")
+    download.add_argument('--max-rate', type=float, default=100.0, help="ceiling for the adaptive rate limiter (0 for none)")
+    download.add_argument('--manifest', default='data/download_manifest.sqlite3', help="download manifest (SQLite)")
+    download.add_argument('--no-manifest', action='store_true', help="check every file on disk instead")
+    validate = parser.add_argument_group('validate')
+    validate.add_argument('--validator', choices=('detect', 'classify', 'cascade', 'none'), default='detect',
+                          help="check_images_<validator>.py to run on downloaded images")
+    validate.add_argument('--validate-batch', type=int, default=64,
+                          help="images collected before a validation call")
+    validate.add_argument('--flush-seconds', type=float, default=30.0,
+                          help="validate a partial batch after waiting this long")
+    validate.add_argument('--backend', default='torch', help="validator backend (see check_images_*.py --backend)")
+    validate.add_argument('--results-db', default='data/validation_results.sqlite3')
+    parser.add_argument('--shared-limiter', nargs='?', const=DEFAULT_LIMITER_DIR, default=None,
+                        help=f"crawl and image downloads draw from the cross-process rate limiters in this directory "
+                             f"(default {DEFAULT_LIMITER_DIR})")
+    download.add_argument('--transform', action='store_true',
+                          help="resize and re-encode each downloaded image before validating it (see image_transform.py)")
+    add_transform_arguments(download)
+    parser.add_argument('--queue-size', type=int, default=1000, help="items buffered between two stages")
+    parser.add_argument('--report-every', type=float, default=10.0, help="seconds between progress reports")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    brands = load_json(args.brands)
+    if not brands:
+        print(f"No brand catalog at {args.brands}, run download_vehicle_data.py first")
+        return
+
+    validator = None
+    if args.validator != 'none':
+        validator = importlib.import_module(f"check_images_{args.validator}")
+    transformer = None
+    if args.transform:
+        transformer = ImageTransformer(args.max_edge, args.image_format, args.quality, args.cold_storage,
+                                       workers=args.transform_workers)
+    pipeline = Pipeline(brands, args.models_dir, args.enriched_output, args.queue_size, args.download_workers,
+                        args.per_host, args.rate, args.max_rate, None if args.no_manifest else args.manifest, validator, args.validate_batch,
+                        args.flush_seconds,
+                        # Every stage-to-stage hand-off is new work, so only re-score changed images
+                        {'results_db': args.results_db, 'incremental': True, 'backend': args.backend},
+                        args.shared_limiter, transformer)
+    pipeline.start()
+
+    stop_reporting = threading.Event()
+
+    def report_loop():
+        while not stop_reporting.wait(args.report_every):
+            pipeline.report()
+
+    threading.Thread(target=report_loop, name='pipeline-report', daemon=True).start()
+    try:
+        if args.input:
+            feed_records(pipeline, args.input)
+        else:
+            # Scrapy's reactor runs in the main thread; CarScraperPipeline feeds the enrich stage
+            from run_spider import run_spider
+            run_spider(args.delta, partitioned=args.partitioned, partition=args.partition,
+                       year_ranges=args.year_ranges, item_queue=pipeline.item_queue,
+                       shared_limiter=args.shared_limiter)
+    finally:
+        pipeline.finish_crawl()
+        pipeline.join()
+        stop_reporting.set()
+
+    pipeline.report()
+    print(f"Enrichment: {pipeline.counts['enriched']}")
+    print(f"Downloads: {pipeline.counts['downloaded']}")
+    if transformer is not None:
+        print(transformer.summary())
+    if validator is not None:
+        print(f"Validation: {pipeline.counts['valid']} valid, {pipeline.counts['invalid']} invalid")
+        if pipeline.counts['validate_failed']:
+            print(f"Images in failed validation batches: {pipeline.counts['validate_failed']}")
+    if pipeline.failed_stages:
+        print(f"Failed stages: {', '.join(pipeline.failed_stages)}")
+
+if __name__ == "__main__":
+    main()
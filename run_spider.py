@@ -1,13 +1,61 @@
+import argparse
 from scrapy.crawler import CrawlerProcess
 from scrapy.utils.project import get_project_settings
+from throttling import DEFAULT_LIMITER_DIR
 from car_scraper.spiders.car_spider import CarSpiderSpider
 
-def run_spider():
+def run_spider(delta=False, known_pages=None, partitioned=False, partition=None, year_ranges=None, item_queue=None,
+               shared_limiter=None):
     settings = get_project_settings()
-    settings.set('JOBDIR', 'crawls/auto_ria_job')
+    if shared_limiter:
+        # The shared bucket replaces the per-process delay and AutoThrottle
+        settings.set('SHARED_RATE_LIMIT_DIR', shared_limiter)
+        settings.set('DOWNLOAD_DELAY', 0)
+        settings.set('AUTOTHROTTLE_ENABLED', False)
+    if item_queue is not None:
+        # run_pipeline.py: CarScraperPipeline also puts every item on this queue
+        settings.set('CARS_ITEM_QUEUE', item_queue)
+    # Each partition process keeps its own resumable job state. Delta runs
+    # get none: a persisted requests.seen would filter out the pages the
+    # previous run crawled, and a delta run is short enough to just restart.
+    if not delta:
+        jobdir = 'crawls/auto_ria_job'
+        if partition:
+            jobdir += '_' + partition.replace('/', 'of')
+        elif partitioned or year_ranges:
+            jobdir += '_partitioned'
+        settings.set('JOBDIR', jobdir)
     process = CrawlerProcess(settings)
-    process.crawl(CarSpiderSpider)
+    spider_kwargs = {}
+    if delta:
+        spider_kwargs['delta'] = True
+        if known_pages is not None:
+            spider_kwargs['known_pages'] = known_pages
+    if partitioned or partition or year_ranges:
+        spider_kwargs['partitioned'] = True
+        if partition:
+            spider_kwargs['partition'] = partition
+        if year_ranges:
+            spider_kwargs['year_ranges'] = year_ranges
+    process.crawl(CarSpiderSpider, **spider_kwargs)
     process.start()
 
 if __name__ == '__main__':
-    run_spider()
+    parser = argparse.ArgumentParser(description="Run the auto.ria listing crawl.")
+    parser.add_argument('--delta', action='store_true',
+                        help="only emit new or re-priced listings and stop after consecutive known pages")
+    parser.add_argument('--known-pages', type=int, default=None,
+                        help="consecutive pages of known listings before stopping (DELTA_STOP_AFTER_KNOWN_PAGES, "
+                             "0 to never stop early)")
+    parser.add_argument('--partitioned', action='store_true',
+                        help="crawl each brand from data/car_brands.json as its own pagination chain")
+    parser.add_argument('--partition', default=None,
+                        help="only crawl partition i/N of the brands, to split the crawl across processes or hosts")
+    parser.add_argument('--year-ranges', default=None,
+                        help="further split each brand by year, e.g. 2000-2009,2010-2015,2016-2024")
+    parser.add_argument('--shared-limiter', nargs='?', const=DEFAULT_LIMITER_DIR, default=None,
+                        help=f"draw from the cross-process rate limiter in this directory (default {DEFAULT_LIMITER_DIR}) "
+                             "instead of DOWNLOAD_DELAY/AUTOTHROTTLE")
+    args = parser.parse_args()
+    run_spider(args.delta, args.known_pages, args.partitioned, args.partition, args.year_ranges,
+               shared_limiter=args.shared_limiter)
@@ -0,0 +1,43 @@
+import math
+
+import pytest
+
+from export_columnar import parse_float, parse_int
+
+@pytest.mark.parametrize('value, expected', [
+    (None, None),
+    (True, None),
+    (False, None),
+    (45000, 45000),
+    (45000.0, 45000),
+    ("45000.0", 45000),
+    ("45 000", 45000),
+    ("45,000", 45000),
+    ("45000 грн", 45000),
+    ("abc", None),
+    (math.nan, None),
+    (math.inf, None),
+    ("1e3", 1000),
+])
+def test_parse_int(value, expected):
+    assert parse_int(value) == expected
+
+@pytest.mark.parametrize('value, expected', [
+    (None, None),
+    (True, None),
+    (False, None),
+    (2, 2.0),
+    (1.6, 1.6),
+    ("1.6", 1.6),
+    ("1,6", 1.6),
+    ("1.6 л", 1.6),
+    (" 1.6 ", 1.6),
+    ("abc", None),
+    (math.nan, None),
+    (math.inf, None),
+    ("nan", None),
+    ("-inf", None),
+    ("1e3", 1000.0),
+])
+def test_parse_float(value, expected):
+    assert parse_float(value) == expected
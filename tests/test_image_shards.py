@@ -0,0 +1,53 @@
+import multiprocessing
+import os
+import signal
+import sqlite3
+import time
+
+from image_shards import INDEX_NAME, ShardReader, ShardWriter
+
+def image_bytes(car_id):
+    return f"image {car_id} ".encode() * (1 + car_id % 50)
+
+def write_forever(shard_dir):
+    writer = ShardWriter(shard_dir, max_shard_bytes=1 << 20, commit_every=10)
+    car_id = 0
+    while True:
+        writer.put(car_id, image_bytes(car_id))
+        car_id += 1
+
+def indexed_count(shard_dir):
+    try:
+        with sqlite3.connect(os.path.join(shard_dir, INDEX_NAME)) as conn:
+            return conn.execute('SELECT COUNT(*) FROM members').fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+
+def test_killed_writer_leaves_only_readable_index_entries(tmp_path):
+    shard_dir = str(tmp_path / 'shards')
+    process = multiprocessing.get_context('spawn').Process(target=write_forever, args=(shard_dir,))
+    process.start()
+    try:
+        deadline = time.time() + 60
+        # Past the first shard, and killed somewhere in the middle of a later one
+        while indexed_count(shard_dir) < 3000 and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        os.kill(process.pid, signal.SIGKILL)
+        process.join()
+    assert indexed_count(shard_dir) >= 3000
+
+    with ShardReader(shard_dir) as reader:
+        paths = list(reader.iter_paths())
+        assert len(reader.shards()) > 1
+        for path in paths:
+            car_id = int(os.path.splitext(os.path.basename(path))[0])
+            assert reader.read(path) == image_bytes(car_id)
+
+def test_reader_sees_images_appended_after_mapping(tmp_path):
+    shard_dir = str(tmp_path / 'shards')
+    with ShardWriter(shard_dir, commit_every=1) as writer, ShardReader(shard_dir) as reader:
+        writer.put(1, image_bytes(1))
+        assert [reader.read(path) for path in reader.iter_paths()] == [image_bytes(1)]
+        writer.put(2, image_bytes(2))
+        assert [reader.read(path) for path in reader.iter_paths()] == [image_bytes(1), image_bytes(2)]
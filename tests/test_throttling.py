@@ -0,0 +1,63 @@
+import threading
+import time
+
+from throttling import AdaptiveTokenBucket, SharedTokenBucket
+
+def throttle_concurrently(bucket, sent_at, count=16):
+    threads = [threading.Thread(target=bucket.on_throttle, args=(sent_at,)) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def successes_to_reach(bucket, rate, limit=1000):
+    for count in range(1, limit + 1):
+        bucket.on_success()
+        if bucket.rate >= rate:
+            return count
+    return None
+
+def test_simultaneous_throttles_halve_once():
+    bucket = AdaptiveTokenBucket(20.0, max_rate=40.0)
+    throttle_concurrently(bucket, bucket.acquire())
+    assert bucket.rate == 10.0
+
+def test_throttle_of_request_sent_before_decrease_is_ignored():
+    bucket = AdaptiveTokenBucket(20.0, max_rate=40.0, cooldown=0.0)
+    sent_at = bucket.acquire()
+    bucket.on_throttle(sent_at)
+    time.sleep(0.15)  # past the 1/rate window
+    bucket.on_throttle(sent_at)
+    assert bucket.rate == 10.0
+    bucket.on_throttle(bucket.acquire())
+    assert bucket.rate == 5.0
+
+def test_rate_recovers_within_bounded_successes():
+    bucket = AdaptiveTokenBucket(20.0, max_rate=40.0)
+    throttle_concurrently(bucket, bucket.acquire())
+    assert successes_to_reach(bucket, 20.0) <= 15
+
+    bucket = AdaptiveTokenBucket(1.0, min_rate=1.0, max_rate=40.0)
+    assert successes_to_reach(bucket, 20.0) <= 80
+
+def test_no_ceiling_when_max_rate_is_zero():
+    bucket = AdaptiveTokenBucket(2.0, max_rate=0)
+    for _ in range(100):
+        bucket.on_success()
+    assert bucket.rate > 2.0
+
+def test_shared_throttles_from_all_processes_halve_once(tmp_path):
+    buckets = [SharedTokenBucket('example.com', 20.0, max_rate=40.0, state_dir=tmp_path) for _ in range(4)]
+    sent_at = [bucket.acquire() for bucket in buckets]
+    for bucket, sent in zip(buckets, sent_at):
+        throttle_concurrently(bucket, sent, count=4)
+    assert buckets[0].rate == 10.0
+    # A later request can decrease again once the window has passed
+    bucket = SharedTokenBucket('example.com', 20.0, max_rate=40.0, cooldown=0.0, state_dir=tmp_path)
+    time.sleep(0.15)
+    bucket.on_throttle(sent_at[0])
+    assert bucket.rate == 10.0
+    bucket.on_throttle(bucket.acquire())
+    assert bucket.rate == 5.0
+    for bucket in buckets:
+        bucket.close()
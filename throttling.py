@@ -0,0 +1,220 @@
+import fcntl
+import os
+import re
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` requests per second on average with
+    bursts of up to `capacity`. A rate of 0 or less disables limiting.
+    acquire() returns the time the token was granted (time.monotonic());
+    pass it back as on_throttle's sent_at.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens=1):
+        if self.rate <= 0:
+            return time.monotonic()
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return now
+                wait_time = (tokens - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+    def close(self):
+        pass
+
+class AdaptiveTokenBucket(TokenBucket):
+    """
+    Token bucket that adapts its rate to server feedback: every success
+    raises the rate by `increase` req/s or by `growth` of the current rate,
+    whichever is more, up to max_rate (no ceiling when it is 0 or less), so
+    a halving is won back in about 15 successes at any rate. A 429/5xx
+    halves the rate down to min_rate, at most once per `cooldown` seconds
+    (or 1/rate when that is longer): one overload answers every request in
+    flight with a 429, and that is one signal, not many. Throttles of
+    requests sent before the last decrease are ignored for the same
+    reason. A rate of 0 or less stays unlimited.
+    """
+
+    def __init__(self, rate, capacity=None, min_rate=1.0, max_rate=None, increase=0.1, decrease=0.5, growth=0.05,
+                 cooldown=1.0):
+        super().__init__(rate, capacity)
+        self.min_rate = min_rate
+        self.max_rate = max_rate if max_rate is not None else rate * 4
+        self.increase = increase
+        self.decrease = decrease
+        self.growth = growth
+        self.cooldown = cooldown
+        self.last_decrease = float('-inf')
+
+    def on_success(self):
+        if self.rate <= 0:
+            return
+        with self.lock:
+            self._refill(time.monotonic())
+            self.rate += max(self.increase, self.rate * self.growth)
+            if self.max_rate > 0:
+                self.rate = min(self.max_rate, self.rate)
+
+    def on_throttle(self, sent_at=None):
+        if self.rate <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            if sent_at is not None and sent_at < self.last_decrease:
+                return
+            if now - self.last_decrease < max(self.cooldown, 1 / self.rate):
+                return
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.tokens = min(self.tokens, 0)
+            self.last_decrease = now
+
+DEFAULT_LIMITER_DIR = 'data/rate_limits'
+
+# Endpoint classes that share one request budget: listing pages and the
+# catalog API are both served by auto.ria.com, photos by the riastatic CDN
+PAGES_ENDPOINT = 'auto.ria.com'
+IMAGES_ENDPOINT = 'riastatic.com'
+
+class SharedTokenBucket:
+    """
+    AdaptiveTokenBucket whose state (rate, tokens, last refill) lives in a
+    file under state_dir guarded by an exclusive flock, so every process
+    on the host that opens the same endpoint draws from one budget and
+    slows down on 429/5xx seen by any of them. rate, capacity, min_rate
+    and max_rate seed the file when it is created or has been idle for
+    idle_reset seconds; after that the shared rate and the bounds of the
+    process that seeded it are used, so one process's narrower bounds
+    can't pull down the rate the others ramped up to. increase, growth
+    and decrease are this process's steps, as in AdaptiveTokenBucket. The
+    time of the last decrease is shared too, so concurrent 429s from all
+    processes make one decrease per cooldown window, and throttles of
+    requests sent (acquire() returns time.time()) before it are ignored.
+    A max_rate of 0 or less means no ceiling; a rate of 0 or less
+    disables limiting.
+    """
+    # rate, tokens, last refill, min_rate, max_rate, last decrease
+    STATE = struct.Struct('<6d')
+
+    def __init__(self, endpoint, rate, capacity=None, min_rate=1.0, max_rate=None, increase=0.1, decrease=0.5,
+                 growth=0.05, cooldown=1.0, state_dir=DEFAULT_LIMITER_DIR, idle_reset=300.0):
+        self.endpoint = endpoint
+        self.initial_rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate if max_rate is not None else rate * 4
+        self.increase = increase
+        self.decrease = decrease
+        self.growth = growth
+        self.cooldown = cooldown
+        self.idle_reset = idle_reset
+        # flock only excludes other processes; threads of this one take the lock first
+        self.lock = threading.Lock()
+        self.fd = None
+        if rate > 0:
+            os.makedirs(state_dir, exist_ok=True)
+            self.path = os.path.join(state_dir, re.sub(r'[^\w.-]', '_', endpoint) + '.bucket')
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    @contextmanager
+    def _state(self):
+        # Yields [rate, tokens, min_rate, max_rate, last decrease] refilled up to now and writes them back
+        with self.lock:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                data = os.pread(self.fd, self.STATE.size, 0)
+                if len(data) == self.STATE.size:
+                    rate, tokens, updated, min_rate, max_rate, last_decrease = self.STATE.unpack(data)
+                if len(data) != self.STATE.size or not 0 <= now - updated <= self.idle_reset:
+                    rate, tokens, updated = self.initial_rate, self.capacity, now
+                    min_rate, max_rate, last_decrease = self.min_rate, self.max_rate, 0.0
+                state = [rate, min(self.capacity, tokens + (now - updated) * rate), min_rate, max_rate, last_decrease]
+                yield state
+                os.pwrite(self.fd, self.STATE.pack(state[0], state[1], now, *state[2:]), 0)
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    @property
+    def rate(self):
+        if self.fd is None:
+            return 0
+        with self._state() as state:
+            return state[0]
+
+    def try_acquire(self, tokens=1):
+        """
+        Take tokens if they are available and return 0, otherwise return
+        the seconds to wait before trying again (for callers that must
+        not block, like the Scrapy middleware).
+        """
+        if self.fd is None:
+            return 0
+        with self._state() as state:
+            if state[0] <= 0 or state[1] >= tokens:
+                state[1] -= tokens
+                return 0
+            return (tokens - state[1]) / state[0]
+
+    def acquire(self, tokens=1):
+        # Returns the grant time (time.time(), the clock every process shares)
+        while True:
+            wait_time = self.try_acquire(tokens)
+            if not wait_time:
+                return time.time()
+            time.sleep(wait_time)
+
+    def on_success(self):
+        if self.fd is None:
+            return
+        with self._state() as state:
+            state[0] += max(self.increase, state[0] * self.growth)
+            if state[3] > 0:
+                state[0] = min(state[3], state[0])
+
+    def on_throttle(self, sent_at=None):
+        if self.fd is None:
+            return
+        with self._state() as state:
+            now = time.time()
+            if sent_at is not None and sent_at < state[4]:
+                return
+            if state[0] > 0 and now - state[4] < max(self.cooldown, 1 / state[0]):
+                return
+            state[0] = max(state[2], state[0] * self.decrease)
+            state[1] = min(state[1], 0)
+            state[4] = now
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+def open_bucket(endpoint, rate, capacity=None, min_rate=1.0, max_rate=None, shared_dir=None):
+    """
+    The rate limiter for one endpoint class: a SharedTokenBucket in
+    shared_dir when it is set, otherwise an AdaptiveTokenBucket private
+    to this process.
+    """
+    if shared_dir:
+        return SharedTokenBucket(endpoint, rate, capacity, min_rate, max_rate, state_dir=shared_dir)
+    return AdaptiveTokenBucket(rate, capacity, min_rate, max_rate)
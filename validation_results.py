@@ -0,0 +1,268 @@
+import argparse
+import hashlib
+import os
+import shutil
+import sqlite3
+import time
+
+DEFAULT_RESULTS_DB = 'data/validation_results.sqlite3'
+
+def car_id_from_path(image_path):
+    return os.path.splitext(os.path.basename(image_path))[0]
+
+def image_key(image_path, mode='stat'):
+    """
+    Identity of an image's content: 'stat' is size + mtime (no reads),
+    'hash' the sha256 of the file.
+    """
+    if mode == 'hash':
+        digest = hashlib.sha256()
+        with open(image_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return f"sha256:{digest.hexdigest()}"
+    stat = os.stat(image_path)
+    return f"stat:{stat.st_size}:{stat.st_mtime_ns}"
+
+def iter_image_keys(image_paths, key_mode='stat', key_func=image_key):
+    """
+    (image_path, image_key) for each image, skipping images removed since
+    they were listed (e.g. by a concurrent export or cleanup).
+    """
+    for path in image_paths:
+        try:
+            yield path, key_func(path, key_mode)
+        except FileNotFoundError:
+            print(f"Skipping missing image {path}")
+
+class ResultsStore:
+    """
+    SQLite store of validator verdicts keyed by car ID and model. Confidence
+    and class are kept next to the verdict, so resetting or changing the
+    threshold is an UPDATE/DELETE instead of moving files around. Queries
+    without a model use each car's most recent verdict.
+    """
+
+    def __init__(self, path=DEFAULT_RESULTS_DB, commit_every=200):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.commit_every = commit_every
+        self.pending = 0
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS verdicts (
+                car_id TEXT NOT NULL,
+                image_path TEXT NOT NULL,
+                is_valid INTEGER NOT NULL,
+                class_id INTEGER,
+                class_name TEXT,
+                confidence REAL,
+                model TEXT NOT NULL,
+                model_version TEXT,
+                threshold REAL NOT NULL,
+                validated_at REAL NOT NULL,
+                image_key TEXT,
+                PRIMARY KEY (car_id, model)
+            )
+        ''')
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(verdicts)')}
+        if 'image_key' not in columns:
+            self.conn.execute('ALTER TABLE verdicts ADD COLUMN image_key TEXT')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS verdicts_model ON verdicts (model, is_valid)')
+        self.conn.commit()
+
+    def record(self, image_path, is_valid, class_id, class_name, confidence, model, model_version, threshold,
+               image_key=None, car_id=None):
+        self.conn.execute(
+            '''INSERT OR REPLACE INTO verdicts
+               (car_id, image_path, is_valid, class_id, class_name, confidence, model, model_version, threshold,
+                validated_at, image_key)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            (car_id or car_id_from_path(image_path), image_path, int(is_valid), class_id, class_name, confidence,
+             model, model_version, threshold, time.time(), image_key))
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.commit()
+
+    def get(self, car_id, model=None):
+        query = 'SELECT * FROM verdicts WHERE car_id = ?'
+        params = (str(car_id),)
+        if model:
+            query += ' AND model = ?'
+            params += (model,)
+        cursor = self.conn.execute(query + ' ORDER BY validated_at DESC LIMIT 1', params)
+        row = cursor.fetchone()
+        return dict(zip((column[0] for column in cursor.description), row)) if row else None
+
+    def scored_keys(self, car_ids, model, chunk_size=500):
+        """
+        {car_id: (image_key, model_version, threshold)} for the given cars'
+        verdicts from `model`.
+        """
+        scored = {}
+        car_ids = list(car_ids)
+        for i in range(0, len(car_ids), chunk_size):
+            chunk = car_ids[i:i + chunk_size]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.conn.execute(
+                f'''SELECT car_id, image_key, model_version, threshold FROM verdicts
+                    WHERE model = ? AND car_id IN ({placeholders})''', (model, *chunk))
+            scored.update((car_id, rest) for car_id, *rest in rows)
+        return scored
+
+    def iter_verdicts(self, model=None):
+        if model:
+            return self.conn.execute('SELECT car_id, image_path, is_valid FROM verdicts WHERE model = ?', (model,))
+        # SQLite takes the bare columns from the row holding MAX(validated_at)
+        return self.conn.execute(
+            'SELECT car_id, image_path, is_valid, MAX(validated_at) FROM verdicts GROUP BY car_id')
+
+    def counts(self, model=None):
+        valid = invalid = 0
+        for row in self.iter_verdicts(model):
+            if row[2]:
+                valid += 1
+            else:
+                invalid += 1
+        return valid, invalid
+
+    def rethreshold(self, model, threshold, car_class_ids):
+        """
+        Re-derive is_valid for a model's verdicts from the stored class and
+        confidence. Returns the number of rows updated.
+        """
+        placeholders = ','.join('?' * len(car_class_ids))
+        cursor = self.conn.execute(
+            f'''UPDATE verdicts SET threshold = ?,
+                    is_valid = (class_id IN ({placeholders}) AND confidence > ?)
+                WHERE model = ?''',
+            (threshold, *car_class_ids, threshold, model))
+        self.commit()
+        return cursor.rowcount
+
+    def clear(self, model=None):
+        if model:
+            cursor = self.conn.execute('DELETE FROM verdicts WHERE model = ?', (model,))
+        else:
+            cursor = self.conn.execute('DELETE FROM verdicts')
+        self.commit()
+        return cursor.rowcount
+
+    def commit(self):
+        self.conn.commit()
+        self.pending = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def filter_unscored(image_paths, store, model, model_version, threshold, key_mode='stat', chunk_size=500,
+                    car_ids=None, key_func=image_key):
+    """
+    Split image_paths into images that still need inference and a count of
+    images already scored by the same weights and threshold with an
+    unchanged image key. Returns ([(image_path, image_key), ...], skipped).
+    car_ids maps shared (content store) images to every car ID using them;
+    such an image is only skipped when all of them are scored. key_func
+    computes the image key (ShardReader.image_key for packed images).
+    """
+    pending = []
+    skipped = 0
+    image_paths = list(image_paths)
+
+    def ids_for(path):
+        return car_ids[path] if car_ids is not None else [car_id_from_path(path)]
+
+    for i in range(0, len(image_paths), chunk_size):
+        chunk = list(iter_image_keys(image_paths[i:i + chunk_size], key_mode, key_func))
+        scored = store.scored_keys((car_id for path, _ in chunk for car_id in ids_for(path)), model)
+        for path, key in chunk:
+            if all(scored.get(car_id) is not None and list(scored[car_id]) == [key, model_version, threshold]
+                   for car_id in ids_for(path)):
+                skipped += 1
+            else:
+                pending.append((path, key))
+    return pending, skipped
+
+def print_counts(valid, invalid, incremental=False, results_db=DEFAULT_RESULTS_DB, model=None):
+    """
+    End-of-run report for the validators. An incremental run only scores
+    new or changed images, so its counts are labelled as such and followed
+    by the model's totals in the results store.
+    """
+    label = " (newly scored)" if incremental else ""
+    print("Validation complete.")
+    print(f"Valid images{label}: {valid}")
+    print(f"Invalid images{label}: {invalid}")
+    if incremental:
+        with ResultsStore(results_db) as store:
+            valid, invalid = store.counts(model)
+        print(f"All verdicts from {model}: {valid} valid, {invalid} invalid")
+
+def export_verdicts(store, root_dir='data/pictures', valid_dir='data/valid_pictures',
+                    invalid_dir='data/invalid_pictures', model=None, copy=False):
+    """
+    Optional physical sort: move (or copy) every image with a verdict into
+    valid_dir/invalid_dir, keeping the xx/yy/zz structure.
+    """
+    exported = 0
+    missing = 0
+    for car_id, image_path, is_valid, *_ in store.iter_verdicts(model).fetchall():
+        if not os.path.exists(image_path):
+            missing += 1
+            continue
+        rel_path = os.path.relpath(image_path, root_dir)
+        new_path = os.path.join(valid_dir if is_valid else invalid_dir, rel_path)
+        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+        if copy:
+            shutil.copy2(image_path, new_path)
+        else:
+            shutil.move(image_path, new_path)
+        exported += 1
+    return exported, missing
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and export stored image validation verdicts.")
+    parser.add_argument('--results-db', default=DEFAULT_RESULTS_DB)
+    parser.add_argument('--model', default=None, help="only verdicts from this model (weights file name)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('summary', help="print valid/invalid counts")
+    export_parser = subparsers.add_parser('export', help="sort images into valid/invalid directories")
+    export_parser.add_argument('--root-dir', default='data/pictures')
+    export_parser.add_argument('--valid-dir', default='data/valid_pictures')
+    export_parser.add_argument('--invalid-dir', default='data/invalid_pictures')
+    export_parser.add_argument('--copy', action='store_true', help="copy instead of moving")
+    rethreshold_parser = subparsers.add_parser('rethreshold', help="re-derive verdicts for a new threshold")
+    rethreshold_parser.add_argument('--threshold', type=float, required=True)
+    rethreshold_parser.add_argument('--car-classes', required=True,
+                                    help="comma-separated class ids that count as a car, e.g. 2 for the COCO detector")
+    args = parser.parse_args()
+
+    with ResultsStore(args.results_db) as store:
+        if args.command == 'summary':
+            valid, invalid = store.counts(args.model)
+            print(f"Valid images: {valid}")
+            print(f"Invalid images: {invalid}")
+        elif args.command == 'export':
+            exported, missing = export_verdicts(store, args.root_dir, args.valid_dir, args.invalid_dir,
+                                                args.model, args.copy)
+            print(f"Exported {exported} images, {missing} missing on disk.")
+        elif args.command == 'rethreshold':
+            if not args.model:
+                parser.error("rethreshold needs --model")
+            car_class_ids = [int(class_id) for class_id in args.car_classes.split(',')]
+            updated = store.rethreshold(args.model, args.threshold, car_class_ids)
+            print(f"Updated {updated} verdicts for {args.model} at threshold {args.threshold}")
+
+if __name__ == "__main__":
+    main()